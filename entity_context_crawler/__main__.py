@@ -3,7 +3,8 @@ import sys
 from argparse import ArgumentParser, HelpFormatter
 from typing import List
 
-from entity_context_crawler.cmd import build_contexts_db, build_matches_db
+from entity_context_crawler.cmd import build_contexts_db, build_matches_db, compile_entities, index_wiki, \
+    merge_matches_db, preprocess_wiki
 
 
 def main(argv: List[str] = None) -> int:
@@ -31,6 +32,39 @@ def main(argv: List[str] = None) -> int:
     common_parser.add_argument('--random-seed', dest='random_seed', metavar='STR',
                                help='Use together with PYTHONHASHSEED for reproducibility')
 
+    #
+    # Add compile-entities sub command
+    #
+
+    compile_entities_parser = sub_parsers.add_parser(
+        'compile-entities', formatter_class=get_formatter, parents=[common_parser],
+        description='Compile the Freebase JSON into an entity index for fast startup')
+
+    compile_entities.add_parser_args(compile_entities_parser)
+    compile_entities_parser.set_defaults(func=compile_entities.run)
+
+    #
+    # Add index-wiki sub command
+    #
+
+    index_wiki_parser = sub_parsers.add_parser(
+        'index-wiki', formatter_class=get_formatter, parents=[common_parser],
+        description='Index the Wikipedia pages by byte offset for random access')
+
+    index_wiki.add_parser_args(index_wiki_parser)
+    index_wiki_parser.set_defaults(func=index_wiki.run)
+
+    #
+    # Add preprocess-wiki sub command
+    #
+
+    preprocess_wiki_parser = sub_parsers.add_parser(
+        'preprocess-wiki', formatter_class=get_formatter, parents=[common_parser],
+        description='Parse and clean up the Wikipedia pages once for multiple entity sets')
+
+    preprocess_wiki.add_parser_args(preprocess_wiki_parser)
+    preprocess_wiki_parser.set_defaults(func=preprocess_wiki.run)
+
     #
     # Add build-matches-db sub command
     #
@@ -42,6 +76,17 @@ def main(argv: List[str] = None) -> int:
     build_matches_db.add_parser_args(build_matches_db_parser)
     build_matches_db_parser.set_defaults(func=build_matches_db.run)
 
+    #
+    # Add merge-matches-db sub command
+    #
+
+    merge_matches_db_parser = sub_parsers.add_parser(
+        'merge-matches-db', formatter_class=get_formatter, parents=[common_parser],
+        description='Merge matches DBs built for separate shards')
+
+    merge_matches_db.add_parser_args(merge_matches_db_parser)
+    merge_matches_db_parser.set_defaults(func=merge_matches_db.run)
+
     #
     # Add build-contexts-db sub command
     #
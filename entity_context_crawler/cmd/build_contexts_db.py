@@ -1,23 +1,31 @@
 import csv
-import json
 import os
 import random
 import sqlite3
+import time
 from argparse import ArgumentParser, Namespace
+from dataclasses import dataclass
+from itertools import chain
+from multiprocessing import Pool
 from os import remove
-from os.path import isfile
-from typing import List, Tuple, Dict
+from os.path import abspath, isfile
+from typing import Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+from urllib.request import pathname2url
 
-import spacy
-from spacy.lang.en import English
 from spacy.language import Language
 from spacy.matcher import PhraseMatcher
 from spacy.tokens import Doc
 
 from entity_context_crawler.dao.contexts_db import create_contexts_table, insert_contexts, Context
-from entity_context_crawler.dao.matches_db import select_contexts, select_entity_mentions
+from entity_context_crawler.dao.entity_index import Entity, EntityIndex, is_entity_index, load_entities
+from entity_context_crawler.dao.matches_db import select_entity_mentions, select_window_storage, \
+    sample_match_rowids, select_contexts_by_rowids, PageTextCache
 from entity_context_crawler.dao.mid2rid_txt import load_mid2rid
-from entity_context_crawler.util.log import log, log_start, log_end
+from entity_context_crawler.util.batching import iter_batches
+from entity_context_crawler.util.log import log
+from entity_context_crawler.util.nlp import NLP_PROFILES, load_nlp, has_sents, pipe
+from entity_context_crawler.util.profiling import has_profiles, profile, remove_profiles, start_process_profile, \
+    write_profile_report
 
 
 def add_parser_args(parser: ArgumentParser):
@@ -27,19 +35,28 @@ def add_parser_args(parser: ArgumentParser):
         mid2rid-txt
         matches-db
         contexts-db
+        --commit-entities
         --context-size
         --crop-sentences
         --csv-file
+        --entity-batch-size
         --limit-contexts
         --limit-entities
+        --nlp-batch-size
         --overwrite
+        --page-cache-mb
+        --profile
+        --spacy-model
+        --spacy-profile
+        --workers
     """
 
     parser.add_argument('freebase_json', metavar='freebase-json',
-                        help='Path to (input) Freebase JSON')
+                        help='Path to (input) Freebase JSON or entity index built by `ecc compile-entities`')
 
     parser.add_argument('mid2rid_txt', metavar='mid2rid-txt',
-                        help='Path to (input) mid2rid TXT')
+                        help='Path to (input) mid2rid TXT or entity index built by `ecc compile-entities`'
+                             ' with --mid2rid-txt')
 
     parser.add_argument('matches_db', metavar='matches-db',
                         help='Path to (input) matches DB')
@@ -47,6 +64,11 @@ def add_parser_args(parser: ArgumentParser):
     parser.add_argument('contexts_db', metavar='contexts-db',
                         help='Path to (output) contexts DB')
 
+    default_commit_entities = 100
+    parser.add_argument('--commit-entities', dest='commit_entities', type=int, metavar='INT',
+                        default=default_commit_entities,
+                        help='Commit contexts DB after ... entities (default: {})'.format(default_commit_entities))
+
     default_context_size = 100
     parser.add_argument('--context-size', dest='context_size', type=int, metavar='INT', default=default_context_size,
                         help='Consider ... chars on each side of the entity mention'
@@ -60,6 +82,12 @@ def add_parser_args(parser: ArgumentParser):
     parser.add_argument('--csv-file', dest='csv_file', metavar='STR', default=default_csv_file,
                         help='Log context stats to CSV file at path ... (default: {})'.format(default_csv_file))
 
+    default_entity_batch_size = 16
+    parser.add_argument('--entity-batch-size', dest='entity_batch_size', type=int, metavar='INT',
+                        default=default_entity_batch_size,
+                        help='Read the contexts of ... entities at once, so that each page is read once per batch'
+                             ' (default: {})'.format(default_entity_batch_size))
+
     default_limit_contexts = None
     parser.add_argument('--limit-contexts', dest='limit_contexts', type=int, metavar='INT',
                         default=default_limit_contexts,
@@ -70,9 +98,44 @@ def add_parser_args(parser: ArgumentParser):
                         default=default_limit_entities,
                         help='Early stop after ... entities (default: {})'.format(default_limit_entities))
 
+    default_nlp_batch_size = 256
+    parser.add_argument('--nlp-batch-size', dest='nlp_batch_size', type=int, metavar='INT',
+                        default=default_nlp_batch_size,
+                        help='Number of contexts the spaCy pipeline processes at once, 1 = one context'
+                             ' at a time (default: {})'.format(default_nlp_batch_size))
+
     parser.add_argument('--overwrite', dest='overwrite', action='store_true',
                         help='Overwrite contexts DB and CSV file if they already exist')
 
+    default_page_cache_mb = 256.0
+    parser.add_argument('--page-cache-mb', dest='page_cache_mb', type=float, metavar='FLOAT',
+                        default=default_page_cache_mb,
+                        help='Keep the most recently read page texts of up to ... MB (approx.) per worker, e.g.'
+                             ' hub pages that many entities are mentioned on'
+                             ' (default: {})'.format(default_page_cache_mb))
+
+    default_profile = None
+    parser.add_argument('--profile', dest='profile_dir', metavar='STR', default=default_profile,
+                        help='Profile with cProfile, dump the stats to directory ... and write a report with the top'
+                             ' functions (default: {})'.format(default_profile))
+
+    default_spacy_model = 'en_core_web_lg'
+    parser.add_argument('--spacy-model', dest='spacy_model', metavar='STR', default=default_spacy_model,
+                        help='Name of installed spaCy model or path to spaCy model directory'
+                             ' (default: {})'.format(default_spacy_model))
+
+    default_spacy_profile = 'full'
+    parser.add_argument('--spacy-profile', dest='spacy_profile', choices=list(NLP_PROFILES),
+                        default=default_spacy_profile,
+                        help='spaCy components to load, --crop-sentences requires sentence boundaries,'
+                             ' i.e. not tokenizer-only (default: {})'.format(default_spacy_profile))
+
+    default_workers = 1
+    parser.add_argument('--workers', dest='workers', type=int, metavar='INT', default=default_workers,
+                        help='Number of worker processes, each with its own spaCy model and read-only connection'
+                             ' to the matches DB, 1 = process the entities in the main process'
+                             ' (default: {})'.format(default_workers))
+
 
 def run(args: Namespace):
     """
@@ -86,13 +149,21 @@ def run(args: Namespace):
     matches_db = args.matches_db
     contexts_db = args.contexts_db
 
+    commit_entities = args.commit_entities
     context_size = args.context_size
     crop_sentences = args.crop_sentences
     csv_file = args.csv_file
+    entity_batch_size = args.entity_batch_size
     limit_contexts = args.limit_contexts
     limit_entities = args.limit_entities
+    nlp_batch_size = args.nlp_batch_size
     overwrite = args.overwrite
+    page_cache_mb = args.page_cache_mb
+    profile_dir = args.profile_dir
     random_seed = args.random_seed
+    spacy_model = args.spacy_model
+    spacy_profile = args.spacy_profile
+    workers = args.workers
 
     python_hash_seed = os.getenv('PYTHONHASHSEED')
 
@@ -106,13 +177,21 @@ def run(args: Namespace):
     print('    {:20} {}'.format('matches-db', matches_db))
     print('    {:20} {}'.format('contexts_db', contexts_db))
     print()
+    print('    {:20} {}'.format('--commit-entities', commit_entities))
     print('    {:20} {}'.format('--context-size', context_size))
     print('    {:20} {}'.format('--crop-sentences', crop_sentences))
     print('    {:20} {}'.format('--csv-file', csv_file))
+    print('    {:20} {}'.format('--entity-batch-size', entity_batch_size))
     print('    {:20} {}'.format('--limit-contexts', limit_contexts))
     print('    {:20} {}'.format('--limit-entities', limit_entities))
+    print('    {:20} {}'.format('--nlp-batch-size', nlp_batch_size))
     print('    {:20} {}'.format('--overwrite', overwrite))
+    print('    {:20} {}'.format('--page-cache-mb', page_cache_mb))
+    print('    {:20} {}'.format('--profile', profile_dir))
     print('    {:20} {}'.format('--random-seed', random_seed))
+    print('    {:20} {}'.format('--spacy-model', spacy_model))
+    print('    {:20} {}'.format('--spacy-profile', spacy_profile))
+    print('    {:20} {}'.format('--workers', workers))
     print()
     print('    {:20} {}'.format('PYTHONHASHSEED', python_hash_seed))
     print()
@@ -122,17 +201,37 @@ def run(args: Namespace):
     #
 
     if not isfile(freebase_json):
-        print('Freebase JSON not found')
+        print('Freebase JSON / entity index not found')
         exit()
 
     if not isfile(mid2rid_txt):
-        print('mid2rid TXT not found')
+        print('mid2rid TXT / entity index not found')
         exit()
 
     if not isfile(matches_db):
         print('Matches DB not found')
         exit()
 
+    with sqlite3.connect(matches_db) as matches_conn:
+        max_context_size = select_window_storage(matches_conn)
+
+    if max_context_size is not None and context_size > max_context_size:
+        print('The matches DB only stores the windows of {} chars around the matches (see `ecc build-matches-db'
+              ' --store-windows`), --context-size must not exceed it'.format(max_context_size))
+        exit()
+
+    if workers < 1:
+        print('--workers must be at least 1')
+        exit()
+
+    if entity_batch_size < 1:
+        print('--entity-batch-size must be at least 1')
+        exit()
+
+    if crop_sentences and not has_sents(spacy_profile):
+        print('--crop-sentences requires a --spacy-profile that sets sentence boundaries')
+        exit()
+
     if isfile(contexts_db):
         if overwrite:
             remove(contexts_db)
@@ -140,6 +239,13 @@ def run(args: Namespace):
             print('Contexts DB already exists, use --overwrite to overwrite it')
             exit()
 
+    if profile_dir and os.path.isdir(profile_dir) and has_profiles(profile_dir):
+        if overwrite:
+            remove_profiles(profile_dir)
+        else:
+            print('Profile directory already contains profiles, use --overwrite to overwrite them')
+            exit()
+
     if isfile(csv_file):
         if overwrite:
             remove(csv_file)
@@ -151,109 +257,283 @@ def run(args: Namespace):
     # Run actual program
     #
 
-    _build_contexts_db(freebase_json, mid2rid_txt, matches_db, contexts_db, context_size, crop_sentences, csv_file,
-                       limit_contexts, limit_entities)
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+    entity_config = EntityConfig(context_size, crop_sentences, limit_contexts, nlp_batch_size)
+
+    with profile(profile_dir, 'main'):
+        _build_contexts_db(freebase_json, mid2rid_txt, matches_db, contexts_db, entity_config, csv_file,
+                           limit_entities, spacy_model, spacy_profile, workers, commit_entities, entity_batch_size,
+                           int(page_cache_mb * 1e6), profile_dir)
 
+    if profile_dir:
+        log('Profile report | {}'.format(write_profile_report(profile_dir)))
 
-def _build_contexts_db(freebase_json: str, mid2rid_txt: str, matches_db: str, contexts_db: str, context_size: int,
-                       crop_sentences: bool, csv_file: str, limit_contexts: int, limit_entities: int):
+
+@dataclass
+class EntityConfig:
+    """
+    Options that determine how the contexts of an entity are selected, cropped and masked
     """
-    - Load Freebase JSON
-    - Load spaCy model
+
+    context_size: int
+    crop_sentences: bool
+    limit_contexts: Optional[int]
+    nlp_batch_size: int
+
+
+@dataclass
+class EntityTask:
+    entity_count: int   # Position of the entity within the shuffled entities
+    mid: str
+    rid: int
+    label: str
+    seed: int           # Seeds the entity's own RNG, see iter_entity_tasks()
+
+
+@dataclass
+class EntityResult:
+    task: EntityTask
+    db_contexts: List[Context]
+    sampled_context_count: int  # Number of sampled contexts, before cropping and masking
+    context_count: int          # Number of the entity's matches in the matches DB
+
+
+def _build_contexts_db(freebase_json: str, mid2rid_txt: str, matches_db: str, contexts_db: str,
+                       entity_config: EntityConfig, csv_file: str, limit_entities: int, spacy_model: str,
+                       spacy_profile: str, workers: int, commit_entities: int, entity_batch_size: int,
+                       page_cache_chars: int, profile_dir: Optional[str]):
+    """
+    - Load Freebase JSON (or entity index)
+    - Load mid2rid TXT (or entity index)
     - Create contexts DB
-    - For each entity in matches DB
-        - Query contexts
-        - Shuffle and limit contexts
-        - Crop to token/sentence boundary
-        - Persist masked contexts
+    - Shuffle entities and draw a seed per entity
+    - For each batch of 'entity_batch_size' entities, in a worker process (see _process_entities)
+        - Sample each entity's matches
+        - Query the contexts of all sampled matches, reading each page once
+        - For each entity in the batch (see _process_entity)
+            - Crop to token/sentence boundary
+            - Mask contexts
+    - In the main process, in the order of the shuffled entities
+        - Persist masked contexts, commit every 'commit_entities' entities
         - Log progress
-    """
 
-    with sqlite3.connect(matches_db) as matches_conn, \
-            sqlite3.connect(contexts_db) as contexts_conn:
+    As each entity is processed with its own seeded RNG and the results are persisted in order,
+    the contexts DB is the same for any number of workers (given --random-seed).
+    """
 
-        log('Load Freebase JSON')
-        with open(freebase_json, 'r', encoding='utf-8') as f:
-            freebase_data: Dict[str, Dict] = json.load(f)
+    with sqlite3.connect(contexts_db) as contexts_conn:
 
-        log('Load mid2rid TXT')
-        mid2rid: Dict[str, int] = load_mid2rid(mid2rid_txt)
+        entities: Sequence[Entity]
+        if is_entity_index(freebase_json):
+            log('Load entity index')
+            entities = EntityIndex(freebase_json).entities
+        else:
+            log('Load Freebase JSON')
+            entities = load_entities(freebase_json)
 
-        log('Load spaCy model')
-        nlp: English = spacy.load('en_core_web_lg')
-        log()
+        mid2rid: Mapping[str, int]
+        if is_entity_index(mid2rid_txt):
+            log('Load mid2rid from entity index')
+            mid2rid = EntityIndex(mid2rid_txt).mid_to_rid
+        else:
+            log('Load mid2rid TXT')
+            mid2rid = load_mid2rid(mid2rid_txt)
 
         create_contexts_table(contexts_conn)
 
-        freebase_items = list(freebase_data.items())
-        random.shuffle(freebase_items)
-        for entity_count, freebase_item in enumerate(freebase_items):
-            mid, entity_data = freebase_item
+        entity_tasks = iter_entity_tasks(entities, mid2rid, limit_entities, random)
+        entity_task_batches = iter_batches(entity_tasks, entity_batch_size)
 
-            if mid not in mid2rid:
-                continue
+        init_args = (matches_db, spacy_model, spacy_profile, entity_config, page_cache_chars)
 
-            # Early stop after ... entities
-            if limit_entities and entity_count == limit_entities:
-                break
+        if workers == 1:
+            log('Load spaCy model')
+            _init_worker(*init_args)
+            log()
 
-            entity_label = entity_data['label']
-            wiki_url = entity_data['wikipedia']
+            entity_results = chain.from_iterable(map(_process_entities, entity_task_batches))
+            _persist_entity_results(entity_results, contexts_conn, csv_file, commit_entities)
 
-            if not wiki_url:
-                continue
+        else:
+            log('Start {} workers'.format(workers))
+            log()
+
+            with Pool(workers, initializer=_init_worker, initargs=init_args + (profile_dir,)) as pool:
+                # imap() keeps the order of the entities, while the workers process them in parallel
+                entity_results = chain.from_iterable(pool.imap(_process_entities, entity_task_batches))
+                _persist_entity_results(entity_results, contexts_conn, csv_file, commit_entities)
 
-            # Log progress (start)
-            log_start('{:,} | {}'.format(entity_count, entity_label))
+                # Let the workers exit normally, so that they dump their profiles, see start_process_profile()
+                pool.close()
+                pool.join()
 
-            # Sample contexts
-            all_context_rows = select_contexts(matches_conn, mid, context_size)
-            random.shuffle(all_context_rows)
-            some_context_rows = all_context_rows[:limit_contexts]
 
-            # Build entity PhraseMatcher
-            entity_mentions = select_entity_mentions(matches_conn, mid)
-            entity_patterns = list({entity_label} | set(entity_mentions))
-            entity_matcher = PhraseMatcher(nlp.vocab)
-            entity_matcher.add('', None, *list(nlp.pipe(entity_patterns)))
+def iter_entity_tasks(entities: Sequence[Entity], mid2rid: Mapping[str, int], limit_entities: Optional[int],
+                      rng: random.Random) -> Iterator[EntityTask]:
+    """
+    Shuffle the entities and skip those without RID or Wikipedia page. All random numbers are
+    drawn from the given RNG here, in the order of the shuffled entities, so that they do not
+    depend on the order in which the workers process the entities.
 
-            # Crop and mask contexts
-            cropped_context_rows = crop_contexts(nlp, some_context_rows, crop_sentences, entity_matcher)
-            masked_context_rows = mask_contexts(nlp, cropped_context_rows, entity_matcher)
+    :return: Yield a task with its own seed for each entity to be processed
+    """
+
+    # Shuffle the entity IDs instead of the entities, which gives the same order
+    entity_ids = list(range(len(entities)))
+    rng.shuffle(entity_ids)
+
+    for entity_count, entity_id in enumerate(entity_ids):
+        entity = entities[entity_id]
+        mid = entity.mid
+
+        if mid not in mid2rid:
+            continue
 
-            # Persist contexts
-            db_contexts = [Context(mid2rid[mid], entity_label, mention, page_title, unmasked_context, masked_context)
-                           for masked_context, unmasked_context, page_title, mention in masked_context_rows]
-            insert_contexts(contexts_conn, db_contexts)
+        # Early stop after ... entities
+        if limit_entities and entity_count == limit_entities:
+            break
+
+        if entity.page_title is None:
+            continue
+
+        yield EntityTask(entity_count, mid, mid2rid[mid], entity.label, rng.getrandbits(64))
+
+
+def _persist_entity_results(entity_results: Iterable[EntityResult], contexts_conn: sqlite3.Connection,
+                            csv_file: Optional[str], commit_entities: int):
+
+    start_time = time.time()
+    context_count = 0
+
+    for entity_index, entity_result in enumerate(entity_results):
+        task = entity_result.task
+
+        insert_contexts(contexts_conn, entity_result.db_contexts)
+        context_count += len(entity_result.db_contexts)
+
+        if (entity_index + 1) % commit_entities == 0:
             contexts_conn.commit()
 
-            # Log progress (end)
-            log_end(' | {:,}/{:,} contexts'.format(len(some_context_rows), len(all_context_rows)))
+        log('{:,} | {} | {:,}/{:,} contexts'.format(task.entity_count, task.label,
+                                                    entity_result.sampled_context_count, entity_result.context_count))
+
+        # Persist stats
+        if csv_file:
+            with open(csv_file, 'a', encoding='utf-8', newline='') as csv_fh:
+                csv.writer(csv_fh).writerow([task.label, entity_result.context_count])
+
+    contexts_conn.commit()
+
+    elapsed = time.time() - start_time
+    log()
+    log('{:,} contexts | {:.1f} s | {:,.1f} contexts/s'.format(context_count, elapsed,
+                                                               context_count / elapsed if elapsed else 0))
+
+
+worker_globals: Tuple = ()
+
+
+def _init_worker(matches_db: str, spacy_model: str, spacy_profile: str, entity_config: EntityConfig,
+                 page_cache_chars: int, profile_dir: Optional[str] = None):
+    """
+    :param page_cache_chars: Size of the worker's page text cache, see --page-cache-mb
+    :param profile_dir: If given, profile the worker until it exits, see --profile
+    """
+
+    global worker_globals
+
+    if profile_dir:
+        start_process_profile(profile_dir, 'worker')
+
+    # Each worker reads the matches DB via its own read-only connection
+    matches_conn = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(abspath(matches_db))), uri=True)
+
+    nlp = load_nlp(spacy_model, spacy_profile)
 
-            # Persist stats
-            if csv_file:
-                with open(csv_file, 'a', encoding='utf-8', newline='') as csv_fh:
-                    csv.writer(csv_fh).writerow([entity_label, len(all_context_rows)])
+    worker_globals = (matches_conn, nlp, entity_config, PageTextCache(page_cache_chars))
+
+
+def _process_entities(tasks: List[EntityTask]) -> List[EntityResult]:
+    """
+    Sample the matches of a batch of entities, each with the entity's own RNG, and read the
+    sampled matches' contexts of all entities at once, so that a page that several entities
+    are mentioned on is read only once (or not at all, if it is still in the page cache)
+    """
+
+    matches_conn, nlp, entity_config, page_cache = worker_globals
+
+    entity_match_rowids = []
+    match_counts = []
+    for task in tasks:
+        match_rowids, match_count = sample_match_rowids(matches_conn, task.mid, entity_config.limit_contexts,
+                                                        random.Random(task.seed))
+        entity_match_rowids.append(match_rowids)
+        match_counts.append(match_count)
+
+    all_match_rowids = [rowid for match_rowids in entity_match_rowids for rowid in match_rowids]
+    rowid_to_context_row = select_contexts_by_rowids(matches_conn, all_match_rowids, entity_config.context_size,
+                                                     page_cache)
+
+    entity_results = []
+    for task, match_rowids, match_count in zip(tasks, entity_match_rowids, match_counts):
+        some_context_rows = [rowid_to_context_row[rowid] for rowid in match_rowids if rowid in rowid_to_context_row]
+        entity_results.append(_process_entity(task, some_context_rows, match_count))
+
+    return entity_results
+
+
+def _process_entity(task: EntityTask, some_context_rows: List[Tuple[str, str, str]], match_count: int) \
+        -> EntityResult:
+    """
+    Crop and mask the sampled contexts of an entity
+
+    :param some_context_rows: [(context, page_title, mention)] of the sampled matches
+    :param match_count: Number of the entity's matches
+    """
+
+    matches_conn, nlp, entity_config, _ = worker_globals
+
+    # Build entity PhraseMatcher
+    entity_mentions = select_entity_mentions(matches_conn, task.mid)
+    entity_patterns = list({task.label} | set(entity_mentions))
+    entity_matcher = PhraseMatcher(nlp.vocab)
+    entity_matcher.add('', None, *list(nlp.pipe(sorted(entity_patterns))))
+
+    # Crop and mask contexts
+    cropped_context_rows = crop_contexts(nlp, some_context_rows, entity_config.crop_sentences, entity_matcher,
+                                         entity_config.nlp_batch_size)
+    masked_context_rows = mask_contexts(nlp, cropped_context_rows, entity_matcher)
+
+    db_contexts = [Context(task.rid, task.label, mention, page_title, unmasked_context, masked_context)
+                   for masked_context, unmasked_context, page_title, mention in masked_context_rows]
+
+    return EntityResult(task, db_contexts, len(some_context_rows), match_count)
 
 
 def crop_contexts(
         nlp: Language,
         ragged_context_rows: List[Tuple[str, str, str]],
         crop_sentences: bool,
-        entity_matcher: PhraseMatcher
+        entity_matcher: PhraseMatcher,
+        batch_size: int = 1
 ) -> List[Tuple[str, str, str]]:
     """
     Crop each context to the next token/sentence boundary and filter out sentences
     without any matches. Might yield less contexts than given as contexts are dropped
     if cropped to the empty string.
 
+    The contexts are processed by the spaCy pipeline in batches of 'batch_size' contexts.
+
     :param ragged_context_rows [(ragged_context, page_title, mention)]
     :return [(cropped_context, page_title, mention)]
     """
 
+    context_docs = pipe(nlp, (ragged_context for ragged_context, _, _ in ragged_context_rows), batch_size)
+
     cropped_context_rows = []
-    for ragged_context, page_title, mention in ragged_context_rows:
-        context_doc: Doc = nlp(ragged_context)
+    for (ragged_context, page_title, mention), context_doc in zip(ragged_context_rows, context_docs):
 
         if crop_sentences:
             raw_sents = [sent.text for sent in context_doc.sents]
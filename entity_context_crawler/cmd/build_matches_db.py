@@ -1,24 +1,46 @@
+import gc
 import json
 import os
 import sqlite3
 import time
-import urllib
-from argparse import ArgumentParser, Namespace
+import zlib
+from argparse import ArgumentParser, Namespace, ArgumentTypeError
 from collections import defaultdict
-from multiprocessing import Pool, cpu_count
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from multiprocessing import Pool, cpu_count, get_start_method
 from os import remove
 from os.path import isfile
-from typing import Tuple
+from sqlite3 import Connection
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple, Union
 
-import spacy
-import wikitextparser as wtp
 from spacy.language import Language
 from spacy.matcher import PhraseMatcher
-
-from entity_context_crawler.dao.matches_db import create_matches_table, Match, insert_match, Mention, insert_page, insert_or_ignore_mention, \
-    Page, create_pages_table, create_mentions_table, PageStats
+from spacy.tokens import Span
+
+from entity_context_crawler.dao.aliases_txt import load_aliases
+from entity_context_crawler.dao.corpus_db import ParsedPage, CorpusWikipedia, is_corpus_db, select_settings
+from entity_context_crawler.dao.entity_index import get_page_title, is_entity_index, EntityIndex
+from entity_context_crawler.dao.matches_db import create_matches_table, Match, Mention, Page, create_pages_table, \
+    create_mentions_table, PageStats, Checkpoint, create_checkpoint_tables, select_checkpoint, is_matches_db, \
+    select_mentions, TextStorage, create_text_storage_tables, compress_page, select_text_storage, \
+    select_max_rowids, insert_into_matches_db, cut_windows, create_window_storage_table, select_window_storage
+from entity_context_crawler.dao.matches_db_writer import MatchesDbWriter, WriterConfig
+from entity_context_crawler.dao.wiki_index_db import select_index_entries
+from entity_context_crawler.util.alias_matcher import AliasMatcher, get_alias_to_mids
+from entity_context_crawler.util.batching import AdaptiveBatcher
+from entity_context_crawler.util.compression import COMPRESSIONS, is_available
+from entity_context_crawler.util.in_flight_window import InFlightWindow
+from entity_context_crawler.util.link_filter import LinkFilter
 from entity_context_crawler.util.log import log
-from entity_context_crawler.util.wikipedia import Wikipedia
+from entity_context_crawler.util.memory import get_rss, get_pss
+from entity_context_crawler.util.metrics import Metrics, write_snapshot
+from entity_context_crawler.util.nlp import NLP_PROFILES, load_nlp, has_sents, pipe
+from entity_context_crawler.util.profiling import has_profiles, profile, profile_iter, remove_profiles, \
+    start_process_profile, write_profile_report
+from entity_context_crawler.util.wikitext import CONVERTERS, Converter, WtpConverter
+from entity_context_crawler.util.wikipedia import Wikipedia, MultistreamWikipedia, get_multistream_index_path, \
+    IndexedWikipedia, parse_page_xml, get_raw_page_title
 
 
 def add_parser_args(parser: ArgumentParser):
@@ -27,30 +49,256 @@ def add_parser_args(parser: ArgumentParser):
         wiki-xml
         freebase-json
         matches-db
+        --aliases
+        --batch-seconds
+        --bz2-processes
+        --cache-size
+        --commit-pages
+        --commit-seconds
+        --compress-text
+        --converter
+        --flush-pages
         --in-memory
+        --journal-mode
         --limit-pages
+        --log-pages
+        --match-mode
+        --max-in-flight-mb
+        --max-in-flight-pages
+        --metrics-file
+        --metrics-seconds
+        --multistream-index
+        --nlp-batch-size
         --overwrite
+        --page-range
+        --profile
+        --raw-pages
+        --resume
+        --shard
+        --shard-by
+        --skip-unlinked-pages
+        --spacy-model
+        --spacy-profile
+        --store-windows
+        --synchronous
+        --text-chunk-size
+        --wiki-index
+        --workers
+        --writer-queue-mb
+        --writer-queue-size
     """
 
     parser.add_argument('wiki_xml', metavar='wiki-xml',
-                        help='Path to (input) Wikipedia XML')
+                        help='Path to (input) Wikipedia XML, multistream Wikipedia XML BZ2 or corpus DB built by'
+                             ' `ecc preprocess-wiki`')
 
     parser.add_argument('freebase_json', metavar='freebase-json',
-                        help='Path to (input) Freebase JSON')
+                        help='Path to (input) Freebase JSON or entity index built by `ecc compile-entities`')
 
     parser.add_argument('matches_db', metavar='matches-db',
                         help='Path to (output) matches DB')
 
+    default_aliases = None
+    parser.add_argument('--aliases', dest='aliases', metavar='STR', default=default_aliases,
+                        help='Path to (input) matches DB of an earlier run, whose mentions are used as aliases, or'
+                             ' to aliases TXT with one tab separated "MID alias" pair per line, requires'
+                             ' --match-mode global (default: {})'.format(default_aliases))
+
+    default_batch_seconds = 0.5
+    parser.add_argument('--batch-seconds', dest='batch_seconds', type=float, metavar='FLOAT',
+                        default=default_batch_seconds,
+                        help='Send pages to the workers in batches that take about ... seconds to process, sized'
+                             ' by bytes and tuned from the observed processing time, 0 = one page at a time'
+                             ' (default: {})'.format(default_batch_seconds))
+
+    default_bz2_processes = None
+    parser.add_argument('--bz2-processes', dest='bz2_processes', type=int, metavar='INT',
+                        default=default_bz2_processes,
+                        help='Number of processes decompressing a multistream Wikipedia XML BZ2'
+                             ' (default: {}, i.e. number of CPUs)'.format(default_bz2_processes))
+
+    default_cache_size = None
+    parser.add_argument('--cache-size', dest='cache_size', type=int, metavar='INT', default=default_cache_size,
+                        help='SQLite cache size of the matches DB in pages, or in KiB if negative'
+                             ' (default: {}, i.e. SQLite default)'.format(default_cache_size))
+
+    default_commit_pages = 1000
+    parser.add_argument('--commit-pages', dest='commit_pages', type=int, metavar='INT', default=default_commit_pages,
+                        help='Commit matches DB after ... pages (default: {})'.format(default_commit_pages))
+
+    default_commit_seconds = 10.0
+    parser.add_argument('--commit-seconds', dest='commit_seconds', type=float, metavar='FLOAT',
+                        default=default_commit_seconds,
+                        help='Commit matches DB after ... seconds at the latest'
+                             ' (default: {})'.format(default_commit_seconds))
+
+    default_compress_text = None
+    parser.add_argument('--compress-text', dest='compress_text', choices=COMPRESSIONS, default=default_compress_text,
+                        help='Store the page texts compressed, zstd requires the zstandard package'
+                             ' (default: {}, i.e. uncompressed)'.format(default_compress_text))
+
+    default_converter = 'wtp'
+    parser.add_argument('--converter', dest='converter', choices=list(CONVERTERS), default=default_converter,
+                        help='Markup to plain text converter, wtp = wikitextparser (reference), fast = single pass'
+                             ' approximation, see tools/compare_converters.py (default: {})'.format(default_converter))
+
+    default_flush_pages = None
+    parser.add_argument('--flush-pages', dest='flush_pages', type=int, metavar='INT', default=default_flush_pages,
+                        help='With --in-memory, persist the matches DB (including the checkpoint) after every ...'
+                             ' pages, so that an aborted run can be resumed (default: {}, i.e. only at the end)'
+                        .format(default_flush_pages))
+
     parser.add_argument('--in-memory', dest='in_memory', action='store_true',
                         help='Build complete matches DB in memory before persisting it')
 
+    default_journal_mode = None
+    parser.add_argument('--journal-mode', dest='journal_mode', metavar='STR', default=default_journal_mode,
+                        choices=['delete', 'truncate', 'persist', 'memory', 'wal', 'off'],
+                        help='SQLite journal mode of the matches DB'
+                             ' (default: {}, i.e. SQLite default)'.format(default_journal_mode))
+
     default_limit_pages = None
     parser.add_argument('--limit-pages', dest='limit_pages', type=int, metavar='INT', default=default_limit_pages,
                         help='Early stop after ... pages (default: {})'.format(default_limit_pages))
 
+    parser.add_argument('--log-pages', dest='log_pages', action='store_true',
+                        help='Log a line per processed page (links, mentions, chars, matches, duration)')
+
+    default_match_mode = 'page'
+    parser.add_argument('--match-mode', dest='match_mode', choices=['page', 'global'], default=default_match_mode,
+                        help='page = match the link texts of each page, global = additionally match the labels'
+                             ' (and --aliases) of all entities, but only of entities linked from the page'
+                             ' (default: {})'.format(default_match_mode))
+
+    default_max_in_flight_mb = 512.0
+    parser.add_argument('--max-in-flight-mb', dest='max_in_flight_mb', type=float, metavar='FLOAT',
+                        default=default_max_in_flight_mb,
+                        help='Stop reading pages while the pages sent to the workers, but not yet returned, sum up'
+                             ' to ... MB (default: {})'.format(default_max_in_flight_mb))
+
+    default_max_in_flight_pages = 10000
+    parser.add_argument('--max-in-flight-pages', dest='max_in_flight_pages', type=int, metavar='INT',
+                        default=default_max_in_flight_pages,
+                        help='Stop reading pages while ... pages are sent to the workers, but not yet returned'
+                             ' (default: {})'.format(default_max_in_flight_pages))
+
+    default_metrics_file = None
+    parser.add_argument('--metrics-file', dest='metrics_file', metavar='STR', default=default_metrics_file,
+                        help='Path to (output) metrics snapshot with pages/s, bytes/s, ETA and per stage'
+                             ' percentiles, JSON if it ends with .json, otherwise Prometheus text format'
+                             ' (default: {})'.format(default_metrics_file))
+
+    default_metrics_seconds = 60.0
+    parser.add_argument('--metrics-seconds', dest='metrics_seconds', type=float, metavar='FLOAT',
+                        default=default_metrics_seconds,
+                        help='Write the metrics snapshot every ... seconds (default: {})'
+                        .format(default_metrics_seconds))
+
+    default_multistream_index = None
+    parser.add_argument('--multistream-index', dest='multistream_index', metavar='STR',
+                        default=default_multistream_index,
+                        help='Path to (input) multistream index TXT BZ2, if wiki-xml is a multistream XML BZ2'
+                             ' (default: {}, i.e. derived from wiki-xml)'.format(default_multistream_index))
+
+    default_nlp_batch_size = 256
+    parser.add_argument('--nlp-batch-size', dest='nlp_batch_size', type=int, metavar='INT',
+                        default=default_nlp_batch_size,
+                        help='Number of paragraphs the spaCy pipeline processes at once, 1 = one paragraph'
+                             ' at a time (default: {})'.format(default_nlp_batch_size))
+
     parser.add_argument('--overwrite', dest='overwrite', action='store_true',
                         help='Overwrite matches DB if it already exists')
 
+    default_page_range = ':'
+    parser.add_argument('--page-range', dest='page_range', type=parse_page_range, metavar='START:STOP',
+                        default=default_page_range,
+                        help='Only process the pages at positions [START, STOP) within the Wikipedia index'
+                             ' or corpus DB, requires --wiki-index for a Wikipedia XML'
+                             ' (default: {})'.format(default_page_range))
+
+    default_profile = None
+    parser.add_argument('--profile', dest='profile_dir', metavar='STR', default=default_profile,
+                        help='Profile the main process, the reader and writer threads and the workers with cProfile,'
+                             ' dump the stats per process to directory ... and merge them into a report with the top'
+                             ' functions per stage (default: {})'.format(default_profile))
+
+    parser.add_argument('--raw-pages', dest='raw_pages', action='store_true',
+                        help='Only find the pages\' boundaries in the main process and let the workers parse'
+                             ' the raw page XML')
+
+    parser.add_argument('--resume', dest='resume', action='store_true',
+                        help='Resume an aborted run from the checkpoint in the matches DB, requires the same'
+                             ' wiki-xml, freebase-json and options as the aborted run')
+
+    default_shard = None
+    parser.add_argument('--shard', dest='shard', type=parse_shard, metavar='K/N', default=default_shard,
+                        help='Only process shard K of N shards (K = 0, ..., N-1), e.g. on N machines, and merge'
+                             ' the resulting matches DBs via `ecc merge-matches-db` (default: {})'
+                        .format(default_shard))
+
+    default_shard_by = 'position'
+    parser.add_argument('--shard-by', dest='shard_by', choices=['position', 'title'], default=default_shard_by,
+                        help='Assign pages to shards by their position within the Wikipedia or by a hash of'
+                             ' their title (default: {})'.format(default_shard_by))
+
+    parser.add_argument('--skip-unlinked-pages', dest='skip_unlinked_pages', action='store_true',
+                        help='Skip pages without links to entity pages before parsing them, as they cannot'
+                             ' contain matches, and do not store them in the matches DB')
+
+    default_spacy_model = 'en_core_web_lg'
+    parser.add_argument('--spacy-model', dest='spacy_model', metavar='STR', default=default_spacy_model,
+                        help='Name of installed spaCy model or path to spaCy model directory'
+                             ' (default: {})'.format(default_spacy_model))
+
+    default_spacy_profile = 'full'
+    parser.add_argument('--spacy-profile', dest='spacy_profile', choices=list(NLP_PROFILES),
+                        default=default_spacy_profile,
+                        help='spaCy components to load, must set sentence boundaries, i.e. not tokenizer-only,'
+                             ' unless wiki-xml is a corpus DB (default: {})'.format(default_spacy_profile))
+
+    default_store_windows = None
+    parser.add_argument('--store-windows', dest='store_windows', type=int, metavar='MAX_CONTEXT_SIZE',
+                        default=default_store_windows,
+                        help='Only store the windows of ... chars before and after the matches instead of the whole'
+                             ' page texts, and skip the pages without matches. `ecc build-contexts-db` then requires'
+                             ' --context-size <= MAX_CONTEXT_SIZE (default: {}, i.e. whole pages)'
+                        .format(default_store_windows))
+
+    default_synchronous = None
+    parser.add_argument('--synchronous', dest='synchronous', metavar='STR', default=default_synchronous,
+                        choices=['off', 'normal', 'full', 'extra'],
+                        help='SQLite synchronous setting of the matches DB'
+                             ' (default: {}, i.e. SQLite default)'.format(default_synchronous))
+
+    default_text_chunk_size = None
+    parser.add_argument('--text-chunk-size', dest='text_chunk_size', type=int, metavar='INT',
+                        default=default_text_chunk_size,
+                        help='With --compress-text, compress the page texts in chunks of ... chars, so that contexts'
+                             ' can be read without decompressing whole pages (default: {}, i.e. one chunk per page)'
+                        .format(default_text_chunk_size))
+
+    default_wiki_index = None
+    parser.add_argument('--wiki-index', dest='wiki_index_db', metavar='STR', default=default_wiki_index,
+                        help='Path to (input) Wikipedia index DB built by `ecc index-wiki` for wiki-xml'
+                             ' (default: {})'.format(default_wiki_index))
+
+    default_workers = None
+    parser.add_argument('--workers', dest='workers', type=int, metavar='INT', default=default_workers,
+                        help='Number of worker processes (default: {}, i.e. half the number of CPUs)'
+                        .format(default_workers))
+
+    default_writer_queue_mb = 256.0
+    parser.add_argument('--writer-queue-mb', dest='writer_queue_mb', type=float, metavar='FLOAT',
+                        default=default_writer_queue_mb,
+                        help='Max MB of page texts waiting to be written to the matches DB'
+                             ' (default: {})'.format(default_writer_queue_mb))
+
+    default_writer_queue_size = 1000
+    parser.add_argument('--writer-queue-size', dest='writer_queue_size', type=int, metavar='INT',
+                        default=default_writer_queue_size,
+                        help='Max number of processed pages waiting to be written to the matches DB'
+                             ' (default: {})'.format(default_writer_queue_size))
+
 
 def run(args: Namespace):
     """
@@ -63,9 +311,48 @@ def run(args: Namespace):
     freebase_json = args.freebase_json
     matches_db = args.matches_db
 
+    aliases = args.aliases
+    batch_seconds = args.batch_seconds
+    bz2_processes = args.bz2_processes
+    cache_size = args.cache_size
+    commit_pages = args.commit_pages
+    commit_seconds = args.commit_seconds
+    compress_text = args.compress_text
+    converter = args.converter
+    flush_pages = args.flush_pages
     in_memory = args.in_memory
+    journal_mode = args.journal_mode
     limit_pages = args.limit_pages
+    log_pages = args.log_pages
+    match_mode = args.match_mode
+    max_in_flight_mb = args.max_in_flight_mb
+    max_in_flight_pages = args.max_in_flight_pages
+    metrics_file = args.metrics_file
+    metrics_seconds = args.metrics_seconds
+    multistream_index = args.multistream_index
+    nlp_batch_size = args.nlp_batch_size
     overwrite = args.overwrite
+    page_range = args.page_range
+    profile_dir = args.profile_dir
+    raw_pages = args.raw_pages
+    resume = args.resume
+    shard = args.shard
+    shard_by = args.shard_by
+    skip_unlinked_pages = args.skip_unlinked_pages
+    spacy_model = args.spacy_model
+    spacy_profile = args.spacy_profile
+    store_windows = args.store_windows
+    synchronous = args.synchronous
+    text_chunk_size = args.text_chunk_size
+    wiki_index_db = args.wiki_index_db
+    workers = args.workers
+    writer_queue_mb = args.writer_queue_mb
+    writer_queue_size = args.writer_queue_size
+
+    corpus_db = isfile(wiki_xml) and is_corpus_db(wiki_xml)
+
+    if wiki_xml.endswith('.bz2') and not multistream_index:
+        multistream_index = get_multistream_index_path(wiki_xml)
 
     python_hash_seed = os.getenv('PYTHONHASHSEED')
 
@@ -78,9 +365,43 @@ def run(args: Namespace):
     print('    {:20} {}'.format('freebase-json', freebase_json))
     print('    {:20} {}'.format('matches-db', matches_db))
     print()
+    print('    {:20} {}'.format('--aliases', aliases))
+    print('    {:20} {}'.format('--batch-seconds', batch_seconds))
+    print('    {:20} {}'.format('--bz2-processes', bz2_processes))
+    print('    {:20} {}'.format('--cache-size', cache_size))
+    print('    {:20} {}'.format('--commit-pages', commit_pages))
+    print('    {:20} {}'.format('--commit-seconds', commit_seconds))
+    print('    {:20} {}'.format('--compress-text', compress_text))
+    print('    {:20} {}'.format('--converter', converter))
+    print('    {:20} {}'.format('--flush-pages', flush_pages))
     print('    {:20} {}'.format('--in-memory', in_memory))
+    print('    {:20} {}'.format('--journal-mode', journal_mode))
     print('    {:20} {}'.format('--limit-pages', limit_pages))
+    print('    {:20} {}'.format('--log-pages', log_pages))
+    print('    {:20} {}'.format('--match-mode', match_mode))
+    print('    {:20} {}'.format('--max-in-flight-mb', max_in_flight_mb))
+    print('    {:20} {}'.format('--max-in-flight-pages', max_in_flight_pages))
+    print('    {:20} {}'.format('--metrics-file', metrics_file))
+    print('    {:20} {}'.format('--metrics-seconds', metrics_seconds))
+    print('    {:20} {}'.format('--multistream-index', multistream_index))
+    print('    {:20} {}'.format('--nlp-batch-size', nlp_batch_size))
     print('    {:20} {}'.format('--overwrite', overwrite))
+    print('    {:20} {}'.format('--page-range', page_range))
+    print('    {:20} {}'.format('--profile', profile_dir))
+    print('    {:20} {}'.format('--raw-pages', raw_pages))
+    print('    {:20} {}'.format('--resume', resume))
+    print('    {:20} {}'.format('--shard', shard))
+    print('    {:20} {}'.format('--shard-by', shard_by))
+    print('    {:20} {}'.format('--skip-unlinked-pages', skip_unlinked_pages))
+    print('    {:20} {}'.format('--spacy-model', spacy_model))
+    print('    {:20} {}'.format('--spacy-profile', spacy_profile))
+    print('    {:20} {}'.format('--store-windows', store_windows))
+    print('    {:20} {}'.format('--synchronous', synchronous))
+    print('    {:20} {}'.format('--text-chunk-size', text_chunk_size))
+    print('    {:20} {}'.format('--wiki-index', wiki_index_db))
+    print('    {:20} {}'.format('--workers', workers))
+    print('    {:20} {}'.format('--writer-queue-mb', writer_queue_mb))
+    print('    {:20} {}'.format('--writer-queue-size', writer_queue_size))
     print()
     print('    {:20} {}'.format('PYTHONHASHSEED', python_hash_seed))
     print()
@@ -93,97 +414,795 @@ def run(args: Namespace):
         print('Wikipedia XML not found')
         exit()
 
+    if multistream_index and not isfile(multistream_index):
+        print('Multistream index not found')
+        exit()
+
+    if wiki_index_db and not isfile(wiki_index_db):
+        print('Wikipedia index DB not found')
+        exit()
+
+    if page_range != (None, None) and not wiki_index_db and not corpus_db:
+        print('--page-range requires --wiki-index')
+        exit()
+
+    if corpus_db and (raw_pages or wiki_index_db):
+        print('--raw-pages and --wiki-index are not applicable to a corpus DB')
+        exit()
+
+    if corpus_db:
+        with sqlite3.connect(wiki_xml) as corpus_conn:
+            corpus_settings = select_settings(corpus_conn)
+
+        for warning in get_corpus_settings_warnings(corpus_settings, spacy_model, converter):
+            print('Warning: {}'.format(warning))
+
     if not isfile(freebase_json):
-        print('Freebase JSON not found')
+        print('Freebase JSON / entity index not found')
         exit()
 
-    if isfile(matches_db):
+    if aliases and match_mode != 'global':
+        print('--aliases requires --match-mode global')
+        exit()
+
+    if aliases and not isfile(aliases):
+        print('Aliases not found')
+        exit()
+
+    if not has_sents(spacy_profile) and not corpus_db:
+        print('--spacy-profile {} does not set sentence boundaries, which are required to clean up the'
+              ' page texts'.format(spacy_profile))
+        exit()
+
+    if workers is not None and workers < 1:
+        print('--workers must be at least 1')
+        exit()
+
+    if resume and overwrite:
+        print('--resume and --overwrite are mutually exclusive')
+        exit()
+
+    if compress_text and not is_available(compress_text):
+        print('--compress-text {} requires the zstandard package'.format(compress_text))
+        exit()
+
+    if store_windows is not None and store_windows < 0:
+        print('--store-windows must not be negative')
+        exit()
+
+    if text_chunk_size and not compress_text:
+        print('--text-chunk-size requires --compress-text')
+        exit()
+
+    if flush_pages and not in_memory:
+        print('--flush-pages requires --in-memory')
+        exit()
+
+    if profile_dir and os.path.isdir(profile_dir) and has_profiles(profile_dir):
         if overwrite:
+            remove_profiles(profile_dir)
+        else:
+            print('Profile directory already contains profiles, use --overwrite to overwrite them')
+            exit()
+
+    if isfile(matches_db):
+        if resume:
+            with sqlite3.connect(matches_db) as matches_conn:
+                if not select_checkpoint(matches_conn):
+                    print('Matches DB has no checkpoint, cannot resume')
+                    exit()
+
+        elif overwrite:
             remove(matches_db)
+
         else:
-            print('Matches DB already exists, use --overwrite to overwrite it')
+            print('Matches DB already exists, use --overwrite to overwrite it or --resume to resume it')
             exit()
 
     #
     # Run actual program
     #
 
-    _build_matches_db(wiki_xml, freebase_json, matches_db, in_memory, limit_pages)
+    wiki_source = WikiSource(wiki_xml, limit_pages, multistream_index, bz2_processes, wiki_index_db, page_range,
+                             raw_pages, shard, shard_by, corpus_db)
+
+    writer_config = WriterConfig(commit_pages, commit_seconds, writer_queue_size, journal_mode, synchronous,
+                                 cache_size, int(writer_queue_mb * 1e6), flush_pages)
+
+    pool_config = PoolConfig(workers if workers else get_default_workers(), batch_seconds, max_in_flight_pages,
+                             int(max_in_flight_mb * 1e6))
+
+    storage_config = StorageConfig(TextStorage(compress_text, text_chunk_size) if compress_text else None,
+                                   store_windows)
+
+    monitor_config = MonitorConfig(log_pages, metrics_file, metrics_seconds, profile_dir)
+
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+    with profile(profile_dir, 'main'):
+        _build_matches_db(wiki_source, freebase_json, matches_db, in_memory, skip_unlinked_pages, writer_config,
+                          pool_config, storage_config, monitor_config, resume, spacy_model, spacy_profile,
+                          nlp_batch_size, converter, match_mode, aliases)
+
+    if profile_dir:
+        log('Profile report | {}'.format(write_profile_report(profile_dir)))
 
 
-def _build_matches_db(wiki_xml, freebase_json, matches_db, in_memory, limit_pages):
+def get_corpus_settings_warnings(corpus_settings: Mapping[str, str], spacy_model: str, converter: str) -> List[str]:
+    """
+    Compare the options with the settings that the corpus DB was preprocessed with. The pages
+    of a corpus DB are already converted and cleaned up, so --converter does not apply, and a
+    different --spacy-model may tokenize the clean texts differently than expected.
+
+    :return: Warnings about the options that differ
+    """
+
+    warnings = []
+
+    if corpus_settings.get('converter') != converter:
+        warnings.append('The corpus DB was converted with --converter {}, --converter {} does not apply'
+                        .format(corpus_settings.get('converter'), converter))
+
+    if corpus_settings.get('spacy_model') != spacy_model:
+        warnings.append('The corpus DB was cleaned up with --spacy-model {}, but matching uses --spacy-model {}'
+                        .format(corpus_settings.get('spacy_model'), spacy_model))
+
+    return warnings
+
+
+@dataclass
+class StorageConfig:
+    """
+    Options that determine how the pages are stored in the matches DB
+    """
+
+    text_storage: Optional[TextStorage]     # None = uncompressed, see --compress-text and --text-chunk-size
+    max_context_size: Optional[int]         # None = whole pages, see --store-windows and cut_windows()
+
+
+@dataclass
+class MonitorConfig:
+    """
+    Options that determine what is logged and measured while processing the pages
+    """
+
+    log_pages: bool                 # Log a line per page, see log_page_info()
+    metrics_file: Optional[str]     # See write_snapshot()
+    metrics_seconds: float
+    profile_dir: Optional[str] = None   # See write_profile_report()
+
+
+@dataclass
+class WikiSource:
+    """
+    Input options that determine how the Wikipedia pages are read
+    """
+
+    wiki_xml: str
+    limit_pages: Optional[int]
+    multistream_index: Optional[str]
+    bz2_processes: Optional[int]
+    wiki_index_db: Optional[str]
+    page_range: Tuple[Optional[int], Optional[int]]
+    raw_pages: bool
+    shard: Optional[Tuple[int, int]]
+    shard_by: str
+    corpus_db: bool     # True if wiki_xml is a corpus DB built by `ecc preprocess-wiki`
+
+
+@dataclass
+class PoolConfig:
+    """
+    Options of the worker pool that processes the pages
+    """
+
+    workers: int            # Number of worker processes
+    batch_seconds: float    # Target processing time per batch of pages, 0 = one page per batch, see AdaptiveBatcher
+    max_in_flight_pages: int    # Max pages sent to the workers, but not yet returned, see InFlightWindow
+    max_in_flight_bytes: int    # Max size of these pages, see get_page_size()
+
+
+def get_default_workers() -> int:
+    return max(cpu_count() // 2, 1)
+
+
+@dataclass
+class EntityTables:
+    """
+    Lookup tables built once from the Freebase JSON in the main process and shared with the workers.
+    Dicts if built from the Freebase JSON, memory-mapped views if read from an entity index.
+    """
+
+    entity_page_title_to_mid: Mapping[str, str]  # Title of entity's Wikipedia page -> MID
+    mid_to_label: Mapping[str, str]
+    alias_to_mids: Optional[Mapping[str, Set[str]]] = None  # Only in global match mode, see AliasMatcher
+
+
+def get_entity_tables(freebase_data) -> EntityTables:
+    entity_page_title_to_mid = {}
+    mid_to_label = {}
+
+    for mid, entity_data in freebase_data.items():
+        mid_to_label[mid] = entity_data['label']
+
+        page_url = entity_data['wikipedia']
+        if page_url:
+            entity_page_title_to_mid[get_page_title(page_url)] = mid
+
+    return EntityTables(entity_page_title_to_mid, mid_to_label)
+
+
+def _build_matches_db(wiki_source: WikiSource, freebase_json, matches_db, in_memory, skip_unlinked_pages,
+                      writer_config: WriterConfig, pool_config: PoolConfig, storage_config: StorageConfig,
+                      monitor_config: MonitorConfig, resume: bool, spacy_model: str, spacy_profile: str,
+                      nlp_batch_size: int, converter: str, match_mode: str, aliases: Optional[str]):
+
     if in_memory:
-        _run_in_memory(wiki_xml, freebase_json, matches_db, limit_pages)
+        with _open_in_memory(matches_db, resume) as (matches_conn, flush):
+            _process_wiki_xml(wiki_source, freebase_json, matches_conn, skip_unlinked_pages, writer_config,
+                              pool_config, storage_config, monitor_config, resume, spacy_model, spacy_profile,
+                              nlp_batch_size, converter, match_mode, aliases, flush)
+
     else:
-        _run_on_disk(wiki_xml, freebase_json, matches_db, limit_pages)
+        with _open_on_disk(matches_db) as matches_conn:
+            _process_wiki_xml(wiki_source, freebase_json, matches_conn, skip_unlinked_pages, writer_config,
+                              pool_config, storage_config, monitor_config, resume, spacy_model, spacy_profile,
+                              nlp_batch_size, converter, match_mode, aliases)
 
+    log()
+    log('Finished successfully')
 
-def _run_on_disk(wiki_xml, freebase_json, matches_db, limit_pages):
-    with sqlite3.connect(matches_db) as matches_conn:
-        _process_wiki_xml(wiki_xml, freebase_json, matches_conn, limit_pages)
 
-        log()
-        log('Finished successfully')
+@contextmanager
+def _open_on_disk(matches_db) -> Iterator[Connection]:
+    # The matches DB writer thread uses the connection
+    with sqlite3.connect(matches_db, check_same_thread=False) as matches_conn:
+        yield matches_conn
+
+
+@contextmanager
+def _open_in_memory(matches_db, resume: bool) -> Iterator[Tuple[Connection, Callable[[], None]]]:
+    """
+    Build the matches DB in memory and persist it at the end. When resuming, start from the
+    matches DB persisted by an aborted run, see --flush-pages.
+
+    :return: Yield the in-memory connection and the function that persists it, see _Persister
+    """
 
+    # The matches DB writer thread uses the connection
+    with sqlite3.connect(':memory:', check_same_thread=False) as memory_matches_conn:
+        persister = _Persister(memory_matches_conn, matches_db)
 
-def _run_in_memory(wiki_xml, freebase_json, matches_db, limit_pages):
-    with sqlite3.connect(':memory:') as memory_matches_conn:
-        _process_wiki_xml(wiki_xml, freebase_json, memory_matches_conn, limit_pages)
+        if resume and isfile(matches_db):
+            disk_matches_conn = sqlite3.connect(matches_db)
+            try:
+                disk_matches_conn.backup(memory_matches_conn)
+            finally:
+                disk_matches_conn.close()
+
+            persister.flushed_rowids = select_max_rowids(memory_matches_conn)
+
+        yield memory_matches_conn, persister
 
         log()
         log('Persist...')
 
-        with sqlite3.connect(matches_db) as disk_matches_conn:
-            for line in memory_matches_conn.iterdump():
-                if line not in ('BEGIN;', 'COMMIT;'):  # let python handle the transactions
-                    disk_matches_conn.execute(line)
+        start_time = time.time()
+        persister()
+
+        log('Done | {:.1f} s'.format(time.time() - start_time))
+
+
+class _Persister:
+    """
+    Copy the in-memory matches DB to disk. The first copy uses SQLite's online backup API,
+    which copies the database pages instead of dumping and re-executing SQL and replaces the
+    disk DB within a single transaction. Later copies, e.g. every --flush-pages pages, only
+    append the rows added since the previous copy, so that each copy costs I/O proportional
+    to the new rows instead of to the whole DB. An interrupted copy leaves the previous copy
+    intact in both cases.
+    """
+
+    def __init__(self, memory_matches_conn: Connection, matches_db: str):
+        self.memory_matches_conn = memory_matches_conn
+        self.matches_db = matches_db
+
+        self.flushed_rowids: Optional[Dict[str, int]] = None  # None = no copy on disk yet
+
+    def __call__(self):
+        if self.flushed_rowids is None:
+            disk_matches_conn = sqlite3.connect(self.matches_db)
+            try:
+                self.memory_matches_conn.backup(disk_matches_conn)
+            finally:
+                disk_matches_conn.close()
+
+            self.flushed_rowids = select_max_rowids(self.memory_matches_conn)
 
-        log('Done')
+        else:
+            self.flushed_rowids = insert_into_matches_db(self.memory_matches_conn, self.matches_db,
+                                                         self.flushed_rowids)
+
+
+def _format_text_storage(text_storage: Optional[TextStorage]) -> str:
+    if text_storage is None:
+        return 'uncompressed'
 
+    return '{}-compressed in chunks of {} chars'.format(text_storage.compression, text_storage.chunk_size)
 
-def _process_wiki_xml(wiki_xml, freebase_json, matches_conn, limit_pages):
+
+def _process_wiki_xml(wiki_source: WikiSource, freebase_json, matches_conn, skip_unlinked_pages,
+                      writer_config: WriterConfig, pool_config: PoolConfig, storage_config: StorageConfig,
+                      monitor_config: MonitorConfig, resume: bool, spacy_model: str, spacy_profile: str,
+                      nlp_batch_size: int, converter: str, match_mode: str, aliases: Optional[str],
+                      flush: Optional[Callable[[], None]] = None):
     """
     Iterate through all Freebase entities. For each entity, get its Wikipedia page as well
     as the directly linked pages. On those pages, search for the entity label and its aliases.
     Persist the matches in the matches DB.
+
+    The workers cut the page texts to the windows around the matches and compress them as
+    configured, see StorageConfig.
+
+    If given, flush() is called by the writer every --flush-pages pages, see MatchesDbWriter.
+
+    In global match mode, the aliases (labels plus the mentions from the given matches DB or
+    aliases TXT) of all entities are collected once and shared with the workers.
+    """
+
+    checkpoint = select_checkpoint(matches_conn) if resume else None
+
+    if checkpoint:
+        text_storage = storage_config.text_storage
+        stored_text_storage = select_text_storage(matches_conn)
+        if stored_text_storage != text_storage:
+            print('Cannot resume, the matches DB stores its page texts {}, but --compress-text {}'
+                  ' --text-chunk-size {} was given'.format(_format_text_storage(stored_text_storage),
+                                                           text_storage.compression if text_storage else None,
+                                                           text_storage.chunk_size if text_storage else None))
+            exit()
+
+        stored_max_context_size = select_window_storage(matches_conn)
+        if stored_max_context_size != storage_config.max_context_size:
+            print('Cannot resume, the matches DB was built with --store-windows {}, but --store-windows {} was'
+                  ' given'.format(stored_max_context_size, storage_config.max_context_size))
+            exit()
+
+        log('Resume at page {:,} ({:,} pages above done)'.format(checkpoint.low_watermark,
+                                                                 len(checkpoint.positions)))
+    else:
+        create_pages_table(matches_conn)
+        create_matches_table(matches_conn)
+        create_mentions_table(matches_conn)
+        create_checkpoint_tables(matches_conn)
+
+        if storage_config.text_storage:
+            create_text_storage_tables(matches_conn, storage_config.text_storage)
+
+        if storage_config.max_context_size is not None:
+            create_window_storage_table(matches_conn, storage_config.max_context_size)
+
+        checkpoint = Checkpoint()
+
+    start_time = time.time()
+
+    if is_entity_index(freebase_json):
+        entity_index = EntityIndex(freebase_json)
+        entity_tables = EntityTables(entity_index.title_to_mid, entity_index.mid_to_label)
+
+    else:
+        with open(freebase_json, 'r', encoding='utf-8') as f:
+            freebase_data = json.load(f)
+
+        entity_tables = get_entity_tables(freebase_data)
+        del freebase_data
+
+    log('Load entities | {:,} entities | {:,} entity pages | {:.1f} s | {:,.0f} MB RSS'.format(
+        len(entity_tables.mid_to_label), len(entity_tables.entity_page_title_to_mid), time.time() - start_time,
+        get_rss() / 1e6))
+
+    if match_mode == 'global':
+        start_time = time.time()
+
+        if aliases is None:
+            mentions = []
+        elif is_matches_db(aliases):
+            with sqlite3.connect(aliases) as aliases_conn:
+                mentions = select_mentions(aliases_conn)
+        else:
+            mentions = load_aliases(aliases)
+
+        entity_tables.alias_to_mids = get_alias_to_mids(entity_tables.mid_to_label, mentions)
+        del mentions
+
+        log('Load aliases | {:,} aliases | {:.1f} s | {:,.0f} MB RSS'.format(
+            len(entity_tables.alias_to_mids), time.time() - start_time, get_rss() / 1e6))
+
+    # Pages without links to entity pages cannot contain matches
+    link_filter = LinkFilter(entity_tables.entity_page_title_to_mid) if skip_unlinked_pages else None
+
+    with _open_wikipedia(wiki_source) as wikipedia:
+        _process_wikipedia(wikipedia, entity_tables, matches_conn, wiki_source, link_filter, writer_config,
+                           pool_config, storage_config, monitor_config, checkpoint, spacy_model, spacy_profile,
+                           nlp_batch_size, converter, flush)
+
+    print()
+    print('Stats')
+    print('\tSkipped special pages: {}'.format(wikipedia.skipped_special_pages))
+    if link_filter:
+        print('\tSkipped unlinked pages: {}'.format(link_filter.skipped_pages))
+    print()
+
+
+@contextmanager
+def _open_wikipedia(wiki_source: WikiSource) -> Iterator[Wikipedia]:
+    """
+    Open the Wikipedia reader that fits the input options:
+        - Corpus DB           -> CorpusWikipedia, reading the pages in the given page range
+        - Multistream XML BZ2 -> MultistreamWikipedia
+        - XML + index DB      -> IndexedWikipedia, reading the pages in the given page range
+        - XML                 -> Wikipedia
+    """
+
+    if wiki_source.corpus_db:
+        # The pool's task handler thread consumes the pages
+        with sqlite3.connect(wiki_source.wiki_xml, check_same_thread=False) as corpus_conn:
+            start, stop = wiki_source.page_range
+            yield CorpusWikipedia(corpus_conn, start, stop, wiki_source.limit_pages)
+
+    elif wiki_source.multistream_index:
+        yield MultistreamWikipedia(wiki_source.wiki_xml, wiki_source.multistream_index, wiki_source.limit_pages,
+                                   wiki_source.bz2_processes)
+
+    elif wiki_source.wiki_index_db:
+        # The pool's task handler thread consumes the index entries
+        with open(wiki_source.wiki_xml, 'rb') as wiki_xml_fh, \
+                sqlite3.connect(wiki_source.wiki_index_db, check_same_thread=False) as wiki_index_conn:
+
+            start, stop = wiki_source.page_range
+            index_entries = ((entry.offset, entry.length)
+                             for entry in select_index_entries(wiki_index_conn, start, stop))
+
+            yield IndexedWikipedia(wiki_xml_fh, index_entries, wiki_source.limit_pages)
+
+    else:
+        with open(wiki_source.wiki_xml, 'rb') as wiki_xml_fh:
+            yield Wikipedia(wiki_xml_fh, wiki_source.limit_pages)
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """
+    Parse shard of the form 'K/N', e.g. '0/4' for the first of four shards
     """
 
-    create_pages_table(matches_conn)
-    create_matches_table(matches_conn)
-    create_mentions_table(matches_conn)
+    k, n = (int(part) for part in shard.split('/'))
+
+    if not 0 <= k < n:
+        raise ArgumentTypeError('invalid shard {}, K must be in [0, N)'.format(shard))
 
-    with open(freebase_json, 'r', encoding='utf-8') as f:
-        freebase_data = json.load(f)
+    return k, n
 
-    with open(wiki_xml, 'rb') as wiki_xml_fh:
-        wikipedia = Wikipedia(wiki_xml_fh, limit_pages)
 
-        init_args = (freebase_data,)
-        with Pool(cpu_count() // 2, initializer=_init_worker, initargs=init_args) as pool:
-            for page_count, page_result in enumerate(pool.imap_unordered(_process_page, wikipedia)):
+def get_shard(position: int, page: Union[dict, bytes, ParsedPage], shard_count: int, shard_by: str) -> int:
+    """
+    Deterministically assign page to one of the shards, by position or by CRC32 of its title
 
-                db_page, db_matches, db_mentions, duration, exception = page_result
+    :param page: Page dict {'title', 'redirect', 'text'}, raw page XML or parsed page
+    """
 
-                if exception:
-                    log('ERROR | {:9,} | {}'.format(page_count, str(exception)))
-                    continue
+    if shard_by == 'position':
+        return position % shard_count
 
-                insert_page(matches_conn, db_page)
+    if isinstance(page, bytes):
+        title = get_raw_page_title(page)
+    elif isinstance(page, ParsedPage):
+        title = page.title
+    else:
+        title = page['title']
 
-                for db_match in db_matches:
-                    insert_match(matches_conn, db_match)
+    return zlib.crc32(title.encode('utf-8')) % shard_count
 
-                for db_mention in db_mentions:
-                    insert_or_ignore_mention(matches_conn, db_mention)
 
-                matches_conn.commit()
+def parse_page_range(page_range: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Parse page range of the form 'START:STOP', whereby START or STOP can be omitted, e.g. '1000:', ':1000'
+    """
+
+    start, stop = page_range.split(':')
+
+    return int(start) if start else None, int(stop) if stop else None
+
+
+def _process_wikipedia(wikipedia: Wikipedia, entity_tables: EntityTables, matches_conn, wiki_source: WikiSource,
+                       link_filter: Optional[LinkFilter], writer_config: WriterConfig, pool_config: PoolConfig,
+                       storage_config: StorageConfig, monitor_config: MonitorConfig, checkpoint: Checkpoint,
+                       spacy_model: str, spacy_profile: str, nlp_batch_size: int, converter: str,
+                       flush: Optional[Callable[[], None]]):
+    """
+    Process the pages in a worker pool and persist the results via a background writer thread.
+    In raw pages mode, the main process only finds the '<page>' elements and the workers parse
+    the XML themselves. Pages from a corpus DB are already parsed and only need to be matched.
+    If given, the link filter drops pages without entity links and the shard drops pages of
+    other shards before they reach the workers.
+
+    The pages are sent to the workers in batches sized by bytes, see AdaptiveBatcher. Reading
+    stops while too many pages are in flight, see InFlightWindow, or while the writer's queue
+    is full.
+
+    Pages that are already done according to the checkpoint are skipped. All other pages are
+    recorded in the checkpoint when written, including filtered and failed pages.
+    """
+
+    metrics = Metrics()
+    throughput = Throughput(pool_config.workers, metrics)
+    batcher = AdaptiveBatcher(pool_config.batch_seconds)
+    window = InFlightWindow(pool_config.max_in_flight_pages, pool_config.max_in_flight_bytes)
+
+    pages = wikipedia.iter_raw_pages() if wiki_source.raw_pages else wikipedia
+
+    global shared_entity_tables
+
+    # Forked workers inherit the entity tables (copy-on-write) instead of receiving a pickled
+    # copy each. Freezing the GC keeps the workers' GC from touching (and thereby copying) them.
+    if get_start_method() == 'fork':
+        shared_entity_tables = entity_tables
+        gc.freeze()
+        init_args = (None, spacy_model, spacy_profile, nlp_batch_size, converter, storage_config,
+                     monitor_config.profile_dir)
+    else:
+        init_args = (entity_tables, spacy_model, spacy_profile, nlp_batch_size, converter, storage_config,
+                     monitor_config.profile_dir)
+
+    # The reader skips pages by the resumed checkpoint, while the writer thread advances its
+    # own copy. Sharing one checkpoint would let the reader see a position that the writer is
+    # just moving from the positions to the low watermark as not done.
+    with Pool(pool_config.workers, initializer=_init_worker, initargs=init_args) as pool, \
+            MatchesDbWriter(matches_conn, writer_config, checkpoint.copy(), flush, metrics,
+                            monitor_config.profile_dir) as writer:
+
+        positioned_pages = _iter_positioned_pages(pages, checkpoint, link_filter, wiki_source.shard,
+                                                  wiki_source.shard_by, writer)
+        positioned_pages = throughput.time_reader(positioned_pages, lambda item: get_page_size(item[1]))
+        batches = batcher.batch(positioned_pages, lambda item: get_page_size(item[1]))
+        batches = window.limit(batches, lambda item: get_page_size(item[1]))
+        sent_batches = ((time.time(), batch) for batch in batches)
+
+        # The pool's task handler thread reads the pages while feeding the batches to the workers
+        sent_batches = profile_iter(sent_batches, monitor_config.profile_dir, 'reader')
+
+        batch_results = pool.imap_unordered(_process_positioned_pages, sent_batches)
+        page_results = _iter_page_results(batch_results, batcher, window, metrics)
+
+        try:
+            _collect_page_results(page_results, wikipedia, throughput, batcher, window, writer, monitor_config)
+
+            # Let the workers exit normally, so that they dump their profiles, see start_process_profile()
+            pool.close()
+            pool.join()
+        finally:
+            # Unblock the pool's task handler thread if the loop was left early
+            window.close()
+
+    gc.unfreeze()
+    shared_entity_tables = None
+
+    log()
+    log_throughput(throughput, batcher, window, writer)
+    log('WRITER | {:,} pages | {:,} commits | {:,} flushes'.format(writer.written_pages, writer.commits,
+                                                                   writer.flushes))
+    log_stages(metrics)
+
+
+def _collect_page_results(page_results: Iterable['PageResult'], wikipedia: Wikipedia, throughput: 'Throughput',
+                          batcher: AdaptiveBatcher, window: InFlightWindow, writer: MatchesDbWriter,
+                          monitor_config: MonitorConfig):
+    """
+    Log the processed pages and pass them on to the writer. Record the pages' stage durations
+    and write the metrics snapshot every --metrics-seconds seconds and at the end.
+    """
+
+    metrics = throughput.metrics
+    last_snapshot_time = time.time()
+
+    for page_count, page_result in enumerate(page_results):
+
+        throughput.add_worker_time(page_result.duration)
+        metrics.add_durations(page_result.stage_durations)
+        metrics.increment('pages')
+        metrics.increment('bytes', page_result.size)
+
+        if page_result.exception:
+            log('ERROR | {:9,} | {}'.format(page_count, str(page_result.exception)))
+            metrics.increment('errors')
+            _put_timed(writer, metrics, None, [], [], page_result.position)
+
+        elif page_result.skip_reason:
+            wikipedia.count_skipped_page(page_result.skip_reason)
+            _put_timed(writer, metrics, None, [], [], page_result.position)
+
+        else:
+            db_page = page_result.db_page
+            metrics.increment('matches', len(page_result.db_matches))
+
+            # The page is None if it is not stored, see store_page(), but its mentions are
+            _put_timed(writer, metrics, db_page, page_result.db_matches, page_result.db_mentions,
+                       page_result.position)
 
-                log_page_info(page_count, db_page.title, db_page.stats, duration)
+            if db_page and monitor_config.log_pages:
+                log_page_info(page_count, db_page.title, db_page.stats, page_result.duration)
 
-        print()
-        print('Stats')
-        print('\tSkipped special pages: {}'.format(wikipedia.skipped_special_pages))
-        print()
+        if (page_count + 1) % 1000 == 0:
+            log_throughput(throughput, batcher, window, writer)
+
+        if monitor_config.metrics_file and time.time() - last_snapshot_time >= monitor_config.metrics_seconds:
+            _write_metrics(monitor_config.metrics_file, throughput, wikipedia)
+            last_snapshot_time = time.time()
+
+    if monitor_config.metrics_file:
+        _write_metrics(monitor_config.metrics_file, throughput, wikipedia)
+
+
+def _put_timed(writer: MatchesDbWriter, metrics: Metrics, db_page: Optional[Page], db_matches: List[Match],
+               db_mentions: List[Mention], position: int):
+    """
+    Pass the page on to the writer and record how long the main process waited for a free slot
+    in the writer's queue
+    """
+
+    start_time = time.time()
+    writer.put(db_page, db_matches, db_mentions, position)
+    metrics.add_duration('writer_wait', time.time() - start_time)
+
+
+def _write_metrics(metrics_file: str, throughput: 'Throughput', wikipedia: Wikipedia):
+    snapshot = throughput.metrics.get_snapshot(time.time() - throughput.start_time, wikipedia.get_progress())
+    write_snapshot(metrics_file, snapshot)
+
+
+def _iter_page_results(batch_results: Iterable[Tuple[float, float, List['PageResult']]], batcher: AdaptiveBatcher,
+                       window: InFlightWindow, metrics: Metrics) -> Iterator['PageResult']:
+    """
+    Flatten the results of the page batches, tune the batch size from their processing time
+    and remove them from the in-flight window
+
+    Records the batches' IPC durations, see _process_positioned_pages(). 'ipc_send' includes
+    the time that a batch waits in the pool's queue for a free worker, 'ipc_receive' the time
+    that the result waits for the main process.
+    """
+
+    for send_duration, end_time, page_results in batch_results:
+        metrics.add_duration('ipc_send', send_duration)
+        metrics.add_duration('ipc_receive', max(time.time() - end_time, 0.0))
+
+        batch_size = sum(page_result.size for page_result in page_results)
+
+        batcher.add_observation(batch_size, sum(page_result.duration for page_result in page_results))
+        window.release(len(page_results), batch_size)
+
+        yield from page_results
+
+
+def get_page_size(page: Union[dict, bytes, ParsedPage]) -> int:
+    """
+    :param page: Page dict {'title', 'redirect', 'text'}, raw page XML or parsed page
+    :return: Length of the page's markup, raw XML or clean text
+    """
+
+    if isinstance(page, bytes):
+        return len(page)
+    elif isinstance(page, ParsedPage):
+        return len(page.clean_text)
+    else:
+        return len(page['text'])
+
+
+def _iter_positioned_pages(pages: Iterable, checkpoint: Checkpoint, link_filter: Optional[LinkFilter],
+                           shard: Optional[Tuple[int, int]], shard_by: str,
+                           writer: MatchesDbWriter) -> Iterator[Tuple[int, Union[dict, bytes, ParsedPage]]]:
+    """
+    Number the pages by their position within the Wikipedia and skip the pages that are
+    already done according to the checkpoint, that belong to another shard or that are
+    dropped by the link filter
+
+    :return: Yield (position, page) for each page to be processed by the workers
+    """
+
+    for position, page in enumerate(pages):
+        if checkpoint.is_done(position):
+            continue
+
+        if shard and get_shard(position, page, shard[1], shard_by) != shard[0]:
+            writer.put(None, [], [], position)
+            continue
+
+        if link_filter and not link_filter.accept(page):
+            writer.put(None, [], [], position)
+            continue
+
+        yield position, page
+
+
+class Throughput:
+    """
+    Measure how fast the main process reads pages and how fast the workers process them,
+    so that it becomes visible which side is the bottleneck
+    """
+
+    def __init__(self, workers: int, metrics: Optional[Metrics] = None):
+        self.start_time = time.time()
+        self.workers = workers
+        self.metrics = metrics if metrics else Metrics()
+
+        self.reader_pages = 0
+        self.reader_bytes = 0
+        self.reader_seconds = 0.0
+
+        self.worker_pages = 0
+        self.worker_seconds = 0.0
+
+    def time_reader(self, pages: Iterable, get_size: Callable) -> Iterator:
+        """
+        Wrap the page iterator to measure the time spent reading pages
+        """
+
+        pages = iter(pages)
+        while True:
+            start_time = time.time()
+            page = next(pages, None)
+            duration = time.time() - start_time
+            self.reader_seconds += duration
+
+            if page is None:
+                return
+
+            self.reader_pages += 1
+            self.reader_bytes += get_size(page)
+            self.metrics.add_duration('read', duration)
+
+            yield page
+
+    def add_worker_time(self, duration: float):
+        self.worker_pages += 1
+        self.worker_seconds += duration
+
+
+def log_throughput(throughput: Throughput, batcher: AdaptiveBatcher, window: InFlightWindow,
+                   writer: MatchesDbWriter):
+    """
+    Log throughput of the main process (reading pages) and the workers (processing pages). The reader
+    is the bottleneck if its pages/s are below the workers' combined pages/s. The workers' utilization
+    is the share of their time spent processing pages, i.e. not waiting for pages or IPC.
+
+    Also log how many pages are in flight, how many wait for the writer and the main process's RSS.
+    """
+
+    elapsed = time.time() - throughput.start_time
+
+    reader_pages_per_sec = throughput.reader_pages / throughput.reader_seconds if throughput.reader_seconds else 0
+    reader_mb_per_sec = throughput.reader_bytes / throughput.reader_seconds / 1e6 if throughput.reader_seconds else 0
+    worker_pages_per_sec = throughput.worker_pages / throughput.worker_seconds if throughput.worker_seconds else 0
+    worker_utilization = throughput.worker_seconds / (elapsed * throughput.workers) if elapsed else 0
+
+    log(
+        'THROUGHPUT'
+        ' | {:,.0f} s elapsed'
+        ' | reader: {:,} pages, {:,.1f} pages/s, {:,.1f} MB/s, {:.0f}% busy'
+        ' | workers: {:,} pages, {:,.1f} pages/s per worker x {} workers, {:.0f}% utilized'
+        ' | batches: {:,}, {:,.1f} pages avg, {:,} bytes budget'
+        ' | in flight: {:,} pages, {:,.1f} MB'
+        ' | writer queue: {:,} pages, {:,.1f} MB'
+        ' | {:,.0f} MB RSS'
+            .format(
+            elapsed,
+            throughput.reader_pages, reader_pages_per_sec, reader_mb_per_sec,
+            throughput.reader_seconds / elapsed * 100 if elapsed else 0,
+            throughput.worker_pages, worker_pages_per_sec, throughput.workers, worker_utilization * 100,
+            batcher.batches, batcher.items / batcher.batches if batcher.batches else 0, batcher.batch_bytes,
+            window.pages, window.bytes / 1e6,
+            writer.queue.qsize(), writer.queued_bytes / 1e6,
+            get_rss() / 1e6,
+        ))
 
 
 def log_page_info(page_count: int, page_title: str, stats: PageStats, duration: float):
@@ -209,151 +1228,419 @@ def log_page_info(page_count: int, page_title: str, stats: PageStats, duration:
         ))
 
 
-worker_globals: Tuple
+def log_stages(metrics: Metrics):
+    """
+    Log the total time and the percentiles of the time per page (or per batch for IPC, per
+    commit for the writer) for each stage
+    """
+
+    for stage, values in metrics.get_stages().items():
+        log('STAGE | {:12} | {:9,} x | {:9,.1f} s total | p50 {:9,.1f} ms | p95 {:9,.1f} ms | p99 {:9,.1f} ms'.format(
+            stage, values['count'], values['seconds'],
+            values['p50'] * 1000, values['p95'] * 1000, values['p99'] * 1000))
+
+
+shared_entity_tables: Optional[EntityTables] = None  # Set in the main process before forking the workers
 
+worker_globals: Tuple = ()
+
+
+def _init_worker(entity_tables: Optional[EntityTables], spacy_model: str, spacy_profile: str, nlp_batch_size: int,
+                 converter: str, storage_config: StorageConfig, profile_dir: Optional[str] = None):
+    """
+    :param entity_tables: None if inherited from the main process via fork, see shared_entity_tables
+    :param profile_dir: If given, profile the worker until it exits, see --profile
+    """
 
-def _init_worker(freebase_data):
     global worker_globals
 
-    entity_page_title_to_mid = _get_entity_page_title_to_mid(freebase_data)
+    if profile_dir:
+        start_process_profile(profile_dir, 'worker')
 
-    nlp = spacy.load('en_core_web_lg')
+    start_time = time.time()
 
-    worker_globals = (freebase_data, entity_page_title_to_mid, nlp)
+    if entity_tables is None:
+        entity_tables = shared_entity_tables
 
+    nlp = load_nlp(spacy_model, spacy_profile)
 
-def _get_entity_page_title_to_mid(freebase_data):
-    entity_page_title_to_mid = {}
-    for mid, entity_data in freebase_data.items():
-        page_url = entity_data['wikipedia']
-        if page_url:
-            decoded_page_url = urllib.parse.unquote(page_url)
-            page_title = decoded_page_url.rsplit('/', 1)[-1].replace('_', ' ')
-            entity_page_title_to_mid[page_title] = mid
+    alias_matcher = AliasMatcher(nlp, entity_tables.alias_to_mids) if entity_tables.alias_to_mids else None
 
-    return entity_page_title_to_mid
+    worker_globals = (entity_tables, nlp, nlp_batch_size, CONVERTERS[converter](), alias_matcher, storage_config)
 
+    log('WORKER | pid {} | started in {:.1f} s | {:,.0f} MB RSS | {:,.0f} MB PSS'.format(
+        os.getpid(), time.time() - start_time, get_rss() / 1e6, get_pss() / 1e6))
 
-def _process_page(page: dict):
-    global worker_globals
-    freebase_data, entity_page_title_to_mid, nlp = worker_globals
+
+@dataclass
+class PageResult:
+    position: int = 0  # Position of the page within the Wikipedia
+    size: int = 0  # See get_page_size()
+    db_page: Optional[Page] = None
+    db_matches: Optional[List[Match]] = None
+    db_mentions: Optional[List[Mention]] = None
+    duration: float = 0.0
+    exception: Optional[Exception] = None
+    skip_reason: Optional[str] = None  # set if the raw page XML was skipped, see Wikipedia.count_skipped_page()
+    stage_durations: Dict[str, float] = field(default_factory=dict)  # Stage -> seconds, see Metrics
+
+
+def _process_positioned_pages(sent_batch: Tuple[float, List[Tuple[int, Union[dict, bytes, ParsedPage]]]]) \
+        -> Tuple[float, float, List[PageResult]]:
+    """
+    Process batch of pages, see AdaptiveBatcher
+
+    :param sent_batch: (time when the main process sent the batch, batch)
+    :return: (seconds between sending and starting the batch, end time, page results)
+    """
+
+    sent_time, positioned_pages = sent_batch
+    start_time = time.time()
+
+    page_results = [_process_positioned_page(positioned_page) for positioned_page in positioned_pages]
+
+    return start_time - sent_time, time.time(), page_results
+
+
+def _process_positioned_page(positioned_page: Tuple[int, Union[dict, bytes, ParsedPage]]) -> PageResult:
+    """
+    Process page dict, raw page XML or parsed page and attach the page's position and size to the result
+    """
+
+    position, page = positioned_page
+
+    if isinstance(page, bytes):
+        page_result = _process_page_xml(page)
+    elif isinstance(page, ParsedPage):
+        page_result = _process_parsed_page(page)
+    else:
+        page_result = _process_page(page)
+
+    page_result.position = position
+    page_result.size = get_page_size(page)
+
+    return page_result
+
+
+def _process_page_xml(page_xml: bytes) -> PageResult:
+    """
+    Parse raw page XML and process the page, see Wikipedia.iter_raw_pages()
+    """
+
+    start_time = time.time()
 
     try:
-        start_time = time.time()
+        page, skip_reason = parse_page_xml(page_xml)
+    except Exception as e:
+        return PageResult(duration=time.time() - start_time, exception=e)
+
+    parse_xml_duration = time.time() - start_time
 
-        page_title = page['title']
-        page_markup = page['text']
+    if skip_reason:
+        return PageResult(duration=parse_xml_duration, skip_reason=skip_reason,
+                          stage_durations={'parse_xml': parse_xml_duration})
 
-        # Parse markup -> AST
-        parsed = wtp.parse(page_markup)
+    page_result = _process_page(page)
+    page_result.duration = time.time() - start_time
+    page_result.stage_durations['parse_xml'] = parse_xml_duration
 
-        # Get links that refer to Wiki pages of Freebase entities
-        links = parsed.wikilinks
-        entity_links = [link for link in links if link.title in entity_page_title_to_mid]
+    return page_result
 
-        # Get mention -> MID mapping from links, e.g.:
-        # { 'Berlin' -> ['/m/abc'], 'Bonn' -> ['/m/xyz'], 'capital' -> ['/m/abc', '/m/xyz'] }
-        #
-        # Note: Multiple links with the same text that link different pages
-        #       should not occur according to Wikipedia standards
-        mention_to_mids = defaultdict(set)
-        for link in entity_links:
-            mention = link.text if link.text else link.title
-            mention_to_mids[mention].add(entity_page_title_to_mid[link.title])
 
-        # Remove non-unique mentions
-        mention_to_mid = {mention: list(mids)[0] for mention, mids in mention_to_mids.items()
-                          if len(mids) == 1}
+def _process_page(page: dict) -> PageResult:
+    """
+    Parse page and match the entities on it
+    """
 
-        # Prepare DB mentions. Will be returned to the main thread
-        mentions = list(nlp.pipe(mention_to_mid.keys()))
-        db_mentions = [Mention(mid, freebase_data[mid]['label'], mention)
-                       for mention, mid in mention_to_mid.items()]
+    global worker_globals
+    entity_tables, nlp, nlp_batch_size, converter, alias_matcher, storage_config = worker_globals
 
-        matcher = PhraseMatcher(nlp.vocab)
-        matcher.add('Patterns', None, *mentions)
+    start_time = time.time()
+    stage_durations = {}
 
-        # Markup -> plain text, clean up plain text
-        page_text = parsed.plain_text()
-        clean_page_text = clean_up_text(nlp, page_text)
+    try:
+        parsed_page = parse_page(nlp, page, nlp_batch_size, converter, stage_durations)
+        db_page, db_matches, db_mentions = _match_and_store_page(nlp, parsed_page, entity_tables, alias_matcher,
+                                                                 storage_config, stage_durations)
 
-        # Search mentions
-        spacy_doc = nlp.make_doc(clean_page_text)
-        matches = matcher(spacy_doc)
+        duration = time.time() - start_time
 
-        db_matches = []
-        for _, start, end in matches:
-            match_span = spacy_doc[start:end]
-            mention = match_span.text  # mention which matched (from the whole mention set)
+        return PageResult(db_page=db_page, db_matches=db_matches, db_mentions=db_mentions, duration=duration,
+                          stage_durations=stage_durations)
 
-            mid = mention_to_mid[mention]
-            entity_label = freebase_data[mid]['label']
+    except Exception as e:
+        return PageResult(duration=time.time() - start_time, exception=e, stage_durations=stage_durations)
 
-            start_char = match_span.start_char
-            end_char = match_span.end_char
 
-            context_start = max(match_span.start_char - 20, 0)
-            context_end = min(match_span.end_char + 20, len(clean_page_text))
-            context = clean_page_text[context_start:context_end]
+def _process_parsed_page(parsed_page: ParsedPage) -> PageResult:
+    """
+    Match the entities on page preprocessed by `ecc preprocess-wiki`
+    """
 
-            db_match = Match(mid, entity_label, mention, page_title, start_char, end_char, context)
-            db_matches.append(db_match)
+    entity_tables, nlp, _, _, alias_matcher, storage_config = worker_globals
 
-        stop_time = time.time()
-        duration = stop_time - start_time
+    start_time = time.time()
+    stage_durations = {}
 
-        stats = PageStats(
-            len(links),
-            len(entity_links),
-            len(mention_to_mids),
-            len(mention_to_mid),
-            len(page_text),
-            len(clean_page_text),
-            len(db_matches),
-        )
+    try:
+        db_page, db_matches, db_mentions = _match_and_store_page(nlp, parsed_page, entity_tables, alias_matcher,
+                                                                 storage_config, stage_durations)
 
-        db_page = Page(page_title, clean_page_text, stats)
+        duration = time.time() - start_time
 
-        return db_page, db_matches, db_mentions, duration, None
+        return PageResult(db_page=db_page, db_matches=db_matches, db_mentions=db_mentions, duration=duration,
+                          stage_durations=stage_durations)
 
     except Exception as e:
-        return None, None, None, None, e
+        return PageResult(duration=time.time() - start_time, exception=e, stage_durations=stage_durations)
+
+
+def _match_and_store_page(nlp: Language, parsed_page: ParsedPage, entity_tables: EntityTables,
+                          alias_matcher: Optional[AliasMatcher], storage_config: StorageConfig,
+                          stage_durations: Dict[str, float]) -> Tuple[Optional[Page], List[Match], List[Mention]]:
+    """
+    Run the match and store stages and record their durations
+    """
 
+    start_time = time.time()
+    db_page, db_matches, db_mentions = match_page(nlp, parsed_page, entity_tables, alias_matcher)
+    stage_durations['match'] = time.time() - start_time
 
-def clean_up_text(nlp: Language, page_text: str) -> str:
+    start_time = time.time()
+    db_page, db_matches = store_page(db_page, db_matches, storage_config)
+    stage_durations['store'] = time.time() - start_time
+
+    return db_page, db_matches, db_mentions
+
+
+def store_page(db_page: Page, db_matches: List[Match], storage_config: StorageConfig) \
+        -> Tuple[Optional[Page], List[Match]]:
+    """
+    Store stage - prepare the page for the matches DB as configured
+
+    :return: (db_page, db_matches), db_page is None if the page is not stored
+    """
+
+    if storage_config.max_context_size is not None:
+        if not db_matches:
+            return None, db_matches
+
+        db_page, db_matches = cut_windows(db_page, db_matches, storage_config.max_context_size)
+
+    if storage_config.text_storage:
+        db_page = compress_page(db_page, storage_config.text_storage)
+
+    return db_page, db_matches
+
+
+def parse_page(nlp: Language, page: dict, nlp_batch_size: int = 1, converter: Converter = WtpConverter(),
+               stage_durations: Optional[Dict[str, float]] = None) -> ParsedPage:
+    """
+    Parse stage - everything that only depends on the page, not on the entities:
+    Parse markup, get wikilinks, convert markup to plain text and clean it up.
+
+    :param stage_durations: If given, record the durations of the 'convert' and 'clean_up' steps
+    """
+
+    start_time = time.time()
+
+    # Markup -> wikilinks, plain text
+    links, page_text = converter.convert(page['text'])
+
+    convert_end_time = time.time()
+
+    # Clean up plain text
+    clean_page_text, sent_offsets = clean_up_texts_and_sents(nlp, [page_text], nlp_batch_size)[0]
+
+    if stage_durations is not None:
+        stage_durations['convert'] = convert_end_time - start_time
+        stage_durations['clean_up'] = time.time() - convert_end_time
+
+    return ParsedPage(page['title'], len(page_text), clean_page_text, sent_offsets, links)
+
+
+def match_page(nlp: Language, parsed_page: ParsedPage, entity_tables: EntityTables,
+               alias_matcher: Optional[AliasMatcher] = None) -> Tuple[Page, List[Match], List[Mention]]:
+    """
+    Match stage - search the mentions of the linked entities in the page's clean text
+
+    :param alias_matcher: Global match mode - match the aliases of all entities (restricted
+                          to the linked entities) in addition to the page's link texts
+    """
+
+    entity_page_title_to_mid = entity_tables.entity_page_title_to_mid
+    mid_to_label = entity_tables.mid_to_label
+
+    page_title = parsed_page.title
+    clean_page_text = parsed_page.clean_text
+
+    # Get links that refer to Wiki pages of Freebase entities
+    links = parsed_page.links
+    entity_links = [(link_title, link_text) for link_title, link_text in links
+                    if link_title in entity_page_title_to_mid]
+
+    # Get mention -> MID mapping from links, e.g.:
+    # { 'Berlin' -> ['/m/abc'], 'Bonn' -> ['/m/xyz'], 'capital' -> ['/m/abc', '/m/xyz'] }
+    #
+    # Note: Multiple links with the same text that link different pages
+    #       should not occur according to Wikipedia standards
+    mention_to_mids = defaultdict(set)
+    for link_title, link_text in entity_links:
+        mention = link_text if link_text else link_title
+        mention_to_mids[mention].add(entity_page_title_to_mid[link_title])
+
+    # Remove non-unique mentions
+    mention_to_mid = {mention: list(mids)[0] for mention, mids in mention_to_mids.items()
+                      if len(mids) == 1}
+
+    # Prepare DB mentions. Will be returned to the main thread
+    db_mentions = [Mention(mid, mid_to_label[mid], mention)
+                   for mention, mid in mention_to_mid.items()]
+
+    # Search mentions -> [(match_span, mid)]
+    spacy_doc = nlp.make_doc(clean_page_text)
+
+    if alias_matcher:
+        linked_mids = {entity_page_title_to_mid[link_title] for link_title, _ in entity_links}
+        alias_span_mids = alias_matcher(spacy_doc, linked_mids)
+
+        # Also record the matched aliases that are not linked on this page
+        db_mentions.extend(Mention(mid, mid_to_label[mid], mention)
+                           for mention, mid in dict.fromkeys((span.text, mid) for span, mid in alias_span_mids)
+                           if mention_to_mid.get(mention) != mid)
+
+        # Link texts that the alias matcher does not resolve to the linked entity, e.g. piped
+        # links like [[Barack Obama|Obama]] without --aliases, are matched per page as in page
+        # match mode. Where both match the same span, the page's link wins.
+        unresolved_mention_to_mid = {mention: mid for mention, mid in mention_to_mid.items()
+                                     if linked_mids & set(alias_matcher.alias_to_mids.get(mention, ())) != {mid}}
+
+        span_mids = _match_mentions(nlp, spacy_doc, unresolved_mention_to_mid)
+
+        matched_spans = {(span.start, span.end) for span, _ in span_mids}
+        span_mids.extend((span, mid) for span, mid in alias_span_mids if (span.start, span.end) not in matched_spans)
+        span_mids.sort(key=lambda span_mid: (span_mid[0].start, span_mid[0].end))
+
+    else:
+        span_mids = _match_mentions(nlp, spacy_doc, mention_to_mid)
+
+    db_matches = []
+    for match_span, mid in span_mids:
+        mention = match_span.text  # mention which matched (from the whole mention set)
+        entity_label = mid_to_label[mid]
+
+        start_char = match_span.start_char
+        end_char = match_span.end_char
+
+        context_start = max(match_span.start_char - 20, 0)
+        context_end = min(match_span.end_char + 20, len(clean_page_text))
+        context = clean_page_text[context_start:context_end]
+
+        db_match = Match(mid, entity_label, mention, page_title, start_char, end_char, context)
+        db_matches.append(db_match)
+
+    stats = PageStats(
+        len(links),
+        len(entity_links),
+        len(mention_to_mids),
+        len(mention_to_mid),
+        parsed_page.text_len,
+        len(clean_page_text),
+        len(db_matches),
+    )
+
+    db_page = Page(page_title, clean_page_text, stats)
+
+    return db_page, db_matches, db_mentions
+
+
+def _match_mentions(nlp: Language, spacy_doc, mention_to_mid: Mapping[str, str]) -> List[Tuple[Span, str]]:
+    """
+    :return: [(match_span, mid)] for the mentions found in the doc
+    """
+
+    if not mention_to_mid:
+        return []
+
+    mentions = list(nlp.pipe(mention_to_mid.keys()))
+
+    matcher = PhraseMatcher(nlp.vocab)
+    matcher.add('Patterns', None, *mentions)
+
+    return [(spacy_doc[start:end], mention_to_mid[spacy_doc[start:end].text])
+            for _, start, end in matcher(spacy_doc)]
+
+
+def clean_up_text(nlp: Language, page_text: str, batch_size: int = 1) -> str:
     """
     Remove sentence fragments and markup, leaving paragraphs with whole sentences.
+    See clean_up_texts().
+    """
+
+    return clean_up_texts(nlp, [page_text], batch_size)[0]
+
 
-    1. Split page text into paragraphs (split at '\n') and paragraphs into sentences (using NLP)
+def clean_up_texts(nlp: Language, page_texts: List[str], batch_size: int = 1) -> List[str]:
+    """
+    Remove sentence fragments and markup, leaving paragraphs with whole sentences.
+    See clean_up_texts_and_sents().
+    """
+
+    return [clean_page_text for clean_page_text, _ in clean_up_texts_and_sents(nlp, page_texts, batch_size)]
+
+
+def clean_up_texts_and_sents(nlp: Language, page_texts: List[str], batch_size: int = 1) \
+        -> List[Tuple[str, List[Tuple[int, int]]]]:
+    """
+    Remove sentence fragments and markup, leaving paragraphs with whole sentences.
+
+    1. Split page texts into paragraphs (split at '\n') and paragraphs into sentences (using NLP)
     2. Remove bad sentences (too short, contains markup chars, etc.)
     3. Join sentences and paragraphs back together
+
+    The paragraphs of all pages are streamed through the spaCy pipeline in batches of
+    'batch_size' paragraphs, which gives the same result as processing them one by one.
+
+    :return: [(clean_page_text, sent_offsets)] with the (start, end) offsets of the remaining
+             sentences within the clean page text
     """
 
-    paragraphs = page_text.split('\n')
-    clean_paragraphs = []
+    # Optimization: If paragraph < 40, then no sentence >= 40, therefore skip expensive NLP
+    page_paragraphs = [[paragraph for paragraph in page_text.split('\n') if len(paragraph) >= 40]
+                       for page_text in page_texts]
 
-    for paragraph in paragraphs:
+    docs = pipe(nlp, (paragraph for paragraphs in page_paragraphs for paragraph in paragraphs), batch_size)
 
-        # Optimization: If paragraph < 40, then no sentence >= 40, therefore skip expensive NLP
-        if len(paragraph) < 40:
-            continue
+    clean_pages = []
+    for paragraphs in page_paragraphs:
+        clean_paragraphs = []
+        sent_offsets = []
+
+        # Offset of the next clean paragraph, whereby paragraphs are separated by '\n\n'
+        paragraph_offset = 0
+
+        for _, doc in zip(paragraphs, docs):
+            sents = [sent.text for sent in doc.sents]
 
-        doc = nlp(paragraph)
-        sents = [sent.text for sent in doc.sents]
+            clean_sents = [sent for sent in sents if
+                           len(sent) >= 40
+                           and sent[0].isupper()
+                           and '|' not in sent
+                           and '=' not in sent
+                           and 'http' not in sent
+                           and 'Category:' not in sent]
 
-        clean_sents = [sent for sent in sents if
-                       len(sent) >= 40
-                       and sent[0].isupper()
-                       and '|' not in sent
-                       and '=' not in sent
-                       and 'http' not in sent
-                       and 'Category:' not in sent]
+            clean_paragraph = ' '.join(clean_sents)
 
-        clean_paragraph = ' '.join(clean_sents)
+            if clean_paragraph:
+                sent_offset = paragraph_offset
+                for sent in clean_sents:
+                    sent_offsets.append((sent_offset, sent_offset + len(sent)))
+                    sent_offset += len(sent) + 1
 
-        if clean_paragraph:
-            clean_paragraphs.append(clean_paragraph)
+                clean_paragraphs.append(clean_paragraph)
+                paragraph_offset += len(clean_paragraph) + 2
 
-    clean_page_text = '\n\n'.join(clean_paragraphs)
+        clean_pages.append(('\n\n'.join(clean_paragraphs), sent_offsets))
 
-    return clean_page_text
+    return clean_pages
@@ -0,0 +1,104 @@
+import os
+from argparse import ArgumentParser, Namespace
+from os import remove
+from os.path import isfile, getsize
+
+from entity_context_crawler.dao.entity_index import load_entities, write_entity_index
+from entity_context_crawler.dao.mid2rid_txt import load_mid2rid
+from entity_context_crawler.util.log import log
+
+
+def add_parser_args(parser: ArgumentParser):
+    """
+    Add arguments to arg parser:
+        freebase-json
+        entity-index
+        --mid2rid-txt
+        --overwrite
+    """
+
+    parser.add_argument('freebase_json', metavar='freebase-json',
+                        help='Path to (input) Freebase JSON')
+
+    parser.add_argument('entity_index', metavar='entity-index',
+                        help='Path to (output) entity index')
+
+    default_mid2rid_txt = None
+    parser.add_argument('--mid2rid-txt', dest='mid2rid_txt', metavar='STR', default=default_mid2rid_txt,
+                        help='Path to (input) mid2rid TXT, to include the RIDs for `ecc build-contexts-db`'
+                             ' (default: {})'.format(default_mid2rid_txt))
+
+    parser.add_argument('--overwrite', dest='overwrite', action='store_true',
+                        help='Overwrite entity index if it already exists')
+
+
+def run(args: Namespace):
+    """
+    - Print applied config
+    - Check if output files already exist
+    - Run actual program
+    """
+
+    freebase_json = args.freebase_json
+    entity_index = args.entity_index
+
+    mid2rid_txt = args.mid2rid_txt
+    overwrite = args.overwrite
+
+    python_hash_seed = os.getenv('PYTHONHASHSEED')
+
+    #
+    # Print applied config
+    #
+
+    print('Applied config:')
+    print('    {:20} {}'.format('freebase-json', freebase_json))
+    print('    {:20} {}'.format('entity-index', entity_index))
+    print()
+    print('    {:20} {}'.format('--mid2rid-txt', mid2rid_txt))
+    print('    {:20} {}'.format('--overwrite', overwrite))
+    print()
+    print('    {:20} {}'.format('PYTHONHASHSEED', python_hash_seed))
+    print()
+
+    #
+    # Check if output files already exist
+    #
+
+    if not isfile(freebase_json):
+        print('Freebase JSON not found')
+        exit()
+
+    if mid2rid_txt and not isfile(mid2rid_txt):
+        print('mid2rid TXT not found')
+        exit()
+
+    if isfile(entity_index):
+        if overwrite:
+            remove(entity_index)
+        else:
+            print('Entity index already exists, use --overwrite to overwrite it')
+            exit()
+
+    #
+    # Run actual program
+    #
+
+    _compile_entities(freebase_json, mid2rid_txt, entity_index)
+
+
+def _compile_entities(freebase_json, mid2rid_txt, entity_index):
+    log('Load Freebase JSON')
+    mid2rid = load_mid2rid(mid2rid_txt) if mid2rid_txt else None
+    entities = load_entities(freebase_json, mid2rid)
+
+    log('Write entity index')
+    write_entity_index(entity_index, entities)
+
+    log()
+    log('Compiled {:,} entities ({:,} with page, {:,} with RID) into {:,} bytes'.format(
+        len(entities),
+        sum(1 for entity in entities if entity.page_title is not None),
+        sum(1 for entity in entities if entity.rid is not None),
+        getsize(entity_index)))
+    log('Finished successfully')
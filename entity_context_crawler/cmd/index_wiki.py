@@ -0,0 +1,126 @@
+import os
+import re
+import sqlite3
+from argparse import ArgumentParser, Namespace
+from os import remove
+from os.path import isfile
+
+from entity_context_crawler.dao.wiki_index_db import create_pages_table, insert_index_entries, IndexEntry
+from entity_context_crawler.util.log import log
+from entity_context_crawler.util.wikipedia import iter_page_xmls, get_raw_page_title
+
+
+def add_parser_args(parser: ArgumentParser):
+    """
+    Add arguments to arg parser:
+        wiki-xml
+        wiki-index-db
+        --overwrite
+    """
+
+    parser.add_argument('wiki_xml', metavar='wiki-xml',
+                        help='Path to (input) Wikipedia XML')
+
+    parser.add_argument('wiki_index_db', metavar='wiki-index-db',
+                        help='Path to (output) Wikipedia index DB')
+
+    parser.add_argument('--overwrite', dest='overwrite', action='store_true',
+                        help='Overwrite Wikipedia index DB if it already exists')
+
+
+def run(args: Namespace):
+    """
+    - Print applied config
+    - Check if output files already exist
+    - Run actual program
+    """
+
+    wiki_xml = args.wiki_xml
+    wiki_index_db = args.wiki_index_db
+
+    overwrite = args.overwrite
+
+    python_hash_seed = os.getenv('PYTHONHASHSEED')
+
+    #
+    # Print applied config
+    #
+
+    print('Applied config:')
+    print('    {:20} {}'.format('wiki-xml', wiki_xml))
+    print('    {:20} {}'.format('wiki-index-db', wiki_index_db))
+    print()
+    print('    {:20} {}'.format('--overwrite', overwrite))
+    print()
+    print('    {:20} {}'.format('PYTHONHASHSEED', python_hash_seed))
+    print()
+
+    #
+    # Check if output files already exist
+    #
+
+    if not isfile(wiki_xml):
+        print('Wikipedia XML not found')
+        exit()
+
+    if isfile(wiki_index_db):
+        if overwrite:
+            remove(wiki_index_db)
+        else:
+            print('Wikipedia index DB already exists, use --overwrite to overwrite it')
+            exit()
+
+    #
+    # Run actual program
+    #
+
+    _index_wiki(wiki_xml, wiki_index_db)
+
+
+def _index_wiki(wiki_xml: str, wiki_index_db: str, batch_size: int = 10000):
+    """
+    Scan the Wikipedia XML for '<page>' elements (without parsing the XML) and
+    store their title, namespace, byte offset, length and redirect flag.
+    """
+
+    with open(wiki_xml, 'rb') as wiki_xml_fh, \
+            sqlite3.connect(wiki_index_db) as wiki_index_conn:
+
+        create_pages_table(wiki_index_conn)
+
+        index_entries = []
+        for position, (offset, page_xml) in enumerate(iter_page_xmls(wiki_xml_fh)):
+            index_entries.append(get_index_entry(position, offset, page_xml))
+
+            if len(index_entries) == batch_size:
+                insert_index_entries(wiki_index_conn, index_entries)
+                wiki_index_conn.commit()
+                index_entries = []
+
+                log('{:,} pages | {:,} MB'.format(position + 1, offset // 1000000))
+
+        insert_index_entries(wiki_index_conn, index_entries)
+        wiki_index_conn.commit()
+
+        log()
+        log('Finished successfully')
+
+
+namespace_pattern = re.compile(rb'<ns>(-?\d+)</ns>')
+redirect_pattern = re.compile(rb'<redirect[\s/>]')
+
+
+def get_index_entry(position: int, offset: int, page_xml: bytes) -> IndexEntry:
+    """
+    Get the index entry from the '<page>' element's raw XML. As '<' is escaped within
+    the page text, the child elements can be found by simple pattern matching.
+    """
+
+    title = get_raw_page_title(page_xml)
+
+    namespace_match = namespace_pattern.search(page_xml)
+    namespace = int(namespace_match.group(1)) if namespace_match else 0
+
+    redirect = redirect_pattern.search(page_xml) is not None
+
+    return IndexEntry(position, title, namespace, offset, len(page_xml), redirect)
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+from argparse import ArgumentParser, Namespace
+from os import remove
+from os.path import isfile
+
+from entity_context_crawler.dao.matches_db import create_pages_table, create_matches_table, create_mentions_table, \
+    insert_from_matches_db, select_text_storage, create_text_storage_tables, select_window_storage, \
+    create_window_storage_table
+from entity_context_crawler.util.log import log
+
+
+def add_parser_args(parser: ArgumentParser):
+    """
+    Add arguments to arg parser:
+        shard-matches-dbs
+        matches-db
+        --overwrite
+    """
+
+    parser.add_argument('shard_matches_dbs', metavar='shard-matches-db', nargs='+',
+                        help='Paths to (input) matches DBs, e.g. built via `ecc build-matches-db --shard K/N`')
+
+    parser.add_argument('matches_db', metavar='matches-db',
+                        help='Path to (output) merged matches DB')
+
+    parser.add_argument('--overwrite', dest='overwrite', action='store_true',
+                        help='Overwrite matches DB if it already exists')
+
+
+def run(args: Namespace):
+    """
+    - Print applied config
+    - Check if output files already exist
+    - Run actual program
+    """
+
+    shard_matches_dbs = args.shard_matches_dbs
+    matches_db = args.matches_db
+
+    overwrite = args.overwrite
+
+    python_hash_seed = os.getenv('PYTHONHASHSEED')
+
+    #
+    # Print applied config
+    #
+
+    print('Applied config:')
+    print('    {:20} {}'.format('shard-matches-dbs', shard_matches_dbs))
+    print('    {:20} {}'.format('matches-db', matches_db))
+    print()
+    print('    {:20} {}'.format('--overwrite', overwrite))
+    print()
+    print('    {:20} {}'.format('PYTHONHASHSEED', python_hash_seed))
+    print()
+
+    #
+    # Check if output files already exist
+    #
+
+    for shard_matches_db in shard_matches_dbs:
+        if not isfile(shard_matches_db):
+            print('Shard matches DB {} not found'.format(shard_matches_db))
+            exit()
+
+    text_storages = []
+    max_context_sizes = []
+    for shard_matches_db in shard_matches_dbs:
+        with sqlite3.connect(shard_matches_db) as shard_matches_conn:
+            text_storages.append(select_text_storage(shard_matches_conn))
+            max_context_sizes.append(select_window_storage(shard_matches_conn))
+
+    if any(text_storage != text_storages[0] for text_storage in text_storages):
+        print('Shard matches DBs store their page texts differently, see --compress-text and --text-chunk-size')
+        exit()
+
+    if any(max_context_size != max_context_sizes[0] for max_context_size in max_context_sizes):
+        print('Shard matches DBs store different windows of their page texts, see --store-windows')
+        exit()
+
+    if isfile(matches_db):
+        if overwrite:
+            remove(matches_db)
+        else:
+            print('Matches DB already exists, use --overwrite to overwrite it')
+            exit()
+
+    #
+    # Run actual program
+    #
+
+    _merge_matches_dbs(shard_matches_dbs, matches_db, text_storages[0], max_context_sizes[0])
+
+
+def _merge_matches_dbs(shard_matches_dbs, matches_db, text_storage, max_context_size):
+    """
+    Create the tables (including their PRIMARY KEY and UNIQUE constraints) in the merged
+    matches DB and bulk copy the shard matches DBs' rows into them
+    """
+
+    with sqlite3.connect(matches_db) as matches_conn:
+        create_pages_table(matches_conn)
+        create_matches_table(matches_conn)
+        create_mentions_table(matches_conn)
+        if text_storage:
+            create_text_storage_tables(matches_conn, text_storage)
+        if max_context_size is not None:
+            create_window_storage_table(matches_conn, max_context_size)
+        matches_conn.commit()
+
+        for shard_matches_db in shard_matches_dbs:
+            log('Merge {}'.format(shard_matches_db))
+            insert_from_matches_db(matches_conn, shard_matches_db)
+
+        pages_count = matches_conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+        matches_count = matches_conn.execute('SELECT COUNT(*) FROM matches').fetchone()[0]
+        mentions_count = matches_conn.execute('SELECT COUNT(*) FROM mentions').fetchone()[0]
+
+        log()
+        log('Merged {:,} pages, {:,} matches, {:,} mentions'.format(pages_count, matches_count, mentions_count))
+        log('Finished successfully')
@@ -0,0 +1,229 @@
+import os
+import sqlite3
+import time
+from argparse import ArgumentParser, Namespace
+from multiprocessing import Pool
+from os import remove
+from os.path import isfile
+from typing import Tuple, Optional
+
+from entity_context_crawler.cmd.build_matches_db import parse_page, get_default_workers
+from entity_context_crawler.dao.corpus_db import create_parsed_pages_table, insert_parsed_pages, ParsedPage, \
+    create_settings_table, insert_settings
+from entity_context_crawler.util.log import log
+from entity_context_crawler.util.nlp import NLP_PROFILES, load_nlp, has_sents
+from entity_context_crawler.util.wikitext import CONVERTERS
+from entity_context_crawler.util.wikipedia import Wikipedia, MultistreamWikipedia, get_multistream_index_path
+
+
+def add_parser_args(parser: ArgumentParser):
+    """
+    Add arguments to arg parser:
+        wiki-xml
+        corpus-db
+        --converter
+        --limit-pages
+        --nlp-batch-size
+        --overwrite
+        --spacy-model
+        --spacy-profile
+        --workers
+    """
+
+    parser.add_argument('wiki_xml', metavar='wiki-xml',
+                        help='Path to (input) Wikipedia XML or multistream Wikipedia XML BZ2 (with its index'
+                             ' next to it)')
+
+    parser.add_argument('corpus_db', metavar='corpus-db',
+                        help='Path to (output) corpus DB')
+
+    default_converter = 'wtp'
+    parser.add_argument('--converter', dest='converter', choices=list(CONVERTERS), default=default_converter,
+                        help='Markup to plain text converter, wtp = wikitextparser (reference), fast = single pass'
+                             ' approximation, see tools/compare_converters.py (default: {})'.format(default_converter))
+
+    default_limit_pages = None
+    parser.add_argument('--limit-pages', dest='limit_pages', type=int, metavar='INT', default=default_limit_pages,
+                        help='Early stop after ... pages (default: {})'.format(default_limit_pages))
+
+    default_nlp_batch_size = 256
+    parser.add_argument('--nlp-batch-size', dest='nlp_batch_size', type=int, metavar='INT',
+                        default=default_nlp_batch_size,
+                        help='Number of paragraphs the spaCy pipeline processes at once, 1 = one paragraph'
+                             ' at a time (default: {})'.format(default_nlp_batch_size))
+
+    parser.add_argument('--overwrite', dest='overwrite', action='store_true',
+                        help='Overwrite corpus DB if it already exists')
+
+    default_spacy_model = 'en_core_web_lg'
+    parser.add_argument('--spacy-model', dest='spacy_model', metavar='STR', default=default_spacy_model,
+                        help='Name of installed spaCy model or path to spaCy model directory'
+                             ' (default: {})'.format(default_spacy_model))
+
+    default_spacy_profile = 'full'
+    parser.add_argument('--spacy-profile', dest='spacy_profile', choices=list(NLP_PROFILES),
+                        default=default_spacy_profile,
+                        help='spaCy components to load, must set sentence boundaries, i.e. not tokenizer-only'
+                             ' (default: {})'.format(default_spacy_profile))
+
+    default_workers = None
+    parser.add_argument('--workers', dest='workers', type=int, metavar='INT', default=default_workers,
+                        help='Number of worker processes (default: {}, i.e. half the number of CPUs)'
+                        .format(default_workers))
+
+
+def run(args: Namespace):
+    """
+    - Print applied config
+    - Check if output files already exist
+    - Run actual program
+    """
+
+    wiki_xml = args.wiki_xml
+    corpus_db = args.corpus_db
+
+    converter = args.converter
+    limit_pages = args.limit_pages
+    nlp_batch_size = args.nlp_batch_size
+    overwrite = args.overwrite
+    spacy_model = args.spacy_model
+    spacy_profile = args.spacy_profile
+    workers = args.workers
+
+    python_hash_seed = os.getenv('PYTHONHASHSEED')
+
+    #
+    # Print applied config
+    #
+
+    print('Applied config:')
+    print('    {:20} {}'.format('wiki-xml', wiki_xml))
+    print('    {:20} {}'.format('corpus-db', corpus_db))
+    print()
+    print('    {:20} {}'.format('--converter', converter))
+    print('    {:20} {}'.format('--limit-pages', limit_pages))
+    print('    {:20} {}'.format('--nlp-batch-size', nlp_batch_size))
+    print('    {:20} {}'.format('--overwrite', overwrite))
+    print('    {:20} {}'.format('--spacy-model', spacy_model))
+    print('    {:20} {}'.format('--spacy-profile', spacy_profile))
+    print('    {:20} {}'.format('--workers', workers))
+    print()
+    print('    {:20} {}'.format('PYTHONHASHSEED', python_hash_seed))
+    print()
+
+    #
+    # Check if output files already exist
+    #
+
+    if not isfile(wiki_xml):
+        print('Wikipedia XML not found')
+        exit()
+
+    if wiki_xml.endswith('.bz2') and not isfile(get_multistream_index_path(wiki_xml)):
+        print('Multistream index not found')
+        exit()
+
+    if not has_sents(spacy_profile):
+        print('--spacy-profile {} does not set sentence boundaries, which are required to clean up the'
+              ' page texts'.format(spacy_profile))
+        exit()
+
+    if workers is not None and workers < 1:
+        print('--workers must be at least 1')
+        exit()
+
+    if isfile(corpus_db):
+        if overwrite:
+            remove(corpus_db)
+        else:
+            print('Corpus DB already exists, use --overwrite to overwrite it')
+            exit()
+
+    #
+    # Run actual program
+    #
+
+    _preprocess_wiki(wiki_xml, corpus_db, limit_pages, nlp_batch_size, spacy_model, spacy_profile, converter,
+                     workers if workers else get_default_workers())
+
+
+def _preprocess_wiki(wiki_xml, corpus_db, limit_pages, nlp_batch_size, spacy_model, spacy_profile, converter,
+                     workers: int, commit_pages: int = 1000):
+    """
+    Run the parse stage of `ecc build-matches-db` (everything that does not depend on the
+    entities) on all pages and store the parsed pages in the corpus DB
+    """
+
+    with sqlite3.connect(corpus_db) as corpus_conn:
+        create_parsed_pages_table(corpus_conn)
+        create_settings_table(corpus_conn)
+        insert_settings(corpus_conn, {'wiki_xml': wiki_xml, 'spacy_model': spacy_model,
+                                      'spacy_profile': spacy_profile, 'converter': converter})
+
+        if wiki_xml.endswith('.bz2'):
+            wikipedia = MultistreamWikipedia(wiki_xml, get_multistream_index_path(wiki_xml), limit_pages)
+            _preprocess_wikipedia(wikipedia, corpus_conn, nlp_batch_size, spacy_model, spacy_profile, converter,
+                                  workers, commit_pages)
+
+        else:
+            with open(wiki_xml, 'rb') as wiki_xml_fh:
+                wikipedia = Wikipedia(wiki_xml_fh, limit_pages)
+                _preprocess_wikipedia(wikipedia, corpus_conn, nlp_batch_size, spacy_model, spacy_profile,
+                                      converter, workers, commit_pages)
+
+        log()
+        log('Finished successfully')
+
+
+def _preprocess_wikipedia(wikipedia: Wikipedia, corpus_conn, nlp_batch_size, spacy_model, spacy_profile, converter,
+                          workers: int, commit_pages: int):
+
+    start_time = time.time()
+
+    init_args = (spacy_model, spacy_profile, nlp_batch_size, converter)
+    with Pool(workers, initializer=_init_worker, initargs=init_args) as pool:
+
+        positioned_pages = []
+        for position, (page_title, parsed_page, exception) in enumerate(pool.imap(_parse_page, wikipedia)):
+
+            if exception:
+                log('ERROR | {:9,} | {} | {}'.format(position, page_title, str(exception)))
+                continue
+
+            positioned_pages.append((position, parsed_page))
+
+            if len(positioned_pages) == commit_pages:
+                insert_parsed_pages(corpus_conn, positioned_pages)
+                corpus_conn.commit()
+                positioned_pages = []
+
+                log('{:,} pages | {:,.1f} pages/s'.format(position + 1, (position + 1) / (time.time() - start_time)))
+
+        insert_parsed_pages(corpus_conn, positioned_pages)
+        corpus_conn.commit()
+
+    print()
+    print('Stats')
+    print('\tSkipped special pages: {}'.format(wikipedia.skipped_special_pages))
+    print()
+
+
+worker_globals: Tuple = ()
+
+
+def _init_worker(spacy_model: str, spacy_profile: str, nlp_batch_size: int, converter: str):
+    global worker_globals
+
+    nlp = load_nlp(spacy_model, spacy_profile)
+
+    worker_globals = (nlp, nlp_batch_size, CONVERTERS[converter]())
+
+
+def _parse_page(page: dict) -> Tuple[str, Optional[ParsedPage], Optional[Exception]]:
+    nlp, nlp_batch_size, converter = worker_globals
+
+    try:
+        return page['title'], parse_page(nlp, page, nlp_batch_size, converter), None
+
+    except Exception as e:
+        return page['title'], None, e
@@ -0,0 +1,21 @@
+from typing import List, Tuple
+
+
+def load_aliases(path: str) -> List[Tuple[str, str]]:
+    """
+    :param path: path to aliases TXT, one tab separated 'MID alias' pair per line
+    :return: [(Freebase MID, alias)]
+    """
+
+    aliases = []
+
+    with open(path, encoding='utf-8') as fh:
+        for line in fh:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+
+            mid, alias = line.split('\t', 1)
+            aliases.append((mid, alias))
+
+    return aliases
@@ -0,0 +1,195 @@
+import json
+import sqlite3
+import zlib
+from dataclasses import dataclass
+from sqlite3 import Connection
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from entity_context_crawler.util.wikipedia import Wikipedia
+
+
+#
+# Corpus DB - Wikipedia pages preprocessed by `ecc preprocess-wiki`, i.e. everything
+# that does not depend on the entities. The page data is stored zlib-compressed.
+#
+
+@dataclass
+class ParsedPage:
+    title: str
+    text_len: int                           # Length of the plain text before the clean up
+    clean_text: str
+    sent_offsets: List[Tuple[int, int]]     # (start, end) of the sentences within the clean text
+    links: List[Tuple[str, Optional[str]]]  # (title, text) of the page's wikilinks, text is None if not given
+
+
+def is_corpus_db(path: str) -> bool:
+    with open(path, 'rb') as fh:
+        if fh.read(16) != b'SQLite format 3\x00':
+            return False
+
+    with sqlite3.connect(path) as conn:
+        sql = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'parsed_pages'"
+        return conn.execute(sql).fetchone()[0] == 1
+
+
+def create_parsed_pages_table(conn: Connection):
+    create_table_sql = '''
+        CREATE TABLE parsed_pages (
+            position INTEGER,   -- Position of page within corpus, starting at 0
+            title TEXT,
+            text_len INT,
+            clean_text_len INT,
+            link_count INT,
+            data BLOB,          -- zlib-compressed JSON [clean_text, sent_offsets, links]
+
+            PRIMARY KEY (position)
+        )
+    '''
+
+    create_title_index_sql = '''
+        CREATE INDEX parsed_pages_title_index
+        ON parsed_pages(title)
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(create_table_sql)
+    cursor.execute(create_title_index_sql)
+    cursor.close()
+
+
+def insert_parsed_pages(conn: Connection, positioned_pages: List[Tuple[int, ParsedPage]]):
+    sql = '''
+        INSERT INTO parsed_pages (position, title, text_len, clean_text_len, link_count, data)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+
+    cursor = conn.cursor()
+    rows = [(position, page.title, page.text_len, len(page.clean_text), len(page.links), _encode_data(page))
+            for position, page in positioned_pages]
+    cursor.executemany(sql, rows)
+    cursor.close()
+
+
+def select_parsed_pages(conn: Connection, start: int = None, stop: int = None) -> Iterator[ParsedPage]:
+    """
+    :param start: First page position (inclusive), None = from the beginning
+    :param stop: Last page position (exclusive), None = until the end
+
+    :return: Yield the pages within [start, stop), ordered by position
+    """
+
+    sql = '''
+        SELECT title, text_len, data
+        FROM parsed_pages
+        WHERE position >= ? AND position < ?
+        ORDER BY position
+    '''
+
+    start = start if start is not None else 0
+    stop = stop if stop is not None else 2 ** 63 - 1
+
+    cursor = conn.cursor()
+    cursor.execute(sql, (start, stop))
+
+    for title, text_len, data in cursor:
+        yield _decode_data(title, text_len, data)
+
+    cursor.close()
+
+
+def select_parsed_page(conn: Connection, title: str) -> Optional[ParsedPage]:
+    sql = '''
+        SELECT title, text_len, data
+        FROM parsed_pages
+        WHERE title = ?
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(sql, (title,))
+    row = cursor.fetchone()
+    cursor.close()
+
+    return _decode_data(*row) if row else None
+
+
+def _encode_data(page: ParsedPage) -> bytes:
+    data = [page.clean_text, page.sent_offsets, page.links]
+
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _decode_data(title: str, text_len: int, data: bytes) -> ParsedPage:
+    clean_text, sent_offsets, links = json.loads(zlib.decompress(data).decode('utf-8'))
+
+    return ParsedPage(title, text_len, clean_text, [tuple(offsets) for offsets in sent_offsets],
+                      [tuple(link) for link in links])
+
+
+class CorpusWikipedia(Wikipedia):
+    """
+    Iterate the pages of a corpus DB like the pages of a Wikipedia XML. As the pages are
+    already parsed, raw pages are not available (`ecc build-matches-db` rejects --raw-pages
+    for corpus DBs) and no pages are skipped.
+    """
+
+    def __init__(self, conn: Connection, start: int = None, stop: int = None, limit_pages: int = None):
+        self.conn = conn
+        self.start = start
+        self.stop = stop
+        self.limit_pages = limit_pages
+
+    def __iter__(self) -> Iterator[ParsedPage]:
+        for count, parsed_page in enumerate(select_parsed_pages(self.conn, self.start, self.stop)):
+            if self.limit_pages and count == self.limit_pages:
+                break
+
+            self.read_pages = count + 1
+
+            yield parsed_page
+
+    def _get_dump_progress(self) -> Optional[float]:
+        return None
+
+
+#
+# Settings
+#
+
+def create_settings_table(conn: Connection):
+    sql = '''
+        CREATE TABLE settings (
+            key TEXT,
+            value TEXT,
+
+            PRIMARY KEY (key)
+        )
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    cursor.close()
+
+
+def insert_settings(conn: Connection, settings: Dict[str, str]):
+    sql = '''
+        INSERT OR REPLACE INTO settings (key, value)
+        VALUES (?, ?)
+    '''
+
+    cursor = conn.cursor()
+    cursor.executemany(sql, settings.items())
+    cursor.close()
+
+
+def select_settings(conn: Connection) -> Dict[str, str]:
+    sql = '''
+        SELECT key, value
+        FROM settings
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    settings = dict(cursor.fetchall())
+    cursor.close()
+
+    return settings
@@ -0,0 +1,287 @@
+import json
+import mmap
+import struct
+import urllib.parse
+from array import array
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+#
+# Entity index - compact binary representation of the Freebase JSON (and the mid2rid TXT)
+# built by `ecc compile-entities`. It is memory-mapped, so that the processes reading it
+# share its pages via the OS page cache, and it is ready to use without parsing.
+#
+# Layout (header little-endian, arrays in native byte order, all sections 8-byte aligned):
+#
+#   header          magic, counts and byte offsets of the sections, see HEADER
+#   string offsets  uint64[string_count + 1], string i = blob[offsets[i]:offsets[i + 1]]
+#   string blob     UTF-8 encoded, interned (i.e. unique) strings
+#   mids            uint32[entity_count], string ID of each entity's MID
+#   labels          uint32[entity_count], string ID of each entity's label
+#   titles          uint32[entity_count], string ID of each entity's page title, NO_STRING if none
+#   rids            int64[entity_count], each entity's RID, -1 if none
+#   mid order       uint32[entity_count], entity IDs sorted by MID
+#   title order     uint32[title_count], entity IDs sorted by page title (last entity per title)
+#
+# The entities are stored in the order of the Freebase JSON.
+#
+
+MAGIC = b'ECCENT01'
+
+HEADER = struct.Struct('<8s11Q')
+
+NO_STRING = 0xFFFFFFFF
+
+
+@dataclass
+class Entity:
+    mid: str
+    label: str
+    page_title: Optional[str]   # Title of the entity's Wikipedia page, None if unknown
+    rid: Optional[int]          # None if not in mid2rid TXT
+
+
+def get_page_title(page_url: str) -> str:
+    """
+    Get page title from Wikipedia URL, e.g. 'https://en.wikipedia.org/wiki/AT%26T_Inc.' -> 'AT&T Inc.'
+    """
+
+    decoded_page_url = urllib.parse.unquote(page_url)
+
+    return decoded_page_url.rsplit('/', 1)[-1].replace('_', ' ')
+
+
+def load_entities(freebase_json: str, mid2rid: Dict[str, int] = None) -> List[Entity]:
+    """
+    :return: Entities in the order of the Freebase JSON
+    """
+
+    with open(freebase_json, 'r', encoding='utf-8') as f:
+        freebase_data = json.load(f)
+
+    mid2rid = mid2rid or {}
+
+    return [Entity(mid,
+                   entity_data['label'],
+                   get_page_title(entity_data['wikipedia']) if entity_data['wikipedia'] else None,
+                   mid2rid.get(mid))
+            for mid, entity_data in freebase_data.items()]
+
+
+def is_entity_index(path: str) -> bool:
+    with open(path, 'rb') as fh:
+        return fh.read(len(MAGIC)) == MAGIC
+
+
+def write_entity_index(path: str, entities: List[Entity]):
+    string_ids: Dict[str, int] = {}
+
+    def intern(string: Optional[str]) -> int:
+        if string is None:
+            return NO_STRING
+
+        return string_ids.setdefault(string, len(string_ids))
+
+    mids = array('I', (intern(entity.mid) for entity in entities))
+    labels = array('I', (intern(entity.label) for entity in entities))
+    titles = array('I', (intern(entity.page_title) for entity in entities))
+    rids = array('q', (entity.rid if entity.rid is not None else -1 for entity in entities))
+
+    encoded_strings = [string.encode('utf-8') for string in string_ids]
+
+    string_offsets = array('Q', [0])
+    for encoded_string in encoded_strings:
+        string_offsets.append(string_offsets[-1] + len(encoded_string))
+
+    string_blob = b''.join(encoded_strings)
+
+    # Comparing the UTF-8 encoded strings gives the same order as comparing the strings
+    mid_order = array('I', sorted(range(len(entities)), key=lambda i: encoded_strings[mids[i]]))
+
+    # Later entities overwrite earlier ones with the same page title, like in a dict
+    title_to_entity = {titles[i]: i for i in range(len(entities)) if titles[i] != NO_STRING}
+    title_order = array('I', sorted(title_to_entity.values(), key=lambda i: encoded_strings[titles[i]]))
+
+    sections = [string_offsets, string_blob, mids, labels, titles, rids, mid_order, title_order]
+
+    with open(path, 'wb') as fh:
+        fh.write(bytes(HEADER.size))
+
+        section_offsets = []
+        for section in sections:
+            fh.write(bytes(-fh.tell() % 8))
+            section_offsets.append(fh.tell())
+
+            fh.write(section if isinstance(section, bytes) else section.tobytes())
+
+        rid_count = sum(1 for rid in rids if rid >= 0)
+
+        fh.seek(0)
+        fh.write(HEADER.pack(MAGIC, len(entities), len(encoded_strings), len(title_order), rid_count,
+                             *section_offsets[:1], *section_offsets[2:]))
+
+
+class EntityIndex:
+    """
+    Read-only, memory-mapped entity index, see write_entity_index(). Lookups are binary searches
+    on the mapped arrays, so that no per-process copies of the tables are needed. Pickling only
+    pickles the path, i.e. the index is reopened (and thereby shared) in spawned processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, 'rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, entity_count, string_count, title_count, rid_count, string_offsets_pos, mids_pos, labels_pos, \
+            titles_pos, rids_pos, mid_order_pos, title_order_pos = HEADER.unpack_from(self._mmap)
+
+        if magic != MAGIC:
+            raise ValueError('{} is not an entity index'.format(path))
+
+        string_blob_pos = string_offsets_pos + (string_count + 1) * 8
+
+        def view(pos: int, count: int, typecode: str) -> memoryview:
+            return memoryview(self._mmap)[pos:pos + count * struct.calcsize(typecode)].cast(typecode)
+
+        self._string_offsets = view(string_offsets_pos, string_count + 1, 'Q')
+        self._string_blob = memoryview(self._mmap)[string_blob_pos:]
+        self._mids = view(mids_pos, entity_count, 'I')
+        self._labels = view(labels_pos, entity_count, 'I')
+        self._titles = view(titles_pos, entity_count, 'I')
+        self._rids = view(rids_pos, entity_count, 'q')
+        self._mid_order = view(mid_order_pos, entity_count, 'I')
+        self._title_order = view(title_order_pos, title_count, 'I')
+
+        self._rid_count = rid_count
+
+        self.entities = _Entities(self)
+        self.title_to_mid = _TitleToMid(self)
+        self.mid_to_label = _MidToLabel(self)
+        self.mid_to_rid = _MidToRid(self)
+
+    def __reduce__(self):
+        return EntityIndex, (self.path,)
+
+    def _get_string_bytes(self, string_id: int) -> bytes:
+        return bytes(self._string_blob[self._string_offsets[string_id]:self._string_offsets[string_id + 1]])
+
+    def _get_string(self, string_id: int) -> Optional[str]:
+        if string_id == NO_STRING:
+            return None
+
+        return self._get_string_bytes(string_id).decode('utf-8')
+
+    def _find(self, order: memoryview, column: memoryview, key: str) -> Optional[int]:
+        """
+        :return: ID of the entity whose column string equals the key, None if there is none
+        """
+
+        encoded_key = key.encode('utf-8')
+
+        lo, hi = 0, len(order)
+        while lo < hi:
+            middle = (lo + hi) // 2
+            entity_id = order[middle]
+            middle_key = self._get_string_bytes(column[entity_id])
+
+            if middle_key < encoded_key:
+                lo = middle + 1
+            elif middle_key > encoded_key:
+                hi = middle
+            else:
+                return entity_id
+
+        return None
+
+    def _find_by_mid(self, mid: str) -> Optional[int]:
+        return self._find(self._mid_order, self._mids, mid)
+
+    def _find_by_title(self, title: str) -> Optional[int]:
+        return self._find(self._title_order, self._titles, title)
+
+    def _get_entity(self, entity_id: int) -> Entity:
+        rid = self._rids[entity_id]
+
+        return Entity(self._get_string(self._mids[entity_id]),
+                      self._get_string(self._labels[entity_id]),
+                      self._get_string(self._titles[entity_id]),
+                      rid if rid >= 0 else None)
+
+
+class _Entities(Sequence):
+    """ Entities in the order of the Freebase JSON """
+
+    def __init__(self, index: EntityIndex):
+        self.index = index
+
+    def __getitem__(self, entity_id: int) -> Entity:
+        if not 0 <= entity_id < len(self):
+            raise IndexError(entity_id)
+
+        return self.index._get_entity(entity_id)
+
+    def __len__(self) -> int:
+        return len(self.index._mids)
+
+
+class _TitleToMid(Mapping):
+    def __init__(self, index: EntityIndex):
+        self.index = index
+
+    def __getitem__(self, title: str) -> str:
+        entity_id = self.index._find_by_title(title)
+        if entity_id is None:
+            raise KeyError(title)
+
+        return self.index._get_string(self.index._mids[entity_id])
+
+    def __iter__(self) -> Iterator[str]:
+        for entity_id in self.index._title_order:
+            yield self.index._get_string(self.index._titles[entity_id])
+
+    def __len__(self) -> int:
+        return len(self.index._title_order)
+
+
+class _MidToLabel(Mapping):
+    def __init__(self, index: EntityIndex):
+        self.index = index
+
+    def __getitem__(self, mid: str) -> str:
+        entity_id = self.index._find_by_mid(mid)
+        if entity_id is None:
+            raise KeyError(mid)
+
+        return self.index._get_string(self.index._labels[entity_id])
+
+    def __iter__(self) -> Iterator[str]:
+        for entity_id in self.index._mid_order:
+            yield self.index._get_string(self.index._mids[entity_id])
+
+    def __len__(self) -> int:
+        return len(self.index._mid_order)
+
+
+class _MidToRid(Mapping):
+    """ Only contains the entities with RID """
+
+    def __init__(self, index: EntityIndex):
+        self.index = index
+
+    def __getitem__(self, mid: str) -> int:
+        entity_id = self.index._find_by_mid(mid)
+        if entity_id is None or self.index._rids[entity_id] < 0:
+            raise KeyError(mid)
+
+        return self.index._rids[entity_id]
+
+    def __iter__(self) -> Iterator[str]:
+        for entity_id in self.index._mid_order:
+            if self.index._rids[entity_id] >= 0:
+                yield self.index._get_string(self.index._mids[entity_id])
+
+    def __len__(self) -> int:
+        return self.index._rid_count
@@ -1,6 +1,21 @@
-from dataclasses import dataclass
+import random
+import sqlite3
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
 from sqlite3 import Connection
-from typing import List, Tuple
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from entity_context_crawler.util.compression import compress, decompress
+
+
+def is_matches_db(path: str) -> bool:
+    with open(path, 'rb') as fh:
+        if fh.read(16) != b'SQLite format 3\x00':
+            return False
+
+    with sqlite3.connect(path) as conn:
+        sql = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'mentions'"
+        return conn.execute(sql).fetchone()[0] == 1
 
 
 #
@@ -21,8 +36,9 @@ class PageStats:
 @dataclass
 class Page:
     title: str
-    text: str
+    text: Optional[str]     # None if the text is stored compressed, see text_chunks
     stats: PageStats
+    text_chunks: Optional[List[bytes]] = None   # Compressed text, see TextStorage
 
 
 def create_pages_table(conn: Connection):
@@ -61,6 +77,161 @@ def insert_page(conn: Connection, page: Page):
                          page.stats.clean_text_len, page.stats.match_count))
     cursor.close()
 
+    if page.text_chunks is not None:
+        insert_page_text_chunks(conn, [page])
+
+
+def insert_pages(conn: Connection, pages: List[Page]):
+    sql = '''
+        INSERT OR IGNORE INTO pages (title, text, link_count, entity_link_count, mention_count, unique_mention_count,
+                                     text_len, clean_text_len, match_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    cursor = conn.cursor()
+    rows = [(p.title, p.text, p.stats.link_count, p.stats.entity_link_count, p.stats.mention_count,
+             p.stats.unique_mention_count, p.stats.text_len, p.stats.clean_text_len, p.stats.match_count)
+            for p in pages]
+    cursor.executemany(sql, rows)
+    cursor.close()
+
+    compressed_pages = [p for p in pages if p.text_chunks is not None]
+    if compressed_pages:
+        insert_page_text_chunks(conn, compressed_pages)
+
+
+#
+# Compressed page texts
+#
+
+@dataclass
+class TextStorage:
+    """
+    Page texts compressed in chunks of 'chunk_size' chars each, so that a window of a text
+    can be read by decompressing only the chunks it overlaps instead of the whole text
+    """
+
+    compression: str            # See util.compression
+    chunk_size: Optional[int]   # Chars per chunk, None = whole text in a single chunk
+
+    def compress(self, text: str) -> List[bytes]:
+        chunk_size = self.chunk_size if self.chunk_size else max(len(text), 1)
+
+        return [compress(text[start:start + chunk_size].encode('utf-8'), self.compression)
+                for start in range(0, len(text), chunk_size)]
+
+    def decompress(self, data: bytes) -> str:
+        return decompress(data, self.compression).decode('utf-8')
+
+
+def compress_page(page: Page, text_storage: TextStorage) -> Page:
+    return Page(page.title, None, page.stats, text_storage.compress(page.text))
+
+
+def create_text_storage_tables(conn: Connection, text_storage: TextStorage):
+    create_text_storage_table_sql = '''
+        CREATE TABLE text_storage (
+            compression TEXT,   -- 'zlib' or 'zstd'
+            chunk_size INT      -- Chars per chunk, NULL = whole text in a single chunk
+        )
+    '''
+
+    insert_text_storage_sql = '''
+        INSERT INTO text_storage (compression, chunk_size)
+        VALUES (?, ?)
+    '''
+
+    create_page_text_chunks_table_sql = '''
+        CREATE TABLE page_text_chunks (
+            page TEXT,          -- Wikipedia page title, the page's text in the pages table is NULL
+            chunk INT,          -- Chunk index, chunk i holds the text's chars [i * chunk_size, (i + 1) * chunk_size)
+            data BLOB,          -- Compressed UTF-8 text
+
+            FOREIGN KEY (page) REFERENCES pages (title),
+            PRIMARY KEY (page, chunk)
+        )
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(create_text_storage_table_sql)
+    cursor.execute(insert_text_storage_sql, (text_storage.compression, text_storage.chunk_size))
+    cursor.execute(create_page_text_chunks_table_sql)
+    cursor.close()
+
+
+def select_text_storage(conn: Connection) -> Optional[TextStorage]:
+    """
+    :return: Text storage, None if the page texts are stored uncompressed in the pages table
+    """
+
+    select_table_sql = '''
+        SELECT COUNT(*)
+        FROM sqlite_master
+        WHERE type = 'table' AND name = 'text_storage'
+    '''
+
+    select_text_storage_sql = '''
+        SELECT compression, chunk_size
+        FROM text_storage
+    '''
+
+    cursor = conn.cursor()
+
+    cursor.execute(select_table_sql)
+    if cursor.fetchone()[0] == 0:
+        cursor.close()
+        return None
+
+    cursor.execute(select_text_storage_sql)
+    compression, chunk_size = cursor.fetchone()
+    cursor.close()
+
+    return TextStorage(compression, chunk_size)
+
+
+def insert_page_text_chunks(conn: Connection, pages: List[Page]):
+    sql = '''
+        INSERT OR IGNORE INTO page_text_chunks (page, chunk, data)
+        VALUES (?, ?, ?)
+    '''
+
+    cursor = conn.cursor()
+    rows = [(p.title, chunk, data) for p in pages for chunk, data in enumerate(p.text_chunks)]
+    cursor.executemany(sql, rows)
+    cursor.close()
+
+
+def select_text_window(conn: Connection, text_storage: TextStorage, page_title: str, start: int, end: int) -> str:
+    """
+    Decompress only the chunks overlapping the window
+
+    :return: Page text's chars [start, end), clipped to the text
+    """
+
+    sql = '''
+        SELECT data
+        FROM page_text_chunks
+        WHERE page = ? AND chunk >= ? AND chunk <= ?
+        ORDER BY chunk
+    '''
+
+    if end <= start:
+        return ''
+
+    if text_storage.chunk_size:
+        first_chunk = start // text_storage.chunk_size
+        last_chunk = (end - 1) // text_storage.chunk_size
+        offset = first_chunk * text_storage.chunk_size
+    else:
+        first_chunk, last_chunk, offset = 0, 0, 0
+
+    cursor = conn.cursor()
+    cursor.execute(sql, (page_title, first_chunk, last_chunk))
+    text = ''.join(text_storage.decompress(row[0]) for row in cursor.fetchall())
+    cursor.close()
+
+    return text[start - offset:end - offset]
+
 
 #
 # Matches
@@ -110,6 +281,116 @@ def insert_match(conn: Connection, match: Match):
     cursor.close()
 
 
+def insert_matches(conn: Connection, matches: List[Match]):
+    sql = '''
+        INSERT INTO matches (mid, entity_label, mention, page, start_char, end_char, context)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    cursor = conn.cursor()
+    rows = [(m.mid, m.entity_label, m.mention, m.page, m.start_char, m.end_char, m.context) for m in matches]
+    cursor.executemany(sql, rows)
+    cursor.close()
+
+
+#
+# Match windows
+#
+
+WINDOW_SEPARATOR = '\n\n'
+
+
+def cut_windows(page: Page, matches: List[Match], max_context_size: int) -> Tuple[Page, List[Match]]:
+    """
+    Replace the page's text by the windows of 'max_context_size' chars before and after each
+    match, merging overlapping windows and joining them by WINDOW_SEPARATOR, and remap the
+    matches' char offsets to the new text. Contexts of up to 'max_context_size' chars around
+    the matches, see select_contexts(), stay the same. The page stats still describe the whole
+    page.
+    """
+
+    text = page.text
+
+    # [start, end) of the merged windows within the page's text, and each match's window
+    windows = []
+    match_windows = [0] * len(matches)
+    for i in sorted(range(len(matches)), key=lambda i: matches[i].start_char):
+        start = max(matches[i].start_char - max_context_size, 0)
+        end = min(matches[i].end_char + max_context_size, len(text))
+
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+
+        match_windows[i] = len(windows) - 1
+
+    # Shift of the offsets within each window from the page's text to the new text
+    window_texts = []
+    window_shifts = []
+    window_text_start = 0
+    for start, end in windows:
+        window_texts.append(text[start:end])
+        window_shifts.append(window_text_start - start)
+        window_text_start += end - start + len(WINDOW_SEPARATOR)
+
+    windowed_matches = [replace(match, start_char=match.start_char + window_shifts[window],
+                                end_char=match.end_char + window_shifts[window])
+                        for match, window in zip(matches, match_windows)]
+
+    windowed_page = Page(page.title, WINDOW_SEPARATOR.join(window_texts), page.stats)
+
+    return windowed_page, windowed_matches
+
+
+def create_window_storage_table(conn: Connection, max_context_size: int):
+    create_window_storage_table_sql = '''
+        CREATE TABLE window_storage (
+            max_context_size INT    -- The pages' texts only hold the windows of ... chars around the matches
+        )
+    '''
+
+    insert_window_storage_sql = '''
+        INSERT INTO window_storage (max_context_size)
+        VALUES (?)
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(create_window_storage_table_sql)
+    cursor.execute(insert_window_storage_sql, (max_context_size,))
+    cursor.close()
+
+
+def select_window_storage(conn: Connection) -> Optional[int]:
+    """
+    :return: Max context size, None if the matches DB stores the whole pages, see cut_windows()
+    """
+
+    select_table_sql = '''
+        SELECT COUNT(*)
+        FROM sqlite_master
+        WHERE type = 'table' AND name = 'window_storage'
+    '''
+
+    select_window_storage_sql = '''
+        SELECT max_context_size
+        FROM window_storage
+    '''
+
+    cursor = conn.cursor()
+
+    cursor.execute(select_table_sql)
+    if cursor.fetchone()[0] == 0:
+        cursor.close()
+        return None
+
+    cursor.execute(select_window_storage_sql)
+    max_context_size = cursor.fetchone()[0]
+    cursor.close()
+
+    return max_context_size
+
+
 #
 # Mentions
 #
@@ -154,6 +435,18 @@ def insert_or_ignore_mention(conn: Connection, mention: Mention):
     cursor.close()
 
 
+def insert_or_ignore_mentions(conn: Connection, mentions: List[Mention]):
+    sql = '''
+        INSERT OR IGNORE INTO mentions (mid, entity_label, mention)
+        VALUES (?, ?, ?)
+    '''
+
+    cursor = conn.cursor()
+    rows = [(m.mid, m.entity_label, m.mention) for m in mentions]
+    cursor.executemany(sql, rows)
+    cursor.close()
+
+
 def select_entity_mentions(conn: Connection, mid: str) -> List[str]:
     sql = '''
         SELECT DISTINCT mention
@@ -169,6 +462,281 @@ def select_entity_mentions(conn: Connection, mid: str) -> List[str]:
     return [row[0] for row in rows]
 
 
+def select_mentions(conn: Connection) -> List[Tuple[str, str]]:
+    """
+    :return: [(mid, mention)] of all entities
+    """
+
+    sql = '''
+        SELECT DISTINCT mid, mention
+        FROM mentions
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    rows = cursor.fetchall()
+    cursor.close()
+
+    return [(row[0], row[1]) for row in rows]
+
+
+#
+# Checkpoint
+#
+
+@dataclass
+class Checkpoint:
+    """
+    Progress of build-matches-db. As the pages are processed out of order, the progress
+    is given by a low watermark plus the processed pages above the low watermark.
+    """
+
+    low_watermark: int = 0  # All pages at positions < low_watermark are processed
+    positions: Set[int] = field(default_factory=set)  # Processed pages at positions > low_watermark
+
+    def is_done(self, position: int) -> bool:
+        return position < self.low_watermark or position in self.positions
+
+    def copy(self) -> 'Checkpoint':
+        return Checkpoint(self.low_watermark, set(self.positions))
+
+    def add(self, position: int):
+        self.positions.add(position)
+
+        while self.low_watermark in self.positions:
+            self.positions.remove(self.low_watermark)
+            self.low_watermark += 1
+
+
+def create_checkpoint_tables(conn: Connection):
+    create_checkpoint_table_sql = '''
+        CREATE TABLE checkpoint (
+            low_watermark INT   -- All pages at positions < low_watermark are processed
+        )
+    '''
+
+    create_checkpoint_positions_table_sql = '''
+        CREATE TABLE checkpoint_positions (
+            position INT,       -- Processed page at position > low_watermark
+
+            PRIMARY KEY (position)
+        )
+    '''
+
+    insert_checkpoint_sql = '''
+        INSERT INTO checkpoint (low_watermark)
+        VALUES (0)
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(create_checkpoint_table_sql)
+    cursor.execute(create_checkpoint_positions_table_sql)
+    cursor.execute(insert_checkpoint_sql)
+    cursor.close()
+
+
+def update_checkpoint(conn: Connection, checkpoint: Checkpoint):
+    update_checkpoint_sql = '''
+        UPDATE checkpoint
+        SET low_watermark = ?
+    '''
+
+    delete_checkpoint_positions_sql = '''
+        DELETE FROM checkpoint_positions
+    '''
+
+    insert_checkpoint_positions_sql = '''
+        INSERT INTO checkpoint_positions (position)
+        VALUES (?)
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(update_checkpoint_sql, (checkpoint.low_watermark,))
+    cursor.execute(delete_checkpoint_positions_sql)
+    cursor.executemany(insert_checkpoint_positions_sql, [(position,) for position in checkpoint.positions])
+    cursor.close()
+
+
+def select_checkpoint(conn: Connection) -> Optional[Checkpoint]:
+    """
+    :return: Checkpoint, None if the matches DB has no checkpoint tables
+    """
+
+    select_tables_sql = '''
+        SELECT name
+        FROM sqlite_master
+        WHERE type = 'table' AND name IN ('checkpoint', 'checkpoint_positions')
+    '''
+
+    select_checkpoint_sql = '''
+        SELECT low_watermark
+        FROM checkpoint
+    '''
+
+    select_checkpoint_positions_sql = '''
+        SELECT position
+        FROM checkpoint_positions
+    '''
+
+    cursor = conn.cursor()
+
+    cursor.execute(select_tables_sql)
+    if len(cursor.fetchall()) != 2:
+        cursor.close()
+        return None
+
+    cursor.execute(select_checkpoint_sql)
+    low_watermark = cursor.fetchone()[0]
+
+    cursor.execute(select_checkpoint_positions_sql)
+    positions = {row[0] for row in cursor.fetchall()}
+
+    cursor.close()
+
+    return Checkpoint(low_watermark, positions)
+
+
+#
+# Merge
+#
+
+def insert_from_matches_db(conn: Connection, other_matches_db: str):
+    """
+    Bulk copy pages, matches and mentions from another matches DB by attaching it and
+    running 'INSERT ... SELECT' per table. Both matches DBs must store the page texts the same
+    way, see TextStorage. Rows that violate the tables' PRIMARY KEY or
+    UNIQUE constraints, e.g. pages that are contained in multiple matches DBs, are ignored.
+    """
+
+    attach_sql = '''
+        ATTACH DATABASE ? AS other
+    '''
+
+    insert_pages_sql = '''
+        INSERT OR IGNORE INTO pages (title, text, link_count, entity_link_count, mention_count, unique_mention_count,
+                                     text_len, clean_text_len, match_count)
+        SELECT title, text, link_count, entity_link_count, mention_count, unique_mention_count,
+               text_len, clean_text_len, match_count
+        FROM other.pages
+    '''
+
+    insert_matches_sql = '''
+        INSERT OR IGNORE INTO matches (mid, entity_label, mention, page, start_char, end_char, context)
+        SELECT mid, entity_label, mention, page, start_char, end_char, context
+        FROM other.matches
+    '''
+
+    insert_mentions_sql = '''
+        INSERT OR IGNORE INTO mentions (mid, entity_label, mention)
+        SELECT mid, entity_label, mention
+        FROM other.mentions
+    '''
+
+    insert_page_text_chunks_sql = '''
+        INSERT OR IGNORE INTO page_text_chunks (page, chunk, data)
+        SELECT page, chunk, data
+        FROM other.page_text_chunks
+    '''
+
+    detach_sql = '''
+        DETACH DATABASE other
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(attach_sql, (other_matches_db,))
+    cursor.execute(insert_pages_sql)
+    cursor.execute(insert_matches_sql)
+    cursor.execute(insert_mentions_sql)
+    if select_text_storage(conn):
+        cursor.execute(insert_page_text_chunks_sql)
+    conn.commit()
+    cursor.execute(detach_sql)
+    cursor.close()
+
+
+def select_max_rowids(conn: Connection) -> Dict[str, int]:
+    """
+    :return: Table -> max rowid (0 if empty) for the existing tables that are only appended to,
+             i.e. pages, matches, mentions and page_text_chunks
+    """
+
+    select_tables_sql = '''
+        SELECT name
+        FROM sqlite_master
+        WHERE type = 'table' AND name IN ('pages', 'matches', 'mentions', 'page_text_chunks')
+    '''
+
+    cursor = conn.cursor()
+
+    cursor.execute(select_tables_sql)
+    tables = [row[0] for row in cursor.fetchall()]
+
+    max_rowids = {}
+    for table in tables:
+        cursor.execute('SELECT COALESCE(MAX(rowid), 0) FROM {}'.format(table))
+        max_rowids[table] = cursor.fetchone()[0]
+
+    cursor.close()
+
+    return max_rowids
+
+
+def insert_into_matches_db(conn: Connection, other_matches_db: str, after_rowids: Dict[str, int]) -> Dict[str, int]:
+    """
+    Incrementally copy a matches DB to another one with the same tables (e.g. an in-memory DB
+    to its copy on disk): Append the rows added since the last copy, i.e. the rows whose rowid
+    is greater than 'after_rowids', and replace the checkpoint, all within one transaction. This
+    relies on the rows only being appended, so that their rowids only increase.
+
+    :param after_rowids: Max rowids at the last copy, see select_max_rowids()
+    :return: Max rowids after this copy
+    """
+
+    attach_sql = '''
+        ATTACH DATABASE ? AS other
+    '''
+
+    insert_rows_sql = '''
+        INSERT OR IGNORE INTO other.{table}
+        SELECT *
+        FROM main.{table}
+        WHERE rowid > ? AND rowid <= ?
+    '''
+
+    delete_checkpoint_sql = '''
+        DELETE FROM other.{table}
+    '''
+
+    insert_checkpoint_sql = '''
+        INSERT INTO other.{table}
+        SELECT *
+        FROM main.{table}
+    '''
+
+    detach_sql = '''
+        DETACH DATABASE other
+    '''
+
+    max_rowids = select_max_rowids(conn)
+
+    cursor = conn.cursor()
+    cursor.execute(attach_sql, (other_matches_db,))
+
+    for table, max_rowid in max_rowids.items():
+        cursor.execute(insert_rows_sql.format(table=table), (after_rowids.get(table, 0), max_rowid))
+
+    if select_checkpoint(conn):
+        for table in ['checkpoint', 'checkpoint_positions']:
+            cursor.execute(delete_checkpoint_sql.format(table=table))
+            cursor.execute(insert_checkpoint_sql.format(table=table))
+
+    conn.commit()
+    cursor.execute(detach_sql)
+    cursor.close()
+
+    return max_rowids
+
+
 #
 # Pages x Matches
 #
@@ -180,6 +748,10 @@ def select_contexts(conn: Connection, mid: str, size: int) -> List[Tuple[str, st
     :return [(context, page_title, mention)]
     """
 
+    text_storage = select_text_storage(conn)
+    if text_storage:
+        return _select_compressed_contexts(conn, text_storage, mid, size)
+
     sql = '''
         -- SELECT context = [max <size> chars] + [entity] + [max <size> chars]
 
@@ -198,3 +770,247 @@ def select_contexts(conn: Connection, mid: str, size: int) -> List[Tuple[str, st
     cursor.close()
 
     return [(row[0], row[1], row[2]) for row in rows]
+
+
+def _select_compressed_contexts(conn: Connection, text_storage: TextStorage, mid: str, size: int) \
+        -> List[Tuple[str, str, str]]:
+    """
+    Same as select_contexts(), but extract the contexts from the compressed page texts in Python
+    """
+
+    sql = '''
+        SELECT page, start_char, end_char, mention
+        FROM matches
+        WHERE mid = ?
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(sql, (mid,))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    return [(select_text_window(conn, text_storage, page, max(start_char - size, 0), end_char + size), page, mention)
+            for page, start_char, end_char, mention in rows]
+
+
+def sample_match_rowids(conn: Connection, mid: str, limit: Optional[int], rng: random.Random) -> Tuple[List[int], int]:
+    """
+    Sample the entity's matches without reading their pages. The rowids are read from the
+    matches' primary key index (index-only scan) and sampled via reservoir sampling, so that
+    only 'limit' rowids are kept in memory. The index order makes the sample reproducible for
+    a given RNG state. See select_contexts_by_rowids() to fetch the sampled contexts.
+
+    :param limit: Sample size, None = all matches
+    :return: (rowids in random order, number of the entity's matches)
+    """
+
+    sql = '''
+        SELECT rowid
+        FROM matches
+        WHERE mid = ?
+        ORDER BY page, start_char, mention
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(sql, (mid,))
+
+    reservoir = []
+    match_count = 0
+
+    for match_count, (rowid,) in enumerate(cursor, start=1):
+        if limit is None or len(reservoir) < limit:
+            reservoir.append(rowid)
+        else:
+            i = rng.randrange(match_count)
+            if i < limit:
+                reservoir[i] = rowid
+
+    cursor.close()
+
+    rng.shuffle(reservoir)
+
+    return reservoir, match_count
+
+
+class PageTextCache:
+    """
+    LRU cache of page texts, or of the decompressed chunks of compressed page texts (see
+    TextStorage), bounded by the total number of chars. Keeps the texts of hub pages, which
+    the matches of many entities are on, across calls of select_contexts_by_rowids().
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.chars = 0
+
+        # (page title, chunk) -> text, least recently used first. Uncompressed page texts are chunk 0.
+        self.texts = OrderedDict()
+
+    def get(self, key: Tuple[str, int]) -> Optional[str]:
+        text = self.texts.get(key)
+        if text is not None:
+            self.texts.move_to_end(key)
+
+        return text
+
+    def put(self, key: Tuple[str, int], text: str):
+        if key in self.texts or len(text) > self.max_chars:
+            return
+
+        self.texts[key] = text
+        self.chars += len(text)
+
+        while self.chars > self.max_chars:
+            _, evicted_text = self.texts.popitem(last=False)
+            self.chars -= len(evicted_text)
+
+
+def select_contexts_by_rowids(conn: Connection, rowids: Sequence[int], size: int,
+                              page_cache: Optional[PageTextCache] = None) -> Dict[int, Tuple[str, str, str]]:
+    """
+    Same as select_contexts(), but for the given matches only. Instead of a SUBSTR (or a
+    decompression) per match, the matches are grouped by page, the text of each page (or each
+    chunk that a window overlaps) is read at most once and the windows are cut in Python.
+
+    :param rowids: Rowids of the matches, e.g. of several entities, see sample_match_rowids()
+    :param page_cache: Keeps the texts across calls, None = only within this call
+    :return: {rowid: (context, page_title, mention)} in the order of the rowids, without the
+             matches whose page is missing
+    """
+
+    sql = '''
+        SELECT rowid, page, start_char, end_char, mention
+        FROM matches
+        WHERE rowid IN ({})
+    '''
+
+    text_storage = select_text_storage(conn)
+    chunk_size = text_storage.chunk_size if text_storage else None
+
+    # Rowid -> (page title, window start, window end, mention)
+    rowid_to_window = {}
+
+    cursor = conn.cursor()
+
+    # Stay below SQLite's default limit of 999 variables per statement
+    for start in range(0, len(rowids), 500):
+        batch = rowids[start:start + 500]
+        cursor.execute(sql.format(', '.join('?' * len(batch))), batch)
+
+        for rowid, page, start_char, end_char, mention in cursor.fetchall():
+            rowid_to_window[rowid] = (page, max(start_char - size, 0), end_char + size, mention)
+
+    cursor.close()
+
+    # Page title -> chunks overlapped by the page's windows
+    page_chunks: Dict[str, Set[int]] = {}
+    for page, start, end, _ in rowid_to_window.values():
+        page_chunks.setdefault(page, set()).update(_get_window_chunks(chunk_size, start, end))
+
+    texts = {}
+    missing_page_chunks: Dict[str, List[int]] = {}
+    for page, chunks in page_chunks.items():
+        for chunk in sorted(chunks):
+            text = page_cache.get((page, chunk)) if page_cache else None
+            if text is None:
+                missing_page_chunks.setdefault(page, []).append(chunk)
+            else:
+                texts[(page, chunk)] = text
+
+    if text_storage:
+        read_texts = _select_page_text_chunks(conn, text_storage, missing_page_chunks)
+    else:
+        read_texts = {(page, 0): text for page, text in _select_page_texts(conn, list(missing_page_chunks)).items()}
+
+    texts.update(read_texts)
+
+    if page_cache:
+        for key, text in read_texts.items():
+            page_cache.put(key, text)
+
+    rowid_to_context = {}
+    for rowid in rowids:
+        if rowid not in rowid_to_window:
+            continue
+
+        page, start, end, mention = rowid_to_window[rowid]
+        chunks = _get_window_chunks(chunk_size, start, end)
+
+        # Like the SQL join, skip matches whose page is missing. Missing chunks are past the end of the text.
+        if not text_storage and (page, 0) not in texts:
+            continue
+
+        text = ''.join(texts.get((page, chunk), '') for chunk in chunks)
+        offset = chunks.start * chunk_size if chunk_size else 0
+
+        rowid_to_context[rowid] = (text[start - offset:end - offset], page, mention)
+
+    return rowid_to_context
+
+
+def _get_window_chunks(chunk_size: Optional[int], start: int, end: int) -> range:
+    """
+    :param chunk_size: See TextStorage, None = whole text in a single chunk (or uncompressed)
+    :return: Chunks overlapped by the text's chars [start, end)
+    """
+
+    if not chunk_size:
+        return range(1)
+
+    return range(start // chunk_size, (end - 1) // chunk_size + 1)
+
+
+def _select_page_texts(conn: Connection, page_titles: List[str]) -> Dict[str, str]:
+    """
+    :return: Page title -> uncompressed text, for the pages that exist
+    """
+
+    sql = '''
+        SELECT title, text
+        FROM pages
+        WHERE title IN ({})
+    '''
+
+    page_texts = {}
+
+    cursor = conn.cursor()
+
+    for start in range(0, len(page_titles), 500):
+        batch = page_titles[start:start + 500]
+        cursor.execute(sql.format(', '.join('?' * len(batch))), batch)
+        page_texts.update((title, text) for title, text in cursor.fetchall() if text is not None)
+
+    cursor.close()
+
+    return page_texts
+
+
+def _select_page_text_chunks(conn: Connection, text_storage: TextStorage, page_chunks: Dict[str, List[int]]) \
+        -> Dict[Tuple[str, int], str]:
+    """
+    :param page_chunks: Page title -> chunks to read
+    :return: (page title, chunk) -> decompressed text of each chunk to read, '' if the chunk does
+             not exist, e.g. because a window reaches beyond the end of the text
+    """
+
+    sql = '''
+        SELECT chunk, data
+        FROM page_text_chunks
+        WHERE page = ? AND chunk IN ({})
+    '''
+
+    texts = {}
+
+    cursor = conn.cursor()
+
+    for page, chunks in page_chunks.items():
+        for start in range(0, len(chunks), 500):
+            batch = chunks[start:start + 500]
+            cursor.execute(sql.format(', '.join('?' * len(batch))), [page] + batch)
+
+            texts.update(((page, chunk), '') for chunk in batch)
+            texts.update(((page, chunk), text_storage.decompress(data)) for chunk, data in cursor.fetchall())
+
+    cursor.close()
+
+    return texts
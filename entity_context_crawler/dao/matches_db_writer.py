@@ -0,0 +1,254 @@
+import time
+from dataclasses import dataclass
+from queue import Queue, Empty, Full
+from sqlite3 import Connection
+from threading import Thread, Condition
+from typing import Callable, List, Optional
+
+from entity_context_crawler.dao.matches_db import Page, Match, Mention, insert_pages, insert_matches, \
+    insert_or_ignore_mentions, Checkpoint, update_checkpoint
+from entity_context_crawler.util.metrics import Metrics
+from entity_context_crawler.util.profiling import profile
+
+
+@dataclass
+class WriterConfig:
+    commit_pages: int           # Commit after ... pages
+    commit_seconds: float       # Commit after ... seconds, at the latest
+    queue_size: int             # Max number of pages waiting to be written
+    journal_mode: Optional[str] = None  # PRAGMA journal_mode, None = SQLite default
+    synchronous: Optional[str] = None   # PRAGMA synchronous, None = SQLite default
+    cache_size: Optional[int] = None    # PRAGMA cache_size (pages, or KiB if negative), None = SQLite default
+    queue_bytes: Optional[int] = None   # Max length of the page texts waiting to be written, None = unbounded
+    flush_pages: Optional[int] = None   # Call flush() after ... written pages, None = never
+
+
+class MatchesDbWriter(Thread):
+    """
+    Background thread that writes the processed pages to the matches DB, so that collecting
+    the results from the worker pool never blocks on SQLite (unless the bounded queue is full).
+    The queue is bounded by the number of pages and, optionally, by the length of their texts.
+
+    The pages, matches and mentions are inserted in batches via 'executemany' and committed
+    every 'commit_pages' pages or every 'commit_seconds' seconds, whichever comes first.
+
+    If a checkpoint is given, the positions of the written pages are recorded in the checkpoint
+    tables within the same transaction, so that an aborted run can be resumed.
+
+    If a flush function is given, it is called by the writer thread after the commit once
+    'flush_pages' pages have been written since the last flush, e.g. to persist an in-memory DB.
+
+    If metrics are given, the durations of the writes (including the commits) and of the
+    flushes are recorded as the 'write' and 'flush' stages. If a profile dir is given, the
+    writer thread is profiled, see profile().
+
+    The connection must have been created with 'check_same_thread=False' and must not be used
+    by other threads until the writer is closed.
+    """
+
+    _stop_item = object()
+
+    def __init__(self, conn: Connection, config: WriterConfig, checkpoint: Checkpoint = None,
+                 flush: Callable[[], None] = None, metrics: Metrics = None, profile_dir: str = None):
+        super().__init__(name='MatchesDbWriter', daemon=True)
+
+        self.conn = conn
+        self.config = config
+        self.checkpoint = checkpoint
+        self.flush = flush
+        self.metrics = metrics
+        self.profile_dir = profile_dir
+
+        self.queue = Queue(maxsize=config.queue_size)
+        self.exception: Optional[Exception] = None
+
+        self.queued_bytes = 0
+        self.queued_bytes_condition = Condition()
+
+        self.written_pages = 0
+        self.commits = 0
+        self.flushes = 0
+        self.flushed_pages = 0  # written_pages at the last flush
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def put(self, db_page: Optional[Page], db_matches: List[Match], db_mentions: List[Mention],
+            position: int = None):
+        """
+        Queue page for writing, block while the queue is full
+
+        :param db_page: None if no page is written (but possibly mentions), and the position
+                        should be checkpointed
+        :param position: Position of the page within the Wikipedia, for the checkpoint
+
+        :raise Exception: if the writer failed
+        """
+
+        size = get_queued_size(db_page)
+
+        with self.queued_bytes_condition:
+            while self.config.queue_bytes and self.queued_bytes > 0 \
+                    and self.queued_bytes + size > self.config.queue_bytes:
+
+                if self.exception:
+                    raise self.exception
+
+                self.queued_bytes_condition.wait(timeout=1)
+
+            self.queued_bytes += size
+
+        while True:
+            if self.exception:
+                raise self.exception
+
+            try:
+                self.queue.put((db_page, db_matches, db_mentions, position), timeout=1)
+                return
+            except Full:
+                continue
+
+    def close(self):
+        """
+        Write and commit the remaining pages and stop the writer
+
+        :raise Exception: if the writer failed
+        """
+
+        if self.is_alive():
+            self.put(self._stop_item, [], [])
+            self.join()
+
+        if self.exception:
+            raise self.exception
+
+    def run(self):
+        with profile(self.profile_dir, 'writer'):
+            self._run()
+
+    def _run(self):
+        try:
+            set_pragmas(self.conn, self.config.journal_mode, self.config.synchronous, self.config.cache_size)
+
+            db_pages, db_matches, db_mentions, positions = [], [], [], []
+            last_commit_time = time.time()
+
+            while True:
+                timeout = max(self.config.commit_seconds - (time.time() - last_commit_time), 0.01)
+
+                try:
+                    db_page, page_matches, page_mentions, position = self.queue.get(timeout=timeout)
+                except Empty:
+                    db_page, page_matches, page_mentions, position = None, [], [], None
+                    stop = False
+                else:
+                    stop = db_page is self._stop_item
+                    self._release(get_queued_size(db_page))
+
+                if db_page is not None and not stop:
+                    db_pages.append(db_page)
+
+                if not stop:
+                    db_matches.extend(page_matches)
+                    db_mentions.extend(page_mentions)
+
+                if position is not None and not stop:
+                    positions.append(position)
+
+                commit_due = len(db_pages) >= self.config.commit_pages \
+                    or time.time() - last_commit_time >= self.config.commit_seconds
+
+                if stop or commit_due:
+                    # Skip empty commits while idle, but always write and commit on stop
+                    if stop or db_pages or db_matches or db_mentions or positions:
+                        self._write(db_pages, db_matches, db_mentions, positions)
+                        db_pages, db_matches, db_mentions, positions = [], [], [], []
+
+                    last_commit_time = time.time()
+
+                if stop:
+                    break
+
+        except Exception as e:
+            self.exception = e
+
+            # Unblock producer
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+    def _release(self, size: int):
+        with self.queued_bytes_condition:
+            self.queued_bytes -= size
+
+            self.queued_bytes_condition.notify_all()
+
+    def _write(self, db_pages: List[Page], db_matches: List[Match], db_mentions: List[Mention],
+               positions: List[int]):
+        start_time = time.time()
+
+        if db_pages:
+            insert_pages(self.conn, db_pages)
+
+        if db_matches:
+            insert_matches(self.conn, db_matches)
+
+        if db_mentions:
+            insert_or_ignore_mentions(self.conn, db_mentions)
+
+        if self.checkpoint and positions:
+            for position in positions:
+                self.checkpoint.add(position)
+
+            update_checkpoint(self.conn, self.checkpoint)
+
+        self.conn.commit()
+
+        self.written_pages += len(db_pages)
+        self.commits += 1
+
+        if self.metrics:
+            self.metrics.add_duration('write', time.time() - start_time)
+
+        if self.flush and self.config.flush_pages \
+                and self.written_pages - self.flushed_pages >= self.config.flush_pages:
+            start_time = time.time()
+            self.flush()
+
+            if self.metrics:
+                self.metrics.add_duration('flush', time.time() - start_time)
+
+            self.flushes += 1
+            self.flushed_pages = self.written_pages
+
+
+def get_queued_size(db_page) -> int:
+    """
+    :return: Length of the page's text (or compressed text), 0 if there is no page
+    """
+
+    if not isinstance(db_page, Page):
+        return 0
+
+    if db_page.text_chunks is not None:
+        return sum(len(chunk) for chunk in db_page.text_chunks)
+
+    return len(db_page.text)
+
+
+def set_pragmas(conn: Connection, journal_mode: str = None, synchronous: str = None, cache_size: int = None):
+    cursor = conn.cursor()
+
+    if journal_mode:
+        cursor.execute('PRAGMA journal_mode = {}'.format(journal_mode))
+
+    if synchronous:
+        cursor.execute('PRAGMA synchronous = {}'.format(synchronous))
+
+    if cache_size:
+        cursor.execute('PRAGMA cache_size = {}'.format(int(cache_size)))
+
+    cursor.close()
@@ -0,0 +1,77 @@
+from dataclasses import dataclass
+from sqlite3 import Connection
+from typing import Iterator, List
+
+
+@dataclass
+class IndexEntry:
+    position: int   # Position of page within Wikipedia XML, starting at 0
+    title: str
+    namespace: int
+    offset: int     # Byte offset of '<page>' tag within Wikipedia XML
+    length: int     # Byte length of '<page>...</page>' element
+    redirect: bool
+
+
+def create_pages_table(conn: Connection):
+    create_table_sql = '''
+        CREATE TABLE pages (
+            position INTEGER,
+            title TEXT,
+            namespace INT,
+            offset INT,
+            length INT,
+            redirect INT,
+
+            PRIMARY KEY (position)
+        )
+    '''
+
+    create_title_index_sql = '''
+        CREATE INDEX title_index
+        ON pages(title)
+    '''
+
+    cursor = conn.cursor()
+    cursor.execute(create_table_sql)
+    cursor.execute(create_title_index_sql)
+    cursor.close()
+
+
+def insert_index_entries(conn: Connection, index_entries: List[IndexEntry]):
+    sql = '''
+        INSERT INTO pages (position, title, namespace, offset, length, redirect)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+
+    cursor = conn.cursor()
+    rows = [(e.position, e.title, e.namespace, e.offset, e.length, e.redirect) for e in index_entries]
+    cursor.executemany(sql, rows)
+    cursor.close()
+
+
+def select_index_entries(conn: Connection, start: int = None, stop: int = None) -> Iterator[IndexEntry]:
+    """
+    :param start: First page position (inclusive), None = from the beginning
+    :param stop: Last page position (exclusive), None = until the end
+
+    :return: Yield the index entries within [start, stop), ordered by position
+    """
+
+    sql = '''
+        SELECT position, title, namespace, offset, length, redirect
+        FROM pages
+        WHERE position >= ? AND position < ?
+        ORDER BY position
+    '''
+
+    start = start if start is not None else 0
+    stop = stop if stop is not None else 2 ** 63 - 1
+
+    cursor = conn.cursor()
+    cursor.execute(sql, (start, stop))
+
+    for row in cursor:
+        yield IndexEntry(row[0], row[1], row[2], row[3], row[4], bool(row[5]))
+
+    cursor.close()
@@ -0,0 +1,60 @@
+from collections import defaultdict
+from typing import Collection, Dict, Iterable, List, Mapping, Set, Tuple
+
+from spacy.language import Language
+from spacy.matcher import PhraseMatcher
+from spacy.tokens import Doc, Span
+
+
+def get_alias_to_mids(mid_to_label: Mapping[str, str], mentions: Iterable[Tuple[str, str]]) -> Dict[str, Set[str]]:
+    """
+    Collect the labels of all entities plus the given mentions, e.g. the link texts found by an
+    earlier run of `ecc build-matches-db`. Mentions of unknown entities are ignored.
+
+    :param mentions: [(mid, mention)]
+    :return: alias -> MIDs of all entities with that label or mention
+    """
+
+    alias_to_mids = defaultdict(set)
+
+    for mid, label in mid_to_label.items():
+        alias_to_mids[label].add(mid)
+
+    for mid, mention in mentions:
+        if mid in mid_to_label:
+            alias_to_mids[mention].add(mid)
+
+    return dict(alias_to_mids)
+
+
+class AliasMatcher:
+    """
+    Single PhraseMatcher over the aliases of all entities, built once per worker instead of
+    one matcher per page from the page's link texts. A match is only kept if its alias refers
+    to exactly one of the given (e.g. the page's linked) entities.
+    """
+
+    def __init__(self, nlp: Language, alias_to_mids: Mapping[str, Collection[str]], batch_size: int = 10000):
+        self.alias_to_mids = alias_to_mids
+        self.matcher = PhraseMatcher(nlp.vocab)
+
+        # The matcher compares tokens only, so the aliases only need to be tokenized
+        aliases = list(alias_to_mids)
+        for start in range(0, len(aliases), batch_size):
+            self.matcher.add('Aliases', list(nlp.tokenizer.pipe(aliases[start:start + batch_size])))
+
+    def __call__(self, doc: Doc, mids: Set[str]) -> List[Tuple[Span, str]]:
+        """
+        :param mids: Entities that may be matched
+        :return: [(match_span, mid)]
+        """
+
+        matches = []
+        for _, start, end in self.matcher(doc):
+            match_span = doc[start:end]
+
+            match_mids = [mid for mid in self.alias_to_mids.get(match_span.text, ()) if mid in mids]
+            if len(match_mids) == 1:
+                matches.append((match_span, match_mids[0]))
+
+        return matches
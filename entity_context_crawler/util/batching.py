@@ -0,0 +1,94 @@
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, TypeVar
+
+T = TypeVar('T')
+
+
+def iter_batches(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    """
+    :return: Yield batches of 'batch_size' items each, the last one might hold less
+    """
+
+    iterator = iter(items)
+
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+
+        yield batch
+
+
+class AdaptiveBatcher:
+    """
+    Group items into batches by size (e.g. page bytes) rather than by count, so that many small
+    pages share one IPC round trip while a single huge page does not hold back others.
+
+    The byte budget per batch is tuned from the observed processing time per byte, so that a
+    batch takes about 'target_seconds' to process. Items larger than the budget form a batch
+    on their own. A target of 0 disables batching, i.e. every batch holds exactly one item.
+    """
+
+    def __init__(self, target_seconds: float, initial_bytes: int = 64 * 1024, min_bytes: int = 1024,
+                 max_bytes: int = 64 * 1024 * 1024, smoothing: float = 0.1):
+        """
+        :param smoothing: Weight of the latest observation in the moving average of seconds per byte
+        """
+
+        self.target_seconds = target_seconds
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.smoothing = smoothing
+
+        self.batch_bytes = initial_bytes if target_seconds > 0 else 0
+        self.seconds_per_byte = None
+
+        self.batches = 0
+        self.items = 0
+
+    def batch(self, items: Iterable[T], get_size: Callable[[T], int]) -> Iterator[List[T]]:
+        """
+        :return: Yield batches of items, whose total size is about the current byte budget
+        """
+
+        batch = []
+        batch_size = 0
+
+        for item in items:
+            size = get_size(item)
+
+            if batch and batch_size + size > self.batch_bytes:
+                yield self._count(batch)
+                batch = []
+                batch_size = 0
+
+            batch.append(item)
+            batch_size += size
+
+        if batch:
+            yield self._count(batch)
+
+    def add_observation(self, size: int, seconds: float):
+        """
+        Update the byte budget from the processing time of a page (or batch) of the given size
+        """
+
+        if self.target_seconds <= 0 or size <= 0:
+            return
+
+        seconds_per_byte = seconds / size
+
+        if self.seconds_per_byte is None:
+            self.seconds_per_byte = seconds_per_byte
+        else:
+            self.seconds_per_byte += self.smoothing * (seconds_per_byte - self.seconds_per_byte)
+
+        if self.seconds_per_byte > 0:
+            batch_bytes = self.target_seconds / self.seconds_per_byte
+            self.batch_bytes = int(min(max(batch_bytes, self.min_bytes), self.max_bytes))
+
+    def _count(self, batch: List[T]) -> List[T]:
+        self.batches += 1
+        self.items += len(batch)
+
+        return batch
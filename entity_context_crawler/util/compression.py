@@ -0,0 +1,32 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # Optional, only required for zstd compression
+    zstandard = None
+
+COMPRESSIONS = ['zlib', 'zstd']
+
+
+def is_available(compression: str) -> bool:
+    return compression == 'zlib' or (compression == 'zstd' and zstandard is not None)
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    if compression == 'zlib':
+        return zlib.compress(data)
+
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor().compress(data)
+
+    raise ValueError('Unknown compression {}'.format(compression))
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    if compression == 'zlib':
+        return zlib.decompress(data)
+
+    if compression == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    raise ValueError('Unknown compression {}'.format(compression))
@@ -0,0 +1,70 @@
+from threading import Condition
+from typing import Callable, Iterable, Iterator, List, TypeVar
+
+T = TypeVar('T')
+
+
+class InFlightWindow:
+    """
+    Bound the number of pages (and their bytes) that have been handed to the worker pool but
+    whose results have not been collected yet. The pool's task handler thread consumes the page
+    iterator as fast as it can, so without a bound, the pending pages and results pile up in
+    the pool's queues whenever the workers or the main process fall behind.
+
+    'limit()' wraps the iterator consumed by the pool and blocks while the window is full,
+    which in turn stops reading the Wikipedia. 'release()' is called when the results arrive.
+    A single batch that exceeds the limits on its own is let through if the window is empty.
+    """
+
+    def __init__(self, max_pages: int, max_bytes: int):
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+
+        self.pages = 0
+        self.bytes = 0
+
+        self.condition = Condition()
+        self.closed = False
+
+    def limit(self, batches: Iterable[List[T]], get_size: Callable[[T], int]) -> Iterator[List[T]]:
+        """
+        :return: Yield the batches as soon as they fit into the window
+        """
+
+        for batch in batches:
+            self.acquire(len(batch), sum(get_size(item) for item in batch))
+
+            if self.closed:
+                return
+
+            yield batch
+
+    def acquire(self, pages: int, size: int):
+        """
+        Block until the pages fit into the window (or the window is closed) and add them
+        """
+
+        with self.condition:
+            while not self.closed and self.pages > 0 \
+                    and (self.pages + pages > self.max_pages or self.bytes + size > self.max_bytes):
+                self.condition.wait()
+
+            self.pages += pages
+            self.bytes += size
+
+    def release(self, pages: int, size: int):
+        with self.condition:
+            self.pages -= pages
+            self.bytes -= size
+
+            self.condition.notify_all()
+
+    def close(self):
+        """
+        Unblock and stop 'limit()', e.g. when the pool is terminated early
+        """
+
+        with self.condition:
+            self.closed = True
+
+            self.condition.notify_all()
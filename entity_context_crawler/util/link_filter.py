@@ -0,0 +1,65 @@
+import html
+import re
+from typing import Any, Iterable, Set, Union
+
+
+class LinkFilter:
+    """
+    Cheap prefilter that drops pages without links to any of the given pages before they
+    are parsed. Such pages cannot contain matches, as only linked entities are matched.
+
+    The link targets are found by scanning the raw markup for '[[Title' (the target ends at
+    '|', '#', '[' or ']', just like the link title determined by wikitextparser) and looked up
+    in a hash set of the titles. Pages can be given as page dicts, as raw page XML or as parsed
+    pages from a corpus DB, whose link titles are looked up directly.
+    """
+
+    # Lookahead to also find overlapping candidates, e.g. '[[[Title]]]'
+    link_pattern = re.compile(r'\[(?=\[([^\[\]|#]*))')
+    link_pattern_bytes = re.compile(rb'\[(?=\[([^\[\]|#]*))')
+
+    def __init__(self, titles: Iterable[str]):
+        self.titles: Set[str] = set(titles)
+        self.skipped_pages = 0
+
+    def has_link(self, markup: Union[str, bytes]) -> bool:
+        """
+        :param markup: Page markup or raw page XML (in which '&' within titles is escaped)
+        """
+
+        if isinstance(markup, bytes):
+            for target in self.link_pattern_bytes.findall(markup):
+                title = target.decode('utf-8', errors='replace')
+                if b'&' in target:
+                    title = html.unescape(title)
+
+                if title in self.titles:
+                    return True
+
+        else:
+            for title in self.link_pattern.findall(markup):
+                if title in self.titles:
+                    return True
+
+        return False
+
+    def accept(self, page: Union[dict, bytes, Any]) -> bool:
+        """
+        :param page: Page dict {'title', 'redirect', 'text'}, raw page XML or parsed page with
+                     'links' [(title, text)], e.g. dao.corpus_db.ParsedPage
+        :return: True if the page links at least one of the titles, count the page as skipped otherwise
+        """
+
+        if isinstance(page, bytes):
+            if self.has_link(page):
+                return True
+
+        elif isinstance(page, dict):
+            if self.has_link(page['text']):
+                return True
+
+        elif any(link_title in self.titles for link_title, _ in page.links):
+            return True
+
+        self.skipped_pages += 1
+        return False
@@ -0,0 +1,40 @@
+import resource
+import sys
+
+
+def get_rss() -> int:
+    """
+    :return: Resident set size of the current process in bytes. Falls back to the
+             peak RSS if /proc is not available, e.g. on macOS.
+    """
+
+    try:
+        with open('/proc/self/statm') as statm_fh:
+            resident_pages = int(statm_fh.read().split()[1])
+
+        return resident_pages * resource.getpagesize()
+
+    except OSError:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # ru_maxrss is given in bytes on macOS, but in KiB on Linux
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def get_pss() -> int:
+    """
+    :return: Proportional set size of the current process in bytes, i.e. pages shared with
+             other processes (e.g. inherited copy-on-write via fork) are divided among them.
+             Falls back to the RSS if /proc/self/smaps_rollup is not available.
+    """
+
+    try:
+        with open('/proc/self/smaps_rollup') as smaps_fh:
+            for line in smaps_fh:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+
+    except OSError:
+        pass
+
+    return get_rss()
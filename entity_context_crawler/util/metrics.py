@@ -0,0 +1,157 @@
+import json
+import math
+import os
+from threading import Lock
+from typing import Dict, Mapping, Optional
+
+
+class Histogram:
+    """
+    Histogram of durations with logarithmic buckets, so that percentiles can be estimated from
+    millions of observations in constant memory. Bucket i holds the durations up to
+    'min_seconds * growth ** i', i.e. the estimated percentiles are accurate to the bucket's
+    growth factor (by default about 19%).
+    """
+
+    def __init__(self, min_seconds: float = 1e-6, growth: float = 2 ** 0.25, bucket_count: int = 128):
+        self.min_seconds = min_seconds
+        self.growth = growth
+
+        self.buckets = [0] * bucket_count
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        if seconds <= self.min_seconds:
+            bucket = 0
+        else:
+            bucket = min(math.ceil(math.log(seconds / self.min_seconds, self.growth)), len(self.buckets) - 1)
+
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def get_percentile(self, percentile: float) -> float:
+        """
+        :param percentile: e.g. 0.95
+        :return: Upper bound of the bucket that holds the percentile, at most the max duration,
+                 0 if empty
+        """
+
+        if self.count == 0:
+            return 0.0
+
+        rank = percentile * self.count
+        cumulative_count = 0
+        for bucket, bucket_count in enumerate(self.buckets):
+            cumulative_count += bucket_count
+            if cumulative_count >= rank and bucket_count > 0:
+                return min(self.min_seconds * self.growth ** bucket, self.max)
+
+        return self.max
+
+
+class Metrics:
+    """
+    Thread-safe collection of a duration histogram per stage (e.g. 'convert', 'match', 'write')
+    and of counters, written as snapshots for monitoring, see write_snapshot()
+    """
+
+    percentiles = [0.5, 0.95, 0.99]
+
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+
+    def add_duration(self, stage: str, seconds: float):
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram()
+
+            self.histograms[stage].add(seconds)
+
+    def add_durations(self, stage_durations: Mapping[str, float]):
+        for stage, seconds in stage_durations.items():
+            self.add_duration(stage, seconds)
+
+    def increment(self, counter: str, value: float = 1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def get_stages(self) -> Dict[str, Dict[str, float]]:
+        """
+        :return: stage -> {'count', 'seconds', 'p50', 'p95', 'p99'} (percentiles in seconds)
+        """
+
+        with self.lock:
+            stages = {}
+            for stage, histogram in sorted(self.histograms.items()):
+                stages[stage] = {'count': histogram.count, 'seconds': histogram.sum}
+                for percentile in self.percentiles:
+                    stages[stage]['p{:.0f}'.format(percentile * 100)] = histogram.get_percentile(percentile)
+
+            return stages
+
+    def get_snapshot(self, elapsed: float, progress: Optional[float]) -> Dict:
+        """
+        :param progress: Share of the input processed so far, between 0 and 1, None if unknown
+        :return: Counters, rates per second, ETA (if the progress is known) and stage percentiles
+        """
+
+        with self.lock:
+            counters = dict(self.counters)
+
+        snapshot = {'elapsed_seconds': elapsed, 'progress': progress, 'eta_seconds': None}
+
+        for counter, value in sorted(counters.items()):
+            snapshot[counter] = value
+            snapshot['{}_per_second'.format(counter)] = value / elapsed if elapsed else 0.0
+
+        if progress:
+            snapshot['eta_seconds'] = elapsed / progress - elapsed
+
+        snapshot['stages'] = self.get_stages()
+
+        return snapshot
+
+
+def write_snapshot(path: str, snapshot: Dict, prefix: str = 'ecc'):
+    """
+    Write the snapshot as JSON if the path ends with '.json', otherwise in the Prometheus text
+    format, e.g. for the node exporter's textfile collector. The file is replaced atomically,
+    so that readers never see a partial snapshot.
+    """
+
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'w', encoding='utf-8') as fh:
+        if path.endswith('.json'):
+            json.dump(snapshot, fh, indent=2)
+        else:
+            fh.write(format_prometheus(snapshot, prefix))
+
+    os.replace(tmp_path, path)
+
+
+def format_prometheus(snapshot: Dict, prefix: str = 'ecc') -> str:
+    lines = []
+
+    for key, value in snapshot.items():
+        if key == 'stages' or value is None:
+            continue
+
+        lines.append('# TYPE {}_{} gauge'.format(prefix, key))
+        lines.append('{}_{} {}'.format(prefix, key, value))
+
+    stage_metrics = [('count', 'stage_count'), ('seconds', 'stage_seconds_sum'), ('p50', 'stage_seconds_p50'),
+                     ('p95', 'stage_seconds_p95'), ('p99', 'stage_seconds_p99')]
+
+    for stage_key, metric in stage_metrics:
+        lines.append('# TYPE {}_{} gauge'.format(prefix, metric))
+        for stage, values in snapshot['stages'].items():
+            lines.append('{}_{}{{stage="{}"}} {}'.format(prefix, metric, stage, values[stage_key]))
+
+    return '\n'.join(lines) + '\n'
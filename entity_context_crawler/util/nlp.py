@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List
+
+import spacy
+from spacy.language import Language
+from spacy.tokens import Doc
+
+
+@dataclass
+class NlpProfile:
+    keep: List[str]     # Pipeline components to load, all others are excluded
+    enable: List[str]   # Components to enable, as they are disabled by default, e.g. 'senter'
+    add: List[str]      # Components to add, e.g. the rule-based 'sentencizer'
+    sents: bool         # Sets sentence boundaries, i.e. 'doc.sents' is available
+
+
+NLP_PROFILES = {
+    'full': None,  # Load the model as is
+
+    'parser-sents': NlpProfile(['tok2vec', 'parser'], [], [], sents=True),
+    'senter-only': NlpProfile(['senter'], ['senter'], [], sents=True),
+    'rule-sentencizer': NlpProfile([], [], ['sentencizer'], sents=True),
+    'tokenizer-only': NlpProfile([], [], [], sents=False),
+}
+
+
+def load_nlp(model: str, profile: str = 'full') -> Language:
+    """
+    Load spaCy model with only the components needed for the given profile. Word vectors
+    are only loaded if one of the kept components uses static vectors (e.g. the shared
+    'tok2vec' of the 'lg' models), as they make up most of the model's memory.
+
+    Profiles:
+        - full             - all components and word vectors, as by spacy.load()
+        - parser-sents     - sentences from dependency parser, i.e. without tagger, lemmatizer, NER, ...
+        - senter-only      - sentences from statistical sentence recognizer
+        - rule-sentencizer - sentences from punctuation rules, without any trained component
+        - tokenizer-only   - only tokenization (e.g. for matching), no sentences
+
+    :param model: Name of installed model package, e.g. 'en_core_web_lg', or path to model directory
+    """
+
+    nlp_profile = NLP_PROFILES[profile]
+
+    if nlp_profile is None:
+        return spacy.load(model)
+
+    model_path = _get_model_path(model)
+    config = spacy.util.load_config(model_path / 'config.cfg')
+
+    exclude = [name for name in _get_component_names(model_path) if name not in nlp_profile.keep]
+    if not any(_uses_static_vectors(config['components'].get(name, {})) for name in nlp_profile.keep):
+        exclude.append('vectors')
+
+    nlp = spacy.load(model, exclude=exclude)
+
+    for name in nlp_profile.enable:
+        nlp.enable_pipe(name)
+
+    for name in nlp_profile.add:
+        nlp.add_pipe(name)
+
+    return nlp
+
+
+def has_sents(profile: str) -> bool:
+    """
+    :return: True if models loaded with the given profile set sentence boundaries
+    """
+
+    nlp_profile = NLP_PROFILES[profile]
+
+    return nlp_profile is None or nlp_profile.sents
+
+
+def pipe(nlp: Language, texts: Iterable[str], batch_size: int) -> Iterator[Doc]:
+    """
+    Process the texts in batches via nlp.pipe(), or via a separate nlp() call per text if the
+    batch size is 1. Yield the docs in the order of the texts.
+    """
+
+    if batch_size > 1:
+        yield from nlp.pipe(texts, batch_size=batch_size)
+    else:
+        for text in texts:
+            yield nlp(text)
+
+
+def _get_model_path(model: str) -> Path:
+    return Path(model) if Path(model).exists() else spacy.util.get_package_path(model)
+
+
+def _get_component_names(model_path: Path) -> List[str]:
+    """
+    :return: Names of all components (including disabled ones) from the model's meta.json
+    """
+
+    meta = spacy.util.load_meta(model_path / 'meta.json')
+
+    return meta.get('components', meta['pipeline'])
+
+
+def _uses_static_vectors(component_config: Any) -> bool:
+    """
+    :return: True if the component's model config (or any of its sub layers) embeds static vectors
+    """
+
+    if isinstance(component_config, dict):
+        if component_config.get('include_static_vectors') or component_config.get('pretrained_vectors'):
+            return True
+
+        return any(_uses_static_vectors(value) for value in component_config.values())
+
+    return False
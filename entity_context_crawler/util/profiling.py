@@ -0,0 +1,104 @@
+import cProfile
+import os
+import pstats
+from collections import defaultdict
+from contextlib import contextmanager
+from glob import glob
+from multiprocessing.util import Finalize
+from os.path import basename, join
+from typing import Iterable, Iterator, Optional
+
+
+def get_profile_path(profile_dir: str, role: str) -> str:
+    """
+    :param role: Stage of the pipeline that the profiled thread or process runs, e.g. 'worker'
+    :return: Path of the stats dumped by the current process for the role
+    """
+
+    return join(profile_dir, '{}-{}.prof'.format(role, os.getpid()))
+
+
+def has_profiles(profile_dir: str) -> bool:
+    return bool(glob(join(profile_dir, '*.prof')))
+
+
+def remove_profiles(profile_dir: str):
+    for path in glob(join(profile_dir, '*.prof')):
+        os.remove(path)
+
+
+@contextmanager
+def profile(profile_dir: Optional[str], role: str) -> Iterator[None]:
+    """
+    Profile the current thread within the context and dump the stats at its end.
+    Does nothing if no profile dir is given.
+    """
+
+    if profile_dir is None:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(get_profile_path(profile_dir, role))
+
+
+def profile_iter(iterable: Iterable, profile_dir: Optional[str], role: str) -> Iterator:
+    """
+    Profile the iteration in whatever thread consumes the iterator, e.g. the thread of a
+    multiprocessing pool that feeds the tasks to the workers
+    """
+
+    with profile(profile_dir, role):
+        yield from iterable
+
+
+def start_process_profile(profile_dir: str, role: str):
+    """
+    Profile the current thread until the process exits, e.g. a pool worker from its initializer
+    on. The stats are dumped by a multiprocessing finalizer, which only runs if the process exits
+    normally, i.e. the pool must be closed and joined instead of terminated.
+    """
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    def dump():
+        profiler.disable()
+        profiler.dump_stats(get_profile_path(profile_dir, role))
+
+    Finalize(None, dump, exitpriority=10)
+
+
+def write_profile_report(profile_dir: str, top_functions: int = 30) -> str:
+    """
+    Merge the stats that the processes dumped per role into '<role>.prof' (e.g. for snakeviz)
+    and write a report with the top functions per role, by cumulative and by own time.
+
+    :return: Path of the report
+    """
+
+    role_paths = defaultdict(list)
+    for path in sorted(glob(join(profile_dir, '*-*.prof'))):
+        role_paths[basename(path).rsplit('-', 1)[0]].append(path)
+
+    report_path = join(profile_dir, 'report.txt')
+
+    with open(report_path, 'w', encoding='utf-8') as fh:
+        for role, paths in sorted(role_paths.items()):
+            stats = pstats.Stats(*paths, stream=fh)
+            stats.dump_stats(join(profile_dir, '{}.prof'.format(role)))
+
+            fh.write('=' * 100 + '\n')
+            fh.write('{} | {} profiles | {:.1f} s\n'.format(role, len(paths), stats.total_tt))
+            fh.write('=' * 100 + '\n')
+
+            stats.sort_stats('cumulative').print_stats(top_functions)
+            stats.sort_stats('tottime').print_stats(top_functions)
+
+    return report_path
@@ -1,11 +1,32 @@
+import bz2
+import html
+import os
+import re
+from collections import deque
+from io import BytesIO
+from itertools import islice
+from multiprocessing import cpu_count, get_context
+from os.path import getsize
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
 from lxml import etree
 
 
+SPECIAL_NAMESPACES = ('Talk:', 'User:', 'User talk:', 'Wikipedia:', 'Wikipedia talk:', 'File:', 'File talk:',
+                      'MediaWiki:', 'MediaWiki talk:', 'Template:', 'Template talk:', 'Help:', 'Help talk:',
+                      'Category:', 'Category talk:', 'Portal:', 'Portal talk:', 'Book:', 'Book talk:', 'Draft:',
+                      'Draft talk:', 'Education Program:', 'Education Program talk:', 'TimedText:',
+                      'TimedText talk:', 'Module:', 'Module talk:', 'Gadget:', 'Gadget talk:',
+                      'Gadget definition:', 'Gadget definition talk:')
+
+
 class Wikipedia:
     missing_titles = 0
     missing_texts = 0
     skipped_special_pages = 0
 
+    read_pages = 0
+
     def __init__(self, fh, limit_pages = None):
         """
         Initialize 'iterparse' to only generate 'end' events on tag '<page>'
@@ -15,6 +36,7 @@ class Wikipedia:
 
         # Prepend the default Namespace {*} to get anything.
         self.context = etree.iterparse(fh, events=("end",), tag=['{*}page'])
+        self.fh = fh
         self.limit_pages = limit_pages
 
     def _parse(self):
@@ -31,6 +53,14 @@ class Wikipedia:
             while elem.getprevious() is not None:
                 del elem.getparent()[0]
 
+    def _iter_page_xmls(self) -> Iterator[bytes]:
+        """
+        :return: Yield the raw '<page>...</page>' XML of all pages
+        """
+
+        for offset, page_xml in iter_page_xmls(self.fh):
+            yield page_xml
+
     def __iter__(self):
         """
         Iterate all '<tag>...</tag>' Element Trees yielded from self._parse()
@@ -42,39 +72,332 @@ class Wikipedia:
             if self.limit_pages and count == self.limit_pages:
                 break
 
+            self.read_pages = count + 1
+
             event, elem = parsed
 
-            namespaces = {'xmlns': etree.QName(elem).namespace}
+            page, skip_reason = get_page(elem)
 
-            titles = elem.xpath('./xmlns:title/text()', namespaces=namespaces)
-            if titles:
-                title = titles[0]
-            else:
-                self.missing_titles += 1
+            if skip_reason:
+                self.count_skipped_page(skip_reason)
                 continue
 
-            redirects = elem.xpath('./xmlns:redirect/@title', namespaces=namespaces)
-            redirect = redirects[0] if redirects else None
+            yield page
 
-            texts = elem.xpath('./xmlns:revision/xmlns:text/text()', namespaces=namespaces)
-            if texts:
-                text = texts[0]
-            else:
-                self.missing_texts += 1
-                continue
+    def iter_raw_pages(self) -> Iterator[bytes]:
+        """
+        Iterate the raw '<page>...</page>' XML of all pages without parsing it. The pages
+        must be parsed using get_page() and skipped pages should be reported back via
+        count_skipped_page().
+        """
 
-            namespaces = ('Talk:', 'User:', 'User talk:', 'Wikipedia:', 'Wikipedia talk:', 'File:', 'File talk:',
-                          'MediaWiki:', 'MediaWiki talk:', 'Template:', 'Template talk:', 'Help:', 'Help talk:',
-                          'Category:', 'Category talk:', 'Portal:', 'Portal talk:', 'Book:', 'Book talk:', 'Draft:',
-                          'Draft talk:', 'Education Program:', 'Education Program talk:', 'TimedText:',
-                          'TimedText talk:', 'Module:', 'Module talk:', 'Gadget:', 'Gadget talk:',
-                          'Gadget definition:', 'Gadget definition talk:')
+        for count, page_xml in enumerate(self._iter_page_xmls()):
+            if self.limit_pages and count == self.limit_pages:
+                break
 
-            if title.startswith(namespaces):
-                self.skipped_special_pages += 1
-                continue
+            self.read_pages = count + 1
+
+            yield page_xml
+
+    def get_progress(self) -> Optional[float]:
+        """
+        :return: Share of the dump (or of --limit-pages) read so far, between 0 and 1, None if unknown
+        """
+
+        if self.limit_pages:
+            return min(self.read_pages / self.limit_pages, 1.0)
+
+        return self._get_dump_progress()
+
+    def _get_dump_progress(self) -> Optional[float]:
+        """
+        :return: Position of the file handle within the XML file
+        """
+
+        try:
+            size = os.fstat(self.fh.fileno()).st_size
+            return min(self.fh.tell() / size, 1.0) if size else None
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def count_skipped_page(self, skip_reason: str):
+        if skip_reason == MISSING_TITLE:
+            self.missing_titles += 1
+        elif skip_reason == MISSING_TEXT:
+            self.missing_texts += 1
+        elif skip_reason == SPECIAL_PAGE:
+            self.skipped_special_pages += 1
+
+
+MISSING_TITLE = 'missing title'
+MISSING_TEXT = 'missing text'
+SPECIAL_PAGE = 'special page'
+
+
+def get_page(elem: etree.Element) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Extract title, redirect and text from a '<page>' Element Tree. The '<page>' element
+    can be in the MediaWiki namespace or in no namespace, e.g. when parsed from raw page XML.
+
+    :return: ({'title', 'redirect', 'text'}, None) or (None, skip reason) if the page is skipped
+    """
+
+    title = elem.findtext('{*}title')
+    if not title:
+        return None, MISSING_TITLE
+
+    redirect_elem = elem.find('{*}redirect')
+    redirect = redirect_elem.get('title') if redirect_elem is not None else None
+
+    text = elem.findtext('{*}revision/{*}text')
+    if not text:
+        return None, MISSING_TEXT
+
+    if title.startswith(SPECIAL_NAMESPACES):
+        return None, SPECIAL_PAGE
+
+    return {'title': title, 'redirect': redirect, 'text': text}, None
+
+
+def parse_page_xml(page_xml: bytes) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Parse raw '<page>...</page>' XML as yielded by Wikipedia.iter_raw_pages(), see get_page()
+    """
+
+    return get_page(etree.fromstring(page_xml))
+
+
+class MultistreamWikipedia(Wikipedia):
+    """
+    Read a multistream Wikipedia dump ('pages-articles-multistream.xml.bz2') directly
+
+    The multistream dump consists of independent bz2 streams of (usually) 100 pages each.
+    Their byte offsets are listed in the accompanying index ('...-multistream-index.txt.bz2').
+    The streams are decompressed in parallel by a process pool, while the pages are yielded
+    in dump order, just like from the plain Wikipedia XML. The pool's processes are spawned
+    rather than forked, so that the pages can be read from any thread.
+    """
+
+    def __init__(self, dump_bz2: str, index_bz2: str, limit_pages=None, processes: int = None, prefetch: int = None):
+        """
+        :param dump_bz2: Path to multistream Wikipedia dump
+        :param index_bz2: Path to multistream index
+        :param processes: Number of decompressing processes (default: number of CPUs)
+        :param prefetch: Max number of streams decompressed ahead (default: 2 per process)
+        """
+
+        self.dump_bz2 = dump_bz2
+        self.index_bz2 = index_bz2
+        self.limit_pages = limit_pages
+        self.processes = processes if processes else cpu_count()
+        self.prefetch = prefetch if prefetch else 2 * self.processes
+
+        self.read_bytes = 0     # Compressed bytes of the streams read so far
+        self.dump_bytes = None
+
+    def _parse(self):
+        """
+        Decompress the bz2 streams in parallel and parse their '<page>' elements
+
+        :return: Yield the current 'Event, Element Tree'
+        """
+
+        for root_start_tag, data in self._iter_streams():
+            root = etree.fromstring(root_start_tag + data + b'</mediawiki>')
+            for elem in root.iterchildren('{*}page'):
+                yield 'end', elem
+
+    def _get_dump_progress(self) -> Optional[float]:
+        return self.read_bytes / self.dump_bytes if self.dump_bytes else None
+
+    def _iter_page_xmls(self) -> Iterator[bytes]:
+        """
+        Decompress the bz2 streams in parallel and split them into '<page>...</page>' XMLs
+        """
+
+        for _, data in self._iter_streams():
+            for offset, page_xml in iter_page_xmls(BytesIO(data)):
+                yield page_xml
+
+    def _iter_streams(self) -> Iterator[Tuple[bytes, bytes]]:
+        """
+        :return: Yield (root start tag, decompressed stream) for each page stream, in dump order
+        """
+
+        stream_offsets = _read_stream_offsets(self.index_bz2)
+        if not stream_offsets:
+            return
+
+        # The first stream contains the '<mediawiki>' start tag and the '<siteinfo>'. Wrap all
+        # page streams into the same root element so that the pages get the dump's namespace.
+        header = _decompress_stream(self.dump_bz2, 0, stream_offsets[0])
+        root_start_tag = get_root_start_tag(header)
+
+        stream_ends = stream_offsets[1:] + [getsize(self.dump_bz2)]
+        streams = zip(stream_offsets, stream_ends)
+
+        self.dump_bytes = stream_ends[-1]
+
+        # This generator might be consumed by another thread (e.g. the task handler of a process pool)
+        # while further threads are running. Forking a multithreaded process can deadlock the child,
+        # so start the decompressing processes fresh instead.
+        with get_context('spawn').Pool(self.processes) as pool:
+
+            # Keep a bounded window of streams in flight, so that a slow consumer
+            # does not pile up decompressed data in memory
+            pending = deque((end, pool.apply_async(_decompress_stream, (self.dump_bz2, start, end)))
+                            for start, end in islice(streams, self.prefetch))
+
+            while pending:
+                end, result = pending.popleft()
+                data = result.get()
+                self.read_bytes = end
+
+                for start, end in islice(streams, 1):
+                    pending.append((end, pool.apply_async(_decompress_stream, (self.dump_bz2, start, end))))
+
+                yield root_start_tag, data
+
+
+class IndexedWikipedia(Wikipedia):
+    """
+    Read selected pages from the Wikipedia XML, given their byte offsets and lengths
+
+    The index entries can be any slice of the page index built by 'ecc index-wiki', which
+    allows to process byte ranges separately or jump straight to specific pages.
+    """
+
+    def __init__(self, fh: BinaryIO, index_entries: Iterable[Tuple[int, int]], limit_pages=None):
+        """
+        :param fh: File Handle from the XML File to read
+        :param index_entries: [(offset, length)] of the '<page>' elements to read, preferably sorted by offset
+        """
+
+        self.fh = fh
+        self.index_entries = index_entries
+        self.limit_pages = limit_pages
+
+    def _parse(self):
+        """
+        Seek to and parse the indexed '<page>' elements
+
+        :return: Yield the current 'Event, Element Tree'
+        """
+
+        self.fh.seek(0)
+        root_start_tag = get_root_start_tag(self.fh.read(4096))
+
+        for page_xml in self._iter_page_xmls():
+            root = etree.fromstring(root_start_tag + page_xml + b'</mediawiki>')
+            yield 'end', root[0]
+
+    def _get_dump_progress(self) -> Optional[float]:
+        # The indexed pages can be any slice of the XML file
+        return None
+
+    def _iter_page_xmls(self) -> Iterator[bytes]:
+        """
+        Seek to and read the indexed '<page>...</page>' XMLs
+        """
+
+        for offset, length in self.index_entries:
+            self.fh.seek(offset)
+            yield self.fh.read(length)
+
+
+def iter_page_xmls(fh: BinaryIO, chunk_size: int = 1 << 24) -> Iterator[Tuple[int, bytes]]:
+    """
+    Find the '<page>...</page>' elements in the Wikipedia XML without parsing the XML. This works
+    because '<' is always escaped within the elements' texts.
+
+    :param fh: File Handle from the XML File to scan
+    :param chunk_size: Number of bytes read at once
+    :return: Yield (byte offset, page XML) for each '<page>' element
+    """
+
+    buffer = b''
+    buffer_offset = fh.tell()  # file offset of buffer[0]
+    pos = 0
+
+    while True:
+        start = buffer.find(b'<page>', pos)
+        end = buffer.find(b'</page>', start) if start != -1 else -1
+
+        if end != -1:
+            end += len(b'</page>')
+            yield buffer_offset + start, buffer[start:end]
+            pos = end
+            continue
+
+        chunk = fh.read(chunk_size)
+        if not chunk:
+            return
+
+        # Keep an incomplete page or a possibly truncated '<page>' tag
+        keep = start if start != -1 else max(len(buffer) - len(b'<page>'), pos)
+        buffer = buffer[keep:] + chunk
+        buffer_offset += keep
+        pos = 0
+
+
+title_pattern = re.compile(rb'<title>(.*?)</title>', re.DOTALL)
+
+
+def get_raw_page_title(page_xml: bytes) -> str:
+    """
+    Get the title from raw '<page>...</page>' XML without parsing it. As '<' is escaped
+    within the page text, the '<title>' element can be found by simple pattern matching.
+    """
+
+    title_match = title_pattern.search(page_xml)
+
+    return html.unescape(title_match.group(1).decode('utf-8')) if title_match else ''
+
+
+def get_root_start_tag(xml_head: bytes) -> bytes:
+    """
+    :param xml_head: Start of the Wikipedia XML, e.g. b'<mediawiki xmlns="..." ...><siteinfo>...'
+    :return: '<mediawiki>' start tag including the namespace declarations
+    """
+
+    return re.search(rb'<mediawiki[^>]*>', xml_head).group(0)
+
+
+def _read_stream_offsets(index_bz2: str) -> List[int]:
+    """
+    :param index_bz2: Path to multistream index, lines of the form 'offset:page_id:page_title'
+    :return: Sorted, distinct byte offsets of the page streams
+    """
+
+    stream_offsets = []
+
+    with bz2.open(index_bz2, 'rt', encoding='utf-8') as fh:
+        for line in fh:
+            offset = int(line.split(':', 1)[0])
+            if not stream_offsets or stream_offsets[-1] != offset:
+                stream_offsets.append(offset)
+
+    return sorted(set(stream_offsets))
+
+
+def _decompress_stream(dump_bz2: str, start: int, end: int) -> bytes:
+    """
+    Decompress the single bz2 stream located at [start, end) in the multistream dump
+    """
+
+    with open(dump_bz2, 'rb') as fh:
+        fh.seek(start)
+        compressed = fh.read(end - start)
+
+    return bz2.BZ2Decompressor().decompress(compressed)
+
+
+def get_multistream_index_path(dump_bz2: str) -> str:
+    """
+    Derive default index path, e.g. 'enwiki-...-multistream.xml.bz2' -> 'enwiki-...-multistream-index.txt.bz2'
+    """
 
-            yield {'title': title, 'redirect': redirect, 'text': text}
+    return re.sub(r'\.xml\.bz2$', '-index.txt.bz2', dump_bz2)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,277 @@
+import html
+import re
+from typing import List, Optional, Tuple
+
+import wikitextparser as wtp
+
+Link = Tuple[str, Optional[str]]  # (title, text) of wikilink, text is None if not given
+
+# Placeholders for table markup in the converted text, replaced when the table is closed
+ROW_SEP = '\x1e'
+CELL_SEP = '\x1f'
+
+FILE_EXTENSIONS = {
+    'bmp', 'djvu', 'gif', 'iff', 'jb2', 'jp2', 'jpc', 'jpeg', 'jpg', 'jpx', 'mid', 'mka', 'mkv', 'mp3', 'oga',
+    'ogg', 'ogv', 'ogx', 'opus', 'pdf', 'png', 'psd', 'spx', 'stl', 'svg', 'swc', 'swf', 'tif', 'tiff', 'wbmp',
+    'webm', 'webp', 'wmf', 'xbm', 'xcf',
+}
+
+
+class Converter:
+    """
+    Converts page markup to plain text and extracts the wikilinks in the process
+    """
+
+    def convert(self, markup: str) -> Tuple[List[Link], str]:
+        """
+        :return: (links, plain_text)
+        """
+
+        raise NotImplementedError()
+
+
+class WtpConverter(Converter):
+    """
+    Reference implementation, builds the complete wikitextparser AST
+    """
+
+    def convert(self, markup: str) -> Tuple[List[Link], str]:
+        parsed = wtp.parse(markup)
+
+        links = [(link.title, link.text) for link in parsed.wikilinks]
+
+        return links, parsed.plain_text()
+
+
+class FastConverter(Converter):
+    """
+    Single pass over the markup's tokens that approximates WtpConverter's output:
+
+        - Templates, parser functions and parameters are removed
+        - Wikilinks are replaced by their text (or title), file links are removed
+        - External links are replaced by their text, bare URLs are kept
+        - Tags and comments are removed (but not the tags' contents)
+        - Bold and italic quotes are removed, HTML entities are unescaped
+        - Table markup is removed, leaving cells separated by tabs and rows by new lines
+
+    Like WtpConverter, it also extracts the wikilinks nested in templates, tags and other links.
+    Malformed markup may be converted differently, see tools/compare_converters.py.
+    """
+
+    # Each match is the text up to the next token plus the token. All tokens start with one of
+    # '<{}[]'|!\n', so the text is consumed by a single character class loop. Table tokens
+    # include the new line they start at. Special characters that do not start a token are
+    # matched as 'char', the end of the markup as 'end', so the loop never needs to backtrack.
+    token_pattern = re.compile(
+        r'[^<{}\[\]\'|!\n]*(?:'
+        r'(?P<comment><!--.*?(?:-->|$))'
+        r'|(?P<nowiki><nowiki>.*?</nowiki>)'
+        r'|(?P<tag></?[a-zA-Z][^<>]*>)'
+        r'|(?P<open_braces>\{\{+)'
+        r'|(?P<close_braces>\}\}+)'
+        r'|(?P<open_link>\[\[)'
+        r'|(?P<close_link>\]\])'
+        r'|(?P<open_ext_link>\[(?=(?:https?:|ftp:|//)))'
+        r'|(?P<close_ext_link>\])'
+        r'|(?P<quotes>\'{2,5})'
+        r'|(?P<table_start>\n[ \t]*\{\|[^\n]*)'
+        r'|(?P<table_end>\n[ \t]*\|\})'
+        r'|(?P<table_row>\n[ \t]*\|[-+][^\n]*)'
+        r'|(?P<table_cell>\n[ \t]*[|!])'
+        r'|(?P<cell_sep>\|\||!!)'
+        r'|(?P<pipe>\|)'
+        r'|(?P<char>.)'
+        r'|(?P<end>$))',
+        re.DOTALL)
+
+    def convert(self, markup: str) -> Tuple[List[Link], str]:
+        links: List[Link] = []
+
+        # Frames of the currently open constructs: [kind, start, buffer, pipe_pos(, link_index)],
+        # pipe_pos = buffer length at the first top-level '|' (links) or at the cell start (tables).
+        # Closing a frame emits its converted text into the parent frame.
+        root = ['root', 0, [], None]
+        stack = [root]
+
+        def emit(text: str):
+            stack[-1][2].append(text)
+
+        def in_table_cell() -> bool:
+            return stack[-1][0] == 'table'
+
+        # Leading new line lets table tokens match at the start of the markup, removed at the end
+        markup = '\n' + markup
+
+        for match in self.token_pattern.finditer(markup):
+            kind = match.lastgroup
+            token_start = match.start(kind)
+
+            if token_start > match.start():
+                emit(markup[match.start():token_start])
+
+            token = match.group(kind)
+            frame = stack[-1]
+
+            if kind == 'char':
+                emit(token)
+
+            elif kind == 'comment' or kind == 'tag' or kind == 'quotes':
+                pass
+
+            elif kind == 'nowiki':
+                emit(token[8:-9])
+
+            elif kind == 'open_link':
+                # Reserve the link's slot to keep the links ordered by their start like WtpConverter
+                links.append(None)
+                stack.append(['link', token_start, [], None, len(links) - 1])
+
+            elif kind == 'open_braces':
+                self._open_braces(len(token), token_start, stack, emit)
+
+            elif kind == 'close_braces':
+                self._close_braces(len(token), stack, emit)
+
+            elif kind == 'open_ext_link':
+                stack.append(['ext_link', token_start, [], None])
+
+            elif kind == 'close_link' and frame[0] == 'link':
+                stack.pop()
+                self._close_link(markup, frame, match.end(), links, emit)
+
+            elif kind == 'close_ext_link' and frame[0] == 'ext_link':
+                stack.pop()
+
+                # '[url text]' -> 'text'
+                content = ''.join(frame[2])
+                if ' ' in content:
+                    emit(content.split(' ', 1)[1])
+
+            elif kind == 'table_start' and frame[0] in ('root', 'table'):
+                emit('\n')
+                stack.append(['table', token_start, [], None])
+
+            elif kind == 'table_end' and frame[0] == 'table':
+                stack.pop()
+                emit(self._table_to_text(''.join(frame[2])))
+
+            elif kind == 'table_row' and in_table_cell():
+                emit(ROW_SEP)
+
+            elif kind in ('table_cell', 'cell_sep') and in_table_cell():
+                emit(CELL_SEP)
+                frame[3] = len(frame[2])
+
+            elif kind == 'pipe' and frame[0] == 'link' and frame[3] is None:
+                frame[3] = len(frame[2])
+                emit(token)
+
+            elif kind == 'pipe' and in_table_cell() and frame[3] is not None:
+                # 'attributes | content' -> 'content'
+                del frame[2][frame[3]:]
+
+            elif kind == 'end':
+                break
+
+            else:
+                emit(token)
+
+        # Unclosed constructs are kept as text
+        while len(stack) > 1:
+            frame = stack.pop()
+            opening = {'param': '{{{', 'template': '{{', 'link': '[[', 'ext_link': '['}.get(frame[0], '')
+            emit(opening + ''.join(frame[2]))
+
+        return [link for link in links if link is not None], html.unescape(''.join(root[2])[1:])
+
+    @staticmethod
+    def _table_to_text(content: str) -> str:
+        """
+        Cells separated by tabs and padded to the column width, like wtp
+        """
+
+        rows = [[cell.strip() for cell in row.split(CELL_SEP)[1:]] for row in content.split(ROW_SEP)]
+        rows = [row for row in rows if row]
+
+        if not rows:
+            return ''
+
+        widths = [0] * max(len(row) for row in rows)
+        for row in rows:
+            for index, cell in enumerate(row[:-1]):
+                widths[index] = max(widths[index], len(cell))
+
+        return '\n' + '\n'.join('\t'.join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows) + '\n'
+
+    @staticmethod
+    def _open_braces(count: int, start: int, stack: list, emit):
+        """
+        '{{' opens a template or parser function, '{{{' a parameter. Longer runs
+        are resolved like '{{{{{' = '{{' + '{{{'.
+        """
+
+        if count % 2 == 1 and count != 3:
+            emit('{')
+            count -= 1
+            start += 1
+
+        while count > 0:
+            if count == 3:
+                stack.append(['param', start, [], None])
+                return
+
+            stack.append(['template', start, [], None])
+            count -= 2
+            start += 2
+
+    @staticmethod
+    def _close_braces(count: int, stack: list, emit):
+        """
+        Close the innermost templates and parameters, keep unmatched braces as text
+        """
+
+        while count >= 2:
+            frame = stack[-1]
+
+            if frame[0] == 'template':
+                stack.pop()
+                count -= 2
+
+            elif frame[0] == 'param' and count >= 3:
+                stack.pop()
+                count -= 3
+
+                # Parameter -> default value
+                content = ''.join(frame[2])
+                if '|' in content:
+                    stack[-1][2].append(content.split('|', 1)[1])
+
+            else:
+                break
+
+        if count > 0:
+            emit('}' * count)
+
+    def _close_link(self, markup: str, frame: list, end: int, links: List[Link], emit):
+        _, start, buffer, pipe_pos, link_index = frame
+
+        inner = markup[start + 2:end - 2]
+        target, text = inner.split('|', 1) if '|' in inner else (inner, None)
+        title = target.split('#', 1)[0]
+
+        links[link_index] = (title, text)
+
+        # Same file link detection as wtp
+        if title[:1] != ':' and title.partition(':')[2].rpartition('.')[2].lower() in FILE_EXTENSIONS:
+            return
+
+        if pipe_pos is not None:
+            emit(''.join(buffer[pipe_pos + 1:]))
+        else:
+            emit(''.join(buffer))
+
+
+CONVERTERS = {
+    'wtp': WtpConverter,
+    'fast': FastConverter,
+}
@@ -27,3 +27,36 @@
 #         expected_cropped_context = 'About 80 million people live in Germany.'
 #         self.assertEqual(cropped_context_rows[0][0], expected_cropped_context)
 #         self.assertEqual(cropped_context_rows[0][1], page_title)
+
+
+import random
+from unittest import TestCase
+
+from entity_context_crawler.cmd.build_contexts_db import iter_entity_tasks
+from entity_context_crawler.dao.entity_index import Entity
+
+
+class Test(TestCase):
+    def test_iter_entity_tasks_1(self):
+        entities = [Entity('Q{}'.format(i), 'Label {}'.format(i), 'Page {}'.format(i), None) for i in range(20)]
+        entities[3].page_title = None
+
+        mid2rid = {entity.mid: rid for rid, entity in enumerate(entities) if entity.mid != 'Q5'}
+
+        tasks = list(iter_entity_tasks(entities, mid2rid, None, random.Random(42)))
+
+        # Entities without RID or page are skipped
+        self.assertEqual(sorted(set(mid2rid) - {'Q3'}), sorted(task.mid for task in tasks))
+        self.assertEqual(['Label {}'.format(mid2rid[task.mid]) for task in tasks], [task.label for task in tasks])
+
+        # Same seed, same order and same seeds per entity
+        self.assertEqual(tasks, list(iter_entity_tasks(entities, mid2rid, None, random.Random(42))))
+        self.assertEqual(len(tasks), len({task.seed for task in tasks}))
+
+    def test_iter_entity_tasks_2(self):
+        entities = [Entity('Q{}'.format(i), 'Label {}'.format(i), 'Page {}'.format(i), None) for i in range(20)]
+        mid2rid = {entity.mid: rid for rid, entity in enumerate(entities)}
+
+        tasks = list(iter_entity_tasks(entities, mid2rid, 5, random.Random(42)))
+
+        self.assertEqual([0, 1, 2, 3, 4], [task.entity_count for task in tasks])
@@ -0,0 +1,114 @@
+from unittest import TestCase
+
+import spacy
+
+from entity_context_crawler.cmd.build_matches_db import clean_up_texts, get_entity_tables, clean_up_texts_and_sents, \
+    match_page, EntityTables, get_corpus_settings_warnings
+from entity_context_crawler.dao.corpus_db import ParsedPage
+from entity_context_crawler.util.alias_matcher import AliasMatcher, get_alias_to_mids
+
+
+class Test(TestCase):
+    def test_clean_up_texts_1(self):
+        nlp = spacy.blank('en')
+        nlp.add_pipe('sentencizer')
+
+        page_texts = [
+            'Germany is a country in Central Europe and borders on nine countries. Short one.\n'
+            'Infobox | capital = Berlin | population = 83 million people in total\n'
+            'Its capital and largest city is Berlin, which has 3.7 million inhabitants.',
+
+            'too short',
+
+            'France is a country in Western Europe and borders on eight countries.',
+        ]
+
+        expected_clean_page_texts = [
+            'Germany is a country in Central Europe and borders on nine countries.\n\n'
+            'Its capital and largest city is Berlin, which has 3.7 million inhabitants.',
+
+            '',
+
+            'France is a country in Western Europe and borders on eight countries.',
+        ]
+
+        self.assertEqual(expected_clean_page_texts, clean_up_texts(nlp, page_texts, batch_size=1))
+        self.assertEqual(expected_clean_page_texts, clean_up_texts(nlp, page_texts, batch_size=2))
+
+    def test_clean_up_texts_and_sents_1(self):
+        nlp = spacy.blank('en')
+        nlp.add_pipe('sentencizer')
+
+        page_text = 'Germany is a country in Central Europe and borders on nine countries.' \
+                    ' It is the second-most populous country in Europe after Russia.\n' \
+                    'Its capital and largest city is Berlin, which has 3.7 million inhabitants.'
+
+        [(clean_page_text, sent_offsets)] = clean_up_texts_and_sents(nlp, [page_text])
+
+        self.assertEqual(['Germany is a country in Central Europe and borders on nine countries.',
+                          'It is the second-most populous country in Europe after Russia.',
+                          'Its capital and largest city is Berlin, which has 3.7 million inhabitants.'],
+                         [clean_page_text[start:end] for start, end in sent_offsets])
+
+    def test_get_corpus_settings_warnings_1(self):
+        corpus_settings = {'wiki_xml': 'wikipedia.xml', 'spacy_model': 'en_core_web_lg', 'spacy_profile': 'full',
+                           'converter': 'fast'}
+
+        self.assertEqual(get_corpus_settings_warnings(corpus_settings, 'en_core_web_lg', 'fast'), [])
+        self.assertEqual(len(get_corpus_settings_warnings(corpus_settings, 'en_core_web_lg', 'wtp')), 1)
+        self.assertEqual(len(get_corpus_settings_warnings(corpus_settings, 'en_core_web_sm', 'wtp')), 2)
+
+    def test_get_entity_tables_1(self):
+        freebase_data = {
+            '/m/0345h': {'label': 'Germany', 'wikipedia': 'https://en.wikipedia.org/wiki/Germany'},
+            '/m/0d9jr': {'label': 'AT&T', 'wikipedia': 'https://en.wikipedia.org/wiki/AT%26T_Inc.'},
+            '/m/0abc1': {'label': 'Unknown', 'wikipedia': None},
+        }
+
+        entity_tables = get_entity_tables(freebase_data)
+
+        self.assertEqual({'Germany': '/m/0345h', 'AT&T Inc.': '/m/0d9jr'}, entity_tables.entity_page_title_to_mid)
+        self.assertEqual({'/m/0345h': 'Germany', '/m/0d9jr': 'AT&T', '/m/0abc1': 'Unknown'},
+                         entity_tables.mid_to_label)
+
+    def test_match_page_1(self):
+        nlp = spacy.blank('en')
+
+        entity_tables = EntityTables({'Berlin': '/m/0156q', 'Germany': '/m/0345h'},
+                                     {'/m/0156q': 'Berlin', '/m/0345h': 'Germany', '/m/0f8l9c': 'France'})
+
+        clean_text = 'Berlin is the capital of Germany. The German capital borders on France.'
+        parsed_page = ParsedPage('Capital', len(clean_text), clean_text, [], [('Berlin', None), ('Germany', None)])
+
+        # Page match mode - only link texts
+        _, db_matches, _ = match_page(nlp, parsed_page, entity_tables)
+
+        self.assertEqual([('/m/0156q', 'Berlin', 0), ('/m/0345h', 'Germany', 25)],
+                         [(match.mid, match.mention, match.start_char) for match in db_matches])
+
+        # Global match mode - all aliases of linked entities, i.e. not 'France'
+        alias_to_mids = get_alias_to_mids(entity_tables.mid_to_label, [('/m/0156q', 'German capital')])
+        _, db_matches, db_mentions = match_page(nlp, parsed_page, entity_tables, AliasMatcher(nlp, alias_to_mids))
+
+        self.assertEqual([('/m/0156q', 'Berlin', 0), ('/m/0345h', 'Germany', 25), ('/m/0156q', 'German capital', 38)],
+                         [(match.mid, match.mention, match.start_char) for match in db_matches])
+        self.assertEqual([('/m/0156q', 'Berlin'), ('/m/0345h', 'Germany'), ('/m/0156q', 'German capital')],
+                         [(mention.mid, mention.mention) for mention in db_mentions])
+
+    def test_match_page_2(self):
+        nlp = spacy.blank('en')
+
+        entity_tables = EntityTables({'Barack Obama': '/m/02mjmr', 'Berlin': '/m/0156q'},
+                                     {'/m/02mjmr': 'Barack Obama', '/m/0156q': 'Berlin'})
+
+        clean_text = 'Obama visited Berlin. Barack Obama spoke in Berlin.'
+        parsed_page = ParsedPage('Visit', len(clean_text), clean_text, [],
+                                 [('Barack Obama', 'Obama'), ('Berlin', None)])
+
+        # Global match mode without further aliases - labels plus the page's (piped) link texts
+        alias_to_mids = get_alias_to_mids(entity_tables.mid_to_label, [])
+        _, db_matches, _ = match_page(nlp, parsed_page, entity_tables, AliasMatcher(nlp, alias_to_mids))
+
+        self.assertEqual([('/m/02mjmr', 'Obama', 0), ('/m/0156q', 'Berlin', 14), ('/m/02mjmr', 'Barack Obama', 22),
+                          ('/m/02mjmr', 'Obama', 29), ('/m/0156q', 'Berlin', 44)],
+                         [(match.mid, match.mention, match.start_char) for match in db_matches])
@@ -0,0 +1,13 @@
+from unittest import TestCase
+
+from entity_context_crawler.dao.aliases_txt import load_aliases
+
+
+class Test(TestCase):
+    def test_load_aliases_1(self):
+        aliases = load_aliases('tests/unit/dao/test_aliases_txt_file.txt')
+
+        self.assertEqual([('/m/0345h', 'Germany'),
+                          ('/m/0345h', 'Federal Republic of Germany'),
+                          ('/m/0156q', 'Berlin'),
+                          ('/m/0156q', 'German capital')], aliases)
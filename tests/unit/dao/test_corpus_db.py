@@ -0,0 +1,41 @@
+import sqlite3
+from os.path import join
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from entity_context_crawler.dao.corpus_db import ParsedPage, create_parsed_pages_table, insert_parsed_pages, \
+    select_parsed_pages, select_parsed_page, is_corpus_db
+
+
+class Test(TestCase):
+    parsed_pages = [
+        ParsedPage('Germany', 120, 'Germany is a country. Its capital is Berlin.', [(0, 21), (22, 44)],
+                   [('Berlin', None), ('Europe', 'European')]),
+        ParsedPage('France', 80, 'France is a country.', [(0, 20)], [('Paris', 'capital')]),
+        ParsedPage('Italy', 10, '', [], []),
+    ]
+
+    def test_parsed_pages_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            corpus_db = join(tmp_dir, 'corpus.db')
+
+            with sqlite3.connect(corpus_db) as corpus_conn:
+                create_parsed_pages_table(corpus_conn)
+                insert_parsed_pages(corpus_conn, list(enumerate(self.parsed_pages)))
+
+                self.assertEqual(self.parsed_pages, list(select_parsed_pages(corpus_conn)))
+                self.assertEqual(self.parsed_pages[1:2], list(select_parsed_pages(corpus_conn, 1, 2)))
+                self.assertEqual(self.parsed_pages[1], select_parsed_page(corpus_conn, 'France'))
+                self.assertIsNone(select_parsed_page(corpus_conn, 'Spain'))
+
+            self.assertTrue(is_corpus_db(corpus_db))
+
+    def test_is_corpus_db_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            other_db = join(tmp_dir, 'other.db')
+
+            with sqlite3.connect(other_db) as other_conn:
+                other_conn.execute('CREATE TABLE pages (title TEXT)')
+
+            self.assertFalse(is_corpus_db(other_db))
+            self.assertFalse(is_corpus_db('tests/integration/data/wikipedia.xml'))
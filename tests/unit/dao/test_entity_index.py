@@ -0,0 +1,56 @@
+import pickle
+from os.path import join
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from entity_context_crawler.dao.entity_index import Entity, write_entity_index, EntityIndex, is_entity_index, \
+    get_page_title
+
+
+class Test(TestCase):
+    entities = [
+        Entity('/m/0345h', 'Germany', 'Germany', 3),
+        Entity('/m/0d9jr', 'AT&T', 'AT&T Inc.', None),
+        Entity('/m/01mjq', 'Czech Republic', 'Czechia', 7),
+        Entity('/m/0abc1', 'Unknown', None, 1),
+        Entity('/m/0xyz2', 'Czech Rep.', 'Czechia', None),
+        Entity('/m/0_ue', 'Düsseldorf', 'Düsseldorf', 0),
+    ]
+
+    def test_entity_index_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            path = join(tmp_dir, 'entity-index.bin')
+            write_entity_index(path, self.entities)
+
+            self.assertTrue(is_entity_index(path))
+
+            entity_index = EntityIndex(path)
+
+            self.assertEqual(self.entities, list(entity_index.entities))
+
+            # Like in a dict, the last entity wins for duplicate titles
+            self.assertEqual({'Germany': '/m/0345h', 'AT&T Inc.': '/m/0d9jr', 'Czechia': '/m/0xyz2',
+                              'Düsseldorf': '/m/0_ue'}, dict(entity_index.title_to_mid))
+
+            self.assertEqual({entity.mid: entity.label for entity in self.entities}, dict(entity_index.mid_to_label))
+
+            self.assertEqual({'/m/0345h': 3, '/m/01mjq': 7, '/m/0abc1': 1, '/m/0_ue': 0},
+                             dict(entity_index.mid_to_rid))
+
+            self.assertNotIn('Berlin', entity_index.title_to_mid)
+            self.assertNotIn('/m/0d9jr', entity_index.mid_to_rid)
+
+            with self.assertRaises(KeyError):
+                _ = entity_index.mid_to_label['/m/0zzzz']
+
+    def test_entity_index_2(self):
+        with TemporaryDirectory() as tmp_dir:
+            path = join(tmp_dir, 'entity-index.bin')
+            write_entity_index(path, self.entities)
+
+            unpickled_entity_index = pickle.loads(pickle.dumps(EntityIndex(path)))
+
+            self.assertEqual('AT&T', unpickled_entity_index.mid_to_label['/m/0d9jr'])
+
+    def test_get_page_title_1(self):
+        self.assertEqual('AT&T Inc.', get_page_title('https://en.wikipedia.org/wiki/AT%26T_Inc.'))
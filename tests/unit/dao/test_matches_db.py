@@ -0,0 +1,306 @@
+import random
+import sqlite3
+from os.path import join
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from entity_context_crawler.dao.matches_db import Checkpoint, create_checkpoint_tables, update_checkpoint, \
+    select_checkpoint, create_pages_table, create_matches_table, create_mentions_table, insert_pages, \
+    insert_matches, insert_or_ignore_mentions, insert_from_matches_db, Page, PageStats, Match, Mention, TextStorage, \
+    compress_page, create_text_storage_tables, select_text_storage, select_text_window, select_contexts, \
+    select_max_rowids, insert_into_matches_db, cut_windows, WINDOW_SEPARATOR, sample_match_rowids, \
+    select_contexts_by_rowids, PageTextCache
+
+
+def create_matches_db(path: str, page_titles, text_storage=None):
+    with sqlite3.connect(path) as conn:
+        create_pages_table(conn)
+        create_matches_table(conn)
+        create_mentions_table(conn)
+
+        pages = [Page(title, 'Berlin is the capital of Germany.', PageStats(1, 1, 1, 1, 40, 33, 1))
+                 for title in page_titles]
+
+        if text_storage:
+            create_text_storage_tables(conn, text_storage)
+            pages = [compress_page(page, text_storage) for page in pages]
+
+        insert_pages(conn, pages)
+        insert_matches(conn, [Match('/m/0156q', 'Berlin', 'Berlin', title, 0, 6, 'Berlin is the')
+                              for title in page_titles])
+        insert_or_ignore_mentions(conn, [Mention('/m/0156q', 'Berlin', 'Berlin')])
+
+
+class Test(TestCase):
+    def test_checkpoint_1(self):
+        checkpoint = Checkpoint()
+
+        for position in [1, 3, 0, 4]:
+            checkpoint.add(position)
+
+        self.assertEqual(checkpoint.low_watermark, 2)
+        self.assertEqual(checkpoint.positions, {3, 4})
+
+        self.assertTrue(checkpoint.is_done(0))
+        self.assertTrue(checkpoint.is_done(1))
+        self.assertFalse(checkpoint.is_done(2))
+        self.assertTrue(checkpoint.is_done(3))
+        self.assertFalse(checkpoint.is_done(5))
+
+    def test_checkpoint_2(self):
+        with sqlite3.connect(':memory:') as conn:
+            self.assertIsNone(select_checkpoint(conn))
+
+            create_checkpoint_tables(conn)
+            self.assertEqual(select_checkpoint(conn), Checkpoint(0, set()))
+
+            update_checkpoint(conn, Checkpoint(2, {3, 4}))
+            self.assertEqual(select_checkpoint(conn), Checkpoint(2, {3, 4}))
+
+    def test_checkpoint_3(self):
+        checkpoint = Checkpoint(2, {3, 4})
+        checkpoint_copy = checkpoint.copy()
+
+        checkpoint_copy.add(2)
+
+        self.assertEqual(checkpoint, Checkpoint(2, {3, 4}))
+        self.assertEqual(checkpoint_copy, Checkpoint(5, set()))
+
+    def test_cut_windows_1(self):
+        text = 'Berlin is the capital of Germany. Germany borders on France. Paris is the capital of France.'
+        page = Page('Europe', text, PageStats(3, 3, 3, 3, 100, len(text), 4))
+
+        matches = [Match('/m/0345h', 'Germany', 'Germany', 'Europe', 25, 32, 'Germany'),
+                   Match('/m/0156q', 'Berlin', 'Berlin', 'Europe', 0, 6, 'Berlin'),
+                   Match('/m/0345h', 'Germany', 'Germany', 'Europe', 34, 41, 'Germany'),
+                   Match('/m/0f8l9c', 'France', 'France', 'Europe', 85, 91, 'France')]
+
+        windowed_page, windowed_matches = cut_windows(page, matches, 5)
+
+        self.assertEqual(windowed_page.text, 'Berlin is t' + WINDOW_SEPARATOR + 'l of Germany. Germany bord'
+                         + WINDOW_SEPARATOR + 'l of France.')
+        self.assertEqual(windowed_page.stats, page.stats)
+
+        for match, windowed_match in zip(matches, windowed_matches):
+            self.assertEqual(windowed_page.text[windowed_match.start_char:windowed_match.end_char], match.mention)
+
+        with sqlite3.connect(':memory:') as plain_conn, sqlite3.connect(':memory:') as windowed_conn:
+            for conn, db_page, db_matches in [(plain_conn, page, matches),
+                                              (windowed_conn, windowed_page, windowed_matches)]:
+                create_pages_table(conn)
+                create_matches_table(conn)
+                insert_pages(conn, [db_page])
+                insert_matches(conn, db_matches)
+
+            for mid in ['/m/0156q', '/m/0345h', '/m/0f8l9c']:
+                for size in [0, 3, 5]:
+                    self.assertEqual(sorted(select_contexts(windowed_conn, mid, size)),
+                                     sorted(select_contexts(plain_conn, mid, size)))
+
+    def test_insert_from_matches_db_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            shard_0_db = join(tmp_dir, 'matches-0.db')
+            shard_1_db = join(tmp_dir, 'matches-1.db')
+
+            create_matches_db(shard_0_db, ['Germany', 'Berlin'])
+            create_matches_db(shard_1_db, ['Berlin', 'Europe'])
+
+            with sqlite3.connect(':memory:') as conn:
+                create_pages_table(conn)
+                create_matches_table(conn)
+                create_mentions_table(conn)
+
+                insert_from_matches_db(conn, shard_0_db)
+                insert_from_matches_db(conn, shard_1_db)
+
+                page_titles = [row[0] for row in conn.execute('SELECT title FROM pages ORDER BY title')]
+                match_pages = [row[0] for row in conn.execute('SELECT page FROM matches ORDER BY page')]
+                mentions_count = conn.execute('SELECT COUNT(*) FROM mentions').fetchone()[0]
+
+        self.assertEqual(page_titles, ['Berlin', 'Europe', 'Germany'])
+        self.assertEqual(match_pages, ['Berlin', 'Europe', 'Germany'])
+        self.assertEqual(mentions_count, 1)
+
+    def test_insert_from_matches_db_2(self):
+        text_storage = TextStorage('zlib', 8)
+
+        with TemporaryDirectory() as tmp_dir:
+            shard_0_db = join(tmp_dir, 'matches-0.db')
+            shard_1_db = join(tmp_dir, 'matches-1.db')
+
+            create_matches_db(shard_0_db, ['Germany', 'Berlin'], text_storage)
+            create_matches_db(shard_1_db, ['Berlin', 'Europe'], text_storage)
+
+            with sqlite3.connect(':memory:') as conn:
+                create_pages_table(conn)
+                create_matches_table(conn)
+                create_mentions_table(conn)
+                create_text_storage_tables(conn, text_storage)
+
+                insert_from_matches_db(conn, shard_0_db)
+                insert_from_matches_db(conn, shard_1_db)
+
+                chunk_pages = [row[0] for row in conn.execute('SELECT DISTINCT page FROM page_text_chunks '
+                                                              'ORDER BY page')]
+                window = select_text_window(conn, text_storage, 'Europe', 14, 21)
+
+        self.assertEqual(chunk_pages, ['Berlin', 'Europe', 'Germany'])
+        self.assertEqual(window, 'capital')
+
+    def test_insert_into_matches_db_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            disk_db = join(tmp_dir, 'matches.db')
+
+            with sqlite3.connect(':memory:') as conn:
+                create_pages_table(conn)
+                create_matches_table(conn)
+                create_mentions_table(conn)
+                create_checkpoint_tables(conn)
+
+                insert_pages(conn, [Page('Berlin', 'Berlin', PageStats(1, 1, 1, 1, 6, 6, 1))])
+                update_checkpoint(conn, Checkpoint(1, set()))
+                conn.commit()
+
+                with sqlite3.connect(disk_db) as disk_conn:
+                    conn.backup(disk_conn)
+
+                flushed_rowids = select_max_rowids(conn)
+                self.assertEqual(flushed_rowids, {'pages': 1, 'matches': 0, 'mentions': 0})
+
+                insert_pages(conn, [Page('Europe', 'Berlin', PageStats(1, 1, 1, 1, 6, 6, 1))])
+                insert_matches(conn, [Match('/m/0156q', 'Berlin', 'Berlin', 'Europe', 0, 6, 'Berlin')])
+                update_checkpoint(conn, Checkpoint(2, {4}))
+                conn.commit()
+
+                flushed_rowids = insert_into_matches_db(conn, disk_db, flushed_rowids)
+                self.assertEqual(flushed_rowids, {'pages': 2, 'matches': 1, 'mentions': 0})
+
+            with sqlite3.connect(disk_db) as disk_conn:
+                page_titles = [row[0] for row in disk_conn.execute('SELECT title FROM pages ORDER BY title')]
+                match_pages = [row[0] for row in disk_conn.execute('SELECT page FROM matches')]
+                checkpoint = select_checkpoint(disk_conn)
+
+        self.assertEqual(page_titles, ['Berlin', 'Europe'])
+        self.assertEqual(match_pages, ['Europe'])
+        self.assertEqual(checkpoint, Checkpoint(2, {4}))
+
+    def test_text_storage_1(self):
+        text = 'Berlin is the capital of Germany. Bärlin'
+
+        for text_storage in [TextStorage('zlib', None), TextStorage('zlib', 7), TextStorage('zlib', 1000)]:
+            chunks = text_storage.compress(text)
+            self.assertEqual(''.join(text_storage.decompress(chunk) for chunk in chunks), text)
+
+        self.assertEqual(len(TextStorage('zlib', 7).compress(text)), 6)
+        self.assertEqual(TextStorage('zlib', None).compress(''), [])
+
+    def test_select_text_window_1(self):
+        text = 'Berlin is the capital of Germany.'
+
+        for chunk_size in [None, 1, 5, 100]:
+            text_storage = TextStorage('zlib', chunk_size)
+
+            with sqlite3.connect(':memory:') as conn:
+                self.assertIsNone(select_text_storage(conn))
+
+                create_pages_table(conn)
+                create_text_storage_tables(conn, text_storage)
+                page = Page('Berlin', text, PageStats(1, 1, 1, 1, 40, 33, 1))
+                insert_pages(conn, [compress_page(page, text_storage)])
+
+                self.assertEqual(select_text_storage(conn), text_storage)
+
+                for start, end in [(0, 6), (3, 17), (25, 40), (10, 10), (0, 33)]:
+                    self.assertEqual(select_text_window(conn, text_storage, 'Berlin', start, end), text[start:end])
+
+    def test_select_contexts_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            plain_db = join(tmp_dir, 'matches.db')
+            compressed_db = join(tmp_dir, 'matches-compressed.db')
+
+            create_matches_db(plain_db, ['Germany', 'Berlin'])
+            create_matches_db(compressed_db, ['Germany', 'Berlin'], TextStorage('zlib', 4))
+
+            for size in [0, 3, 10, 100]:
+                with sqlite3.connect(plain_db) as plain_conn, sqlite3.connect(compressed_db) as compressed_conn:
+                    self.assertEqual(sorted(select_contexts(compressed_conn, '/m/0156q', size)),
+                                     sorted(select_contexts(plain_conn, '/m/0156q', size)))
+
+    def test_sample_match_rowids_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            matches_db = join(tmp_dir, 'matches.db')
+            create_matches_db(matches_db, ['Page {}'.format(i) for i in range(50)])
+
+            with sqlite3.connect(matches_db) as conn:
+                rowids, match_count = sample_match_rowids(conn, '/m/0156q', 10, random.Random(1))
+
+                self.assertEqual(50, match_count)
+                self.assertEqual(10, len(set(rowids)))
+                self.assertTrue(set(rowids) <= set(range(1, 51)))
+
+                # Reproducible for the same RNG state
+                self.assertEqual((rowids, 50), sample_match_rowids(conn, '/m/0156q', 10, random.Random(1)))
+
+                # No limit = all matches, shuffled
+                all_rowids, _ = sample_match_rowids(conn, '/m/0156q', None, random.Random(1))
+                self.assertEqual(list(range(1, 51)), sorted(all_rowids))
+
+                self.assertEqual(([], 0), sample_match_rowids(conn, '/m/unknown', 10, random.Random(1)))
+
+    def test_select_contexts_by_rowids_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            plain_db = join(tmp_dir, 'matches.db')
+            compressed_db = join(tmp_dir, 'matches-compressed.db')
+
+            create_matches_db(plain_db, ['Germany', 'Berlin', 'Europe'])
+            create_matches_db(compressed_db, ['Germany', 'Berlin', 'Europe'], TextStorage('zlib', 4))
+
+            for db in [plain_db, compressed_db]:
+                with sqlite3.connect(db) as conn:
+                    self.assertEqual({3: ('Berlin is', 'Europe', 'Berlin'), 1: ('Berlin is', 'Germany', 'Berlin')},
+                                     select_contexts_by_rowids(conn, [3, 1], 3))
+
+                    self.assertEqual(sorted(select_contexts(conn, '/m/0156q', 10)),
+                                     sorted(select_contexts_by_rowids(conn, [1, 2, 3], 10).values()))
+
+    def test_select_contexts_by_rowids_2(self):
+        with TemporaryDirectory() as tmp_dir:
+            plain_db = join(tmp_dir, 'matches.db')
+            compressed_db = join(tmp_dir, 'matches-compressed.db')
+
+            create_matches_db(plain_db, ['Germany', 'Berlin'])
+            create_matches_db(compressed_db, ['Germany', 'Berlin'], TextStorage('zlib', 4))
+
+            for db in [plain_db, compressed_db]:
+                with sqlite3.connect(db) as conn:
+                    insert_matches(conn, [Match('/m/0345h', 'Germany', 'Germany', 'Berlin', 25, 32, 'of Germany.')])
+
+                    page_cache = PageTextCache(1000)
+
+                    self.assertEqual({3: ('of Germany.', 'Berlin', 'Germany'), 2: ('Berlin is', 'Berlin', 'Berlin')},
+                                     select_contexts_by_rowids(conn, [3, 2], 3, page_cache))
+
+                    # The second call only reads the cached texts
+                    conn.execute('DELETE FROM pages')
+                    conn.execute('DROP TABLE IF EXISTS page_text_chunks')
+                    conn.execute('CREATE TABLE page_text_chunks (page TEXT, chunk INT, data BLOB)')
+
+                    self.assertEqual({2: ('Berlin is', 'Berlin', 'Berlin'), 3: ('of Germany.', 'Berlin', 'Germany')},
+                                     select_contexts_by_rowids(conn, [2, 3], 3, page_cache))
+
+    def test_page_text_cache_1(self):
+        page_cache = PageTextCache(10)
+
+        page_cache.put(('A', 0), 'aaaa')
+        page_cache.put(('B', 0), 'bbbb')
+        self.assertEqual('aaaa', page_cache.get(('A', 0)))
+
+        # Evicts the least recently used text
+        page_cache.put(('C', 0), 'cccc')
+        self.assertIsNone(page_cache.get(('B', 0)))
+        self.assertEqual('aaaa', page_cache.get(('A', 0)))
+        self.assertEqual(8, page_cache.chars)
+
+        # Texts larger than the cache are not cached
+        page_cache.put(('D', 0), 'd' * 11)
+        self.assertIsNone(page_cache.get(('D', 0)))
@@ -0,0 +1,102 @@
+import sqlite3
+import time
+from unittest import TestCase
+
+from entity_context_crawler.dao.matches_db import create_pages_table, create_matches_table, create_mentions_table, \
+    Page, PageStats, Match, Mention
+from entity_context_crawler.dao.matches_db_writer import MatchesDbWriter, WriterConfig
+
+
+class Test(TestCase):
+    def test_matches_db_writer_1(self):
+        with sqlite3.connect(':memory:', check_same_thread=False) as conn:
+            create_pages_table(conn)
+            create_matches_table(conn)
+            create_mentions_table(conn)
+
+            config = WriterConfig(commit_pages=3, commit_seconds=60, queue_size=2, synchronous='off')
+
+            with MatchesDbWriter(conn, config) as writer:
+                for i in range(10):
+                    title = 'Page {}'.format(i)
+                    page = Page(title, 'Berlin is the capital of Germany.', PageStats(1, 1, 1, 1, 40, 33, 1))
+                    match = Match('/m/0156q', 'Berlin', 'Berlin', title, 0, 6, 'Berlin is the')
+                    mention = Mention('/m/0156q', 'Berlin', 'Berlin')
+
+                    writer.put(page, [match], [mention])
+
+            self.assertEqual(writer.written_pages, 10)
+            self.assertEqual(writer.commits, 4)
+
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0], 10)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM matches').fetchone()[0], 10)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM mentions').fetchone()[0], 1)
+
+    def test_matches_db_writer_2(self):
+        with sqlite3.connect(':memory:', check_same_thread=False) as conn:
+
+            # No tables -> inserting fails
+            config = WriterConfig(commit_pages=1, commit_seconds=60, queue_size=1)
+
+            with self.assertRaises(sqlite3.OperationalError):
+                with MatchesDbWriter(conn, config) as writer:
+                    for i in range(10):
+                        writer.put(Page('Page', '', PageStats(0, 0, 0, 0, 0, 0, 0)), [], [])
+
+    def test_matches_db_writer_3(self):
+        with sqlite3.connect(':memory:', check_same_thread=False) as conn:
+            create_pages_table(conn)
+            create_matches_table(conn)
+            create_mentions_table(conn)
+
+            # Queue bounded by the page texts' length, single page longer than the bound is accepted
+            config = WriterConfig(commit_pages=2, commit_seconds=60, queue_size=100, queue_bytes=50)
+
+            with MatchesDbWriter(conn, config) as writer:
+                for i in range(10):
+                    text = 'Berlin is the capital of Germany.' * (5 if i == 5 else 1)
+                    writer.put(Page('Page {}'.format(i), text, PageStats(1, 1, 1, 1, 40, 33, 0)), [], [])
+
+                    self.assertLessEqual(writer.queued_bytes, max(len(text), 50))
+
+            self.assertEqual(writer.queued_bytes, 0)
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0], 10)
+
+    def test_matches_db_writer_4(self):
+        with sqlite3.connect(':memory:', check_same_thread=False) as conn:
+            create_pages_table(conn)
+            create_matches_table(conn)
+            create_mentions_table(conn)
+
+            # Flush after every 4 written pages, written in commits of 2 pages
+            config = WriterConfig(commit_pages=2, commit_seconds=60, queue_size=100, flush_pages=4)
+
+            flushed_page_counts = []
+
+            def flush():
+                flushed_page_counts.append(conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0])
+
+            with MatchesDbWriter(conn, config, flush=flush) as writer:
+                for i in range(10):
+                    writer.put(Page('Page {}'.format(i), '', PageStats(0, 0, 0, 0, 0, 0, 0)), [], [])
+
+            self.assertEqual(flushed_page_counts, [4, 8])
+            self.assertEqual(writer.flushes, 2)
+
+    def test_matches_db_writer_5(self):
+        with sqlite3.connect(':memory:', check_same_thread=False) as conn:
+            create_pages_table(conn)
+            create_matches_table(conn)
+            create_mentions_table(conn)
+
+            config = WriterConfig(commit_pages=100, commit_seconds=0.05, queue_size=100)
+
+            with MatchesDbWriter(conn, config) as writer:
+                writer.put(Page('Page', '', PageStats(0, 0, 0, 0, 0, 0, 0)), [], [])
+
+                # Idle for several commit intervals
+                time.sleep(0.5)
+
+            # One commit after commit_seconds, one on stop, but none while idle
+            self.assertEqual(writer.written_pages, 1)
+            self.assertEqual(writer.commits, 2)
@@ -0,0 +1,20 @@
+import sqlite3
+from unittest import TestCase
+
+from entity_context_crawler.dao.wiki_index_db import create_pages_table, insert_index_entries, select_index_entries, \
+    IndexEntry
+
+
+class Test(TestCase):
+    def test_select_index_entries_1(self):
+        index_entries = [IndexEntry(position, 'Page {}'.format(position), 0, position * 100, 100, position == 2)
+                         for position in range(5)]
+
+        with sqlite3.connect(':memory:') as conn:
+            create_pages_table(conn)
+            insert_index_entries(conn, index_entries)
+
+            self.assertEqual(list(select_index_entries(conn)), index_entries)
+            self.assertEqual(list(select_index_entries(conn, 1, 3)), index_entries[1:3])
+            self.assertEqual(list(select_index_entries(conn, 3)), index_entries[3:])
+            self.assertEqual(list(select_index_entries(conn, None, 2)), index_entries[:2])
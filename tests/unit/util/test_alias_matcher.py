@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+import spacy
+
+from entity_context_crawler.util.alias_matcher import AliasMatcher, get_alias_to_mids
+
+
+class Test(TestCase):
+    def test_get_alias_to_mids_1(self):
+        mid_to_label = {'/m/0156q': 'Berlin', '/m/0345h': 'Germany', '/m/0abc1': 'Berlin'}
+        mentions = [('/m/0345h', 'Federal Republic'), ('/m/0156q', 'German capital'), ('/m/unknown', 'Unknown')]
+
+        self.assertEqual({'Berlin': {'/m/0156q', '/m/0abc1'},
+                          'Germany': {'/m/0345h'},
+                          'Federal Republic': {'/m/0345h'},
+                          'German capital': {'/m/0156q'}},
+                         get_alias_to_mids(mid_to_label, mentions))
+
+    def test_alias_matcher_1(self):
+        nlp = spacy.blank('en')
+
+        alias_to_mids = {'Berlin': {'/m/0156q', '/m/0abc1'},
+                         'Germany': {'/m/0345h'},
+                         'German capital': {'/m/0156q'}}
+
+        alias_matcher = AliasMatcher(nlp, alias_to_mids, batch_size=2)
+
+        doc = nlp.make_doc('Berlin is the German capital. Germany borders on France.')
+
+        # 'Berlin' is ambiguous unless only one of its entities may be matched
+        self.assertEqual([('Berlin', '/m/0156q'), ('German capital', '/m/0156q')],
+                         [(span.text, mid) for span, mid in alias_matcher(doc, {'/m/0156q'})])
+
+        self.assertEqual([('German capital', '/m/0156q'), ('Germany', '/m/0345h')],
+                         [(span.text, mid) for span, mid in alias_matcher(doc, {'/m/0156q', '/m/0abc1', '/m/0345h'})])
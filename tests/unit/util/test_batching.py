@@ -0,0 +1,37 @@
+from unittest import TestCase
+
+from entity_context_crawler.util.batching import AdaptiveBatcher, iter_batches
+
+
+class Test(TestCase):
+    def test_batch_1(self):
+        batcher = AdaptiveBatcher(target_seconds=1.0, initial_bytes=10)
+
+        batches = list(batcher.batch(['aaaa', 'bbbb', 'cc', 'dddddddddddddddd', 'e'], len))
+
+        # Pages larger than the budget form a batch on their own
+        self.assertEqual([['aaaa', 'bbbb', 'cc'], ['dddddddddddddddd'], ['e']], batches)
+        self.assertEqual(3, batcher.batches)
+        self.assertEqual(5, batcher.items)
+
+    def test_batch_2(self):
+        batcher = AdaptiveBatcher(target_seconds=0)
+
+        self.assertEqual([['a'], ['b']], list(batcher.batch(['a', 'b'], len)))
+
+    def test_add_observation_1(self):
+        batcher = AdaptiveBatcher(target_seconds=0.5, initial_bytes=10, min_bytes=100, max_bytes=10000,
+                                  smoothing=0.5)
+
+        batcher.add_observation(1000, 1.0)  # 1 ms per byte
+        self.assertEqual(500, batcher.batch_bytes)
+
+        batcher.add_observation(1000, 3.0)  # 3 ms per byte -> average 2 ms per byte
+        self.assertEqual(250, batcher.batch_bytes)
+
+        batcher.add_observation(1000, 1000.0)
+        self.assertEqual(100, batcher.batch_bytes)
+
+    def test_iter_batches_1(self):
+        self.assertEqual([[0, 1, 2], [3, 4, 5], [6]], list(iter_batches(range(7), 3)))
+        self.assertEqual([], list(iter_batches([], 3)))
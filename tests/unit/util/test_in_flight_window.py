@@ -0,0 +1,43 @@
+import time
+from threading import Thread
+from unittest import TestCase
+
+from entity_context_crawler.util.in_flight_window import InFlightWindow
+
+
+class Test(TestCase):
+    def test_limit_1(self):
+        window = InFlightWindow(max_pages=3, max_bytes=100)
+
+        batches = window.limit([['a', 'b'], ['c', 'd'], ['e' * 500]], len)
+
+        self.assertEqual(['a', 'b'], next(batches))
+        self.assertEqual((2, 2), (window.pages, window.bytes))
+
+        # The next batch does not fit until the first one is released
+        released = []
+
+        def release():
+            time.sleep(0.1)
+            released.append(True)
+            window.release(2, 2)
+
+        Thread(target=release).start()
+
+        self.assertEqual(['c', 'd'], next(batches))
+        self.assertEqual([True], released)
+
+        # Too large batch is let through once the window is empty
+        window.release(2, 2)
+        self.assertEqual(['e' * 500], next(batches))
+        self.assertEqual((1, 500), (window.pages, window.bytes))
+
+    def test_close_1(self):
+        window = InFlightWindow(max_pages=1, max_bytes=100)
+
+        batches = window.limit([['a'], ['b']], len)
+        next(batches)
+
+        Thread(target=lambda: (time.sleep(0.1), window.close())).start()
+
+        self.assertEqual([], list(batches))
@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+from entity_context_crawler.dao.corpus_db import ParsedPage
+from entity_context_crawler.util.link_filter import LinkFilter
+
+
+class Test(TestCase):
+    def test_has_link_1(self):
+        link_filter = LinkFilter(['Berlin', 'AT&T'])
+
+        self.assertTrue(link_filter.has_link('The capital is [[Berlin]].'))
+        self.assertTrue(link_filter.has_link('The [[Berlin|German capital]] ...'))
+        self.assertTrue(link_filter.has_link('See [[Berlin#History|history]] ...'))
+        self.assertTrue(link_filter.has_link('[[[Berlin]]]'))
+        self.assertTrue(link_filter.has_link('{{Infobox|[[AT&T]]}}'))
+
+        self.assertFalse(link_filter.has_link('The capital is Berlin.'))
+        self.assertFalse(link_filter.has_link('The capital is [[Berlin, Germany]].'))
+        self.assertFalse(link_filter.has_link('[[berlin]]'))
+
+    def test_has_link_2(self):
+        link_filter = LinkFilter(['AT&T'])
+
+        self.assertTrue(link_filter.has_link(b'<page><text>Owned by [[AT&amp;T]]</text></page>'))
+        self.assertFalse(link_filter.has_link(b'<page><text>Owned by AT&amp;T</text></page>'))
+
+    def test_accept_1(self):
+        link_filter = LinkFilter(['Berlin'])
+
+        germany = {'title': 'Germany', 'redirect': None, 'text': 'The capital is [[Berlin]].'}
+        france = {'title': 'France', 'redirect': None, 'text': 'The capital is [[Paris]].'}
+
+        self.assertTrue(link_filter.accept(germany))
+        self.assertFalse(link_filter.accept(france))
+
+        self.assertTrue(link_filter.accept(b'<page><text>The capital is [[Berlin]].</text></page>'))
+
+        self.assertTrue(link_filter.accept(ParsedPage('Germany', 26, 'The capital is Berlin.', [(0, 22)],
+                                                      [('Berlin', None)])))
+        self.assertFalse(link_filter.accept(ParsedPage('France', 25, 'The capital is Paris.', [(0, 21)],
+                                                       [('Paris', None)])))
+
+        self.assertEqual(link_filter.skipped_pages, 2)
@@ -0,0 +1,76 @@
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from entity_context_crawler.util.metrics import Histogram, Metrics, write_snapshot
+
+
+class Test(TestCase):
+    def test_get_percentile_1(self):
+        histogram = Histogram(min_seconds=1.0, growth=2.0, bucket_count=8)
+
+        for seconds in [0.5, 1.5, 1.5, 3.0, 100.0]:
+            histogram.add(seconds)
+
+        # Buckets: <= 1, <= 2, <= 4, ..., <= 128
+        self.assertEqual(2.0, histogram.get_percentile(0.5))
+        self.assertEqual(4.0, histogram.get_percentile(0.8))
+
+        # Capped at the max duration
+        self.assertEqual(100.0, histogram.get_percentile(0.99))
+
+        self.assertEqual(5, histogram.count)
+        self.assertEqual(106.5, histogram.sum)
+
+    def test_get_percentile_2(self):
+        self.assertEqual(0.0, Histogram().get_percentile(0.5))
+
+    def test_get_snapshot_1(self):
+        metrics = Metrics()
+
+        metrics.increment('pages', 50)
+        metrics.add_durations({'convert': 0.01, 'match': 0.02})
+        metrics.add_duration('match', 0.03)
+
+        snapshot = metrics.get_snapshot(elapsed=10.0, progress=0.25)
+
+        self.assertEqual(50, snapshot['pages'])
+        self.assertEqual(5.0, snapshot['pages_per_second'])
+        self.assertEqual(30.0, snapshot['eta_seconds'])
+
+        self.assertEqual(['convert', 'match'], list(snapshot['stages']))
+        self.assertEqual(2, snapshot['stages']['match']['count'])
+        self.assertAlmostEqual(0.05, snapshot['stages']['match']['seconds'])
+
+    def test_get_snapshot_2(self):
+        snapshot = Metrics().get_snapshot(elapsed=10.0, progress=None)
+
+        self.assertIsNone(snapshot['eta_seconds'])
+
+    def test_write_snapshot_1(self):
+        metrics = Metrics()
+        metrics.increment('pages', 2)
+        metrics.add_duration('match', 0.5)
+
+        snapshot = metrics.get_snapshot(elapsed=1.0, progress=None)
+
+        with TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, 'metrics.json')
+            write_snapshot(json_path, snapshot)
+
+            with open(json_path, encoding='utf-8') as fh:
+                self.assertEqual(snapshot, json.load(fh))
+
+            prom_path = os.path.join(tmp_dir, 'metrics.prom')
+            write_snapshot(prom_path, snapshot)
+
+            with open(prom_path, encoding='utf-8') as fh:
+                lines = fh.read().splitlines()
+
+            self.assertIn('ecc_pages 2', lines)
+            self.assertIn('ecc_pages_per_second 2.0', lines)
+            self.assertIn('ecc_stage_seconds_p99{stage="match"} 0.5', lines)
+            self.assertNotIn('ecc_eta_seconds None', lines)
+
+            self.assertEqual(['metrics.json', 'metrics.prom'], sorted(os.listdir(tmp_dir)))
@@ -0,0 +1,41 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import spacy
+
+from entity_context_crawler.util.nlp import load_nlp, has_sents, _uses_static_vectors
+
+
+class Test(TestCase):
+    def test_load_nlp_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            spacy.blank('en').to_disk(tmp_dir)
+
+            nlp = load_nlp(tmp_dir, 'rule-sentencizer')
+            doc = nlp('Berlin is the capital. It is big.')
+
+            self.assertEqual(['sentencizer'], nlp.pipe_names)
+            self.assertEqual(['Berlin is the capital.', 'It is big.'], [sent.text for sent in doc.sents])
+
+    def test_load_nlp_2(self):
+        with TemporaryDirectory() as tmp_dir:
+            spacy.blank('en').to_disk(tmp_dir)
+
+            nlp = load_nlp(tmp_dir, 'tokenizer-only')
+
+            self.assertEqual([], nlp.pipe_names)
+
+    def test_has_sents_1(self):
+        self.assertTrue(has_sents('full'))
+        self.assertTrue(has_sents('senter-only'))
+        self.assertFalse(has_sents('tokenizer-only'))
+
+    def test_uses_static_vectors_1(self):
+        tok2vec_config = {'model': {'embed': {'@architectures': 'spacy.MultiHashEmbed.v2',
+                                              'include_static_vectors': True}}}
+
+        senter_config = {'model': {'tok2vec': {'@architectures': 'spacy.HashEmbedCNN.v2',
+                                               'pretrained_vectors': None}}}
+
+        self.assertTrue(_uses_static_vectors(tok2vec_config))
+        self.assertFalse(_uses_static_vectors(senter_config))
@@ -0,0 +1,44 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from entity_context_crawler.util.profiling import has_profiles, profile, profile_iter, remove_profiles, \
+    write_profile_report
+
+
+def _square_all(numbers):
+    return [number * number for number in numbers]
+
+
+class Test(TestCase):
+    def test_write_profile_report_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            self.assertFalse(has_profiles(tmp_dir))
+
+            with profile(tmp_dir, 'main'):
+                _square_all(range(100))
+
+            self.assertEqual([0, 1, 4], list(profile_iter(_square_all(range(3)), tmp_dir, 'reader')))
+
+            report_path = write_profile_report(tmp_dir)
+
+            pid = os.getpid()
+            self.assertEqual(['main-{}.prof'.format(pid), 'main.prof', 'reader-{}.prof'.format(pid), 'reader.prof',
+                              'report.txt'], sorted(os.listdir(tmp_dir)))
+
+            with open(report_path, encoding='utf-8') as fh:
+                report = fh.read()
+
+            self.assertIn('main | 1 profiles', report)
+            self.assertIn('reader | 1 profiles', report)
+            self.assertIn('_square_all', report)
+
+            remove_profiles(tmp_dir)
+            self.assertEqual(['report.txt'], os.listdir(tmp_dir))
+
+    def test_profile_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            with profile(None, 'main'):
+                _square_all(range(100))
+
+            self.assertFalse(has_profiles(tmp_dir))
@@ -0,0 +1,116 @@
+import bz2
+import re
+from os.path import join
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from entity_context_crawler.cmd.index_wiki import get_index_entry
+from entity_context_crawler.util.wikipedia import Wikipedia, MultistreamWikipedia, get_multistream_index_path, \
+    iter_page_xmls, IndexedWikipedia, parse_page_xml, MISSING_TEXT, SPECIAL_PAGE
+
+WIKI_XML = 'tests/integration/data/wikipedia.xml'
+
+
+def write_multistream(wiki_xml: str, dump_bz2: str, index_bz2: str, pages_per_stream: int):
+    """ Split the plain Wikipedia XML into a multistream dump with index, like on dumps.wikimedia.org """
+
+    with open(wiki_xml, 'rb') as fh:
+        xml = fh.read()
+
+    first_page_start = xml.index(b'<page>')
+    footer_start = xml.rindex(b'</mediawiki>')
+
+    header = xml[:first_page_start]
+    pages = re.findall(rb'<page>.*?</page>', xml[first_page_start:footer_start], re.DOTALL)
+    footer = xml[footer_start:]
+
+    index_lines = []
+    with open(dump_bz2, 'wb') as dump_fh:
+        dump_fh.write(bz2.compress(header))
+
+        for i in range(0, len(pages), pages_per_stream):
+            offset = dump_fh.tell()
+            stream_pages = pages[i:i + pages_per_stream]
+            for page_id, page in enumerate(stream_pages, start=i):
+                title = re.search(rb'<title>(.*?)</title>', page).group(1).decode('utf-8')
+                index_lines.append('{}:{}:{}\n'.format(offset, page_id, title))
+
+            dump_fh.write(bz2.compress(b'\n'.join(stream_pages)))
+
+        dump_fh.write(bz2.compress(footer))
+
+    with bz2.open(index_bz2, 'wt', encoding='utf-8') as index_fh:
+        index_fh.writelines(index_lines)
+
+
+class Test(TestCase):
+    def test_multistream_wikipedia_1(self):
+        with TemporaryDirectory() as tmp_dir:
+            dump_bz2 = join(tmp_dir, 'enwiki-multistream.xml.bz2')
+            index_bz2 = get_multistream_index_path(dump_bz2)
+            write_multistream(WIKI_XML, dump_bz2, index_bz2, 7)
+
+            with open(WIKI_XML, 'rb') as fh:
+                expected_pages = list(Wikipedia(fh))
+
+            actual_pages = list(MultistreamWikipedia(dump_bz2, index_bz2, processes=2, prefetch=3))
+
+            self.assertEqual(index_bz2, join(tmp_dir, 'enwiki-multistream-index.txt.bz2'))
+            self.assertEqual(len(actual_pages), 102)
+            self.assertEqual(actual_pages, expected_pages)
+
+    def test_multistream_wikipedia_2(self):
+        with TemporaryDirectory() as tmp_dir:
+            dump_bz2 = join(tmp_dir, 'enwiki-multistream.xml.bz2')
+            index_bz2 = get_multistream_index_path(dump_bz2)
+            write_multistream(WIKI_XML, dump_bz2, index_bz2, 10)
+
+            actual_pages = list(MultistreamWikipedia(dump_bz2, index_bz2, limit_pages=15, processes=2))
+
+            self.assertEqual(len(actual_pages), 15)
+
+    def test_iter_page_xmls_1(self):
+        with open(WIKI_XML, 'rb') as fh:
+            xml = fh.read()
+
+            fh.seek(0)
+            page_xmls = list(iter_page_xmls(fh, chunk_size=1000))
+
+        self.assertEqual(len(page_xmls), 102)
+        for offset, page_xml in page_xmls:
+            self.assertTrue(page_xml.startswith(b'<page>'))
+            self.assertTrue(page_xml.endswith(b'</page>'))
+            self.assertEqual(xml[offset:offset + len(page_xml)], page_xml)
+
+    def test_indexed_wikipedia_1(self):
+        with open(WIKI_XML, 'rb') as fh:
+            index_entries = [get_index_entry(position, offset, page_xml)
+                             for position, (offset, page_xml) in enumerate(iter_page_xmls(fh))]
+
+            fh.seek(0)
+            expected_pages = list(Wikipedia(fh))
+
+            offsets_and_lengths = [(entry.offset, entry.length) for entry in index_entries[10:20]]
+            actual_pages = list(IndexedWikipedia(fh, offsets_and_lengths))
+
+        self.assertEqual([entry.title for entry in index_entries], [page['title'] for page in expected_pages])
+        self.assertEqual(actual_pages, expected_pages[10:20])
+        self.assertEqual([entry.redirect for entry in index_entries[10:20]],
+                         [page['redirect'] is not None for page in expected_pages[10:20]])
+
+    def test_parse_page_xml_1(self):
+        page_xml = b'<page><title>Berlin</title><ns>0</ns><redirect title="Berlin, Germany" />' \
+                   b'<revision><text>Berlin is the capital of [[Germany]].</text></revision></page>'
+
+        page, skip_reason = parse_page_xml(page_xml)
+
+        self.assertEqual(page, {'title': 'Berlin', 'redirect': 'Berlin, Germany',
+                                'text': 'Berlin is the capital of [[Germany]].'})
+        self.assertIsNone(skip_reason)
+
+    def test_parse_page_xml_2(self):
+        special_page_xml = b'<page><title>Category:Capitals</title><revision><text>...</text></revision></page>'
+        empty_page_xml = b'<page><title>Berlin</title><revision><text /></revision></page>'
+
+        self.assertEqual(parse_page_xml(special_page_xml), (None, SPECIAL_PAGE))
+        self.assertEqual(parse_page_xml(empty_page_xml), (None, MISSING_TEXT))
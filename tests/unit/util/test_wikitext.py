@@ -0,0 +1,37 @@
+from unittest import TestCase
+
+from entity_context_crawler.util.wikitext import WtpConverter, FastConverter
+
+
+class Test(TestCase):
+    markups = [
+        'Hello [[A|b]] and [[A]]s {{cite|x [[Y]]}} <ref>cite [[Z]]</ref> <!-- comment --> &nbsp;x',
+        '[[File:a.jpg|thumb|caption [[L]] here]] text',
+        "'''Bold''' ''italic'' [http://x.org ext] [http://y.org] http://z.org",
+        '[[Category:Foo]] [[:Category:Bar|bar]] [[a#b|c]] [[a#b]]',
+        '== Head ==\n* item {{{param|default}}} <nowiki>[[n]]</nowiki>',
+        'a [[b c [[d]] e',
+    ]
+
+    def test_fast_converter_1(self):
+        """
+        Same output as the reference implementation for common markup
+        """
+
+        wtp_converter = WtpConverter()
+        fast_converter = FastConverter()
+
+        for markup in self.markups:
+            self.assertEqual(wtp_converter.convert(markup), fast_converter.convert(markup), markup)
+
+    def test_fast_converter_2(self):
+        links, text = FastConverter().convert('[[Berlin]] is the capital of {{flag|[[Germany]]}}.')
+
+        self.assertEqual([('Berlin', None), ('Germany', None)], links)
+        self.assertEqual('Berlin is the capital of .', text)
+
+    def test_fast_converter_3(self):
+        links, text = FastConverter().convert('{|\n|-\n! head\n|-\n| cell1 || cell2\n| style="x" | cell3\n|}\nafter')
+
+        self.assertEqual([], links)
+        self.assertEqual(['head', 'cell1', 'cell2', 'cell3', 'after'], text.split())
@@ -0,0 +1,101 @@
+"""
+Compare processing paragraphs/contexts one by one (--nlp-batch-size 1) with streaming them
+through nlp.pipe() in batches, for the page clean up done by `ecc build-matches-db` and the
+context cropping done by `ecc build-contexts-db`. Also checks that both paths give the same
+output. Run from the repo root, e.g.:
+
+    python tools/benchmark_nlp_batching.py tests/integration/data/wikipedia.xml --matches-db matches.db
+"""
+
+import sqlite3
+import sys
+import time
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+import wikitextparser as wtp
+from spacy.matcher import PhraseMatcher
+
+from entity_context_crawler.cmd.build_contexts_db import crop_contexts
+from entity_context_crawler.cmd.build_matches_db import clean_up_texts
+from entity_context_crawler.dao.matches_db import select_contexts, select_entity_mentions
+from entity_context_crawler.util.nlp import NLP_PROFILES, load_nlp
+from entity_context_crawler.util.wikipedia import Wikipedia
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('wiki_xml', metavar='wiki-xml')
+    parser.add_argument('--batch-sizes', dest='batch_sizes', type=int, nargs='+', default=[1, 16, 64, 256, 1024])
+    parser.add_argument('--context-size', dest='context_size', type=int, default=500)
+    parser.add_argument('--limit-pages', dest='limit_pages', type=int, default=None)
+    parser.add_argument('--matches-db', dest='matches_db', default=None,
+                        help='Also benchmark cropping the contexts of all entities in the matches DB')
+    parser.add_argument('--spacy-model', dest='spacy_model', default='en_core_web_lg')
+    parser.add_argument('--spacy-profile', dest='spacy_profile', choices=list(NLP_PROFILES), default='full')
+    args = parser.parse_args()
+
+    nlp = load_nlp(args.spacy_model, args.spacy_profile)
+
+    with open(args.wiki_xml, 'rb') as wiki_xml_fh:
+        page_texts = [wtp.parse(page['text']).plain_text() for page in Wikipedia(wiki_xml_fh, args.limit_pages)]
+
+    print('clean up ({:,} pages)'.format(len(page_texts)))
+    benchmark(args.batch_sizes, lambda batch_size: clean_up_texts(nlp, page_texts, batch_size), len(page_texts))
+
+    if args.matches_db:
+        with sqlite3.connect(args.matches_db) as matches_conn:
+            entity_contexts = get_entity_contexts(nlp, matches_conn, args.context_size)
+
+        def crop_all(batch_size):
+            return [crop_contexts(nlp, context_rows, True, entity_matcher, batch_size)
+                    for context_rows, entity_matcher in entity_contexts]
+
+        context_count = sum(len(context_rows) for context_rows, _ in entity_contexts)
+
+        print()
+        print('crop sentences ({:,} contexts of {:,} entities)'.format(context_count, len(entity_contexts)))
+        benchmark(args.batch_sizes, crop_all, context_count)
+
+
+def benchmark(batch_sizes, func, item_count):
+    reference_output = None
+
+    for batch_size in batch_sizes:
+        start_time = time.time()
+        output = func(batch_size)
+        duration = time.time() - start_time
+
+        if reference_output is None:
+            reference_output = output
+
+        print('    batch size {:5} | {:8.2f} s | {:10,.1f} items/s | {}'.format(
+            batch_size, duration, item_count / duration,
+            'same output' if output == reference_output else 'DIFFERENT OUTPUT'))
+
+
+def get_entity_contexts(nlp, matches_conn, context_size):
+    """
+    :return: [(context_rows, entity_matcher)] for each entity in the matches DB
+    """
+
+    cursor = matches_conn.cursor()
+    cursor.execute('SELECT DISTINCT mid, entity_label FROM matches')
+    mids_and_labels = cursor.fetchall()
+    cursor.close()
+
+    entity_contexts = []
+    for mid, entity_label in mids_and_labels:
+        entity_patterns = list({entity_label} | set(select_entity_mentions(matches_conn, mid)))
+        entity_matcher = PhraseMatcher(nlp.vocab)
+        entity_matcher.add('', list(nlp.pipe(entity_patterns)))
+
+        entity_contexts.append((select_contexts(matches_conn, mid, context_size), entity_matcher))
+
+    return entity_contexts
+
+
+if __name__ == '__main__':
+    main()
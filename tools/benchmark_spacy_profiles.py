@@ -0,0 +1,100 @@
+"""
+Compare the spaCy profiles (see entity_context_crawler.util.nlp) regarding model load time,
+memory and the throughput of the page clean up done by `ecc build-matches-db`.
+
+Each profile is benchmarked in a fresh subprocess, so that the RSS is not distorted by
+previously loaded models. Run from the repo root, e.g.:
+
+    python tools/benchmark_spacy_profiles.py tests/integration/data/wikipedia.xml --limit-pages 100
+"""
+
+import json
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+import wikitextparser as wtp
+
+from entity_context_crawler.cmd.build_matches_db import clean_up_text
+from entity_context_crawler.util.memory import get_rss
+from entity_context_crawler.util.nlp import NLP_PROFILES, load_nlp, has_sents
+from entity_context_crawler.util.wikipedia import Wikipedia
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('wiki_xml', metavar='wiki-xml')
+    parser.add_argument('--limit-pages', dest='limit_pages', type=int, default=100)
+    parser.add_argument('--profiles', dest='profiles', nargs='+', choices=list(NLP_PROFILES),
+                        default=list(NLP_PROFILES))
+    parser.add_argument('--spacy-model', dest='spacy_model', default='en_core_web_lg')
+    parser.add_argument('--single', dest='single', action='store_true',
+                        help='Benchmark the only given profile in this process and print the result as JSON')
+    args = parser.parse_args()
+
+    if args.single:
+        result = benchmark_profile(args.wiki_xml, args.limit_pages, args.spacy_model, args.profiles[0])
+        print(json.dumps(result))
+        return
+
+    print('{:16} | {:>8} | {:>9} | {:>11} | {:>13}'.format('profile', 'load s', 'RSS MB', 'clean pg/s',
+                                                             'tokenize pg/s'))
+
+    for profile in args.profiles:
+        output = subprocess.run([sys.executable, abspath(__file__), args.wiki_xml,
+                                 '--limit-pages', str(args.limit_pages),
+                                 '--spacy-model', args.spacy_model,
+                                 '--profiles', profile,
+                                 '--single'], check=True, capture_output=True, text=True).stdout
+
+        result = json.loads(output.splitlines()[-1])
+
+        print('{:16} | {:8.2f} | {:9,.0f} | {:>11} | {:13,.1f}'.format(
+            profile,
+            result['load_seconds'],
+            result['rss'] / 1e6,
+            '{:,.1f}'.format(result['clean_pages_per_sec']) if result['clean_pages_per_sec'] else '-',
+            result['tokenize_pages_per_sec']))
+
+
+def benchmark_profile(wiki_xml: str, limit_pages: int, spacy_model: str, profile: str) -> dict:
+    with open(wiki_xml, 'rb') as wiki_xml_fh:
+        page_texts = [wtp.parse(page['text']).plain_text() for page in Wikipedia(wiki_xml_fh, limit_pages)]
+
+    rss_before = get_rss()
+
+    start_time = time.time()
+    nlp = load_nlp(spacy_model, profile)
+    load_seconds = time.time() - start_time
+
+    rss = get_rss() - rss_before
+
+    # Clean up requires sentence boundaries
+    clean_pages_per_sec = None
+    if has_sents(profile):
+        start_time = time.time()
+        for page_text in page_texts:
+            clean_up_text(nlp, page_text)
+        clean_pages_per_sec = len(page_texts) / (time.time() - start_time)
+
+    start_time = time.time()
+    for page_text in page_texts:
+        nlp.make_doc(page_text)
+    tokenize_pages_per_sec = len(page_texts) / (time.time() - start_time)
+
+    return {
+        'profile': profile,
+        'pages': len(page_texts),
+        'load_seconds': load_seconds,
+        'rss': rss,
+        'clean_pages_per_sec': clean_pages_per_sec,
+        'tokenize_pages_per_sec': tokenize_pages_per_sec,
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+Benchmark `ecc` end-to-end and per stage on synthetic corpora of growing size (see
+tools/generate_synthetic_corpus.py), to measure how the throughput scales. For each size:
+
+    - build-matches-db       Wikipedia XML -> matches DB (end-to-end), including the per stage
+                             percentiles from its --metrics-file
+    - preprocess-wiki        Parse stage only: Wikipedia XML -> corpus DB
+    - build-matches-db-corpus
+                             Match stage only: corpus DB -> matches DB
+    - build-contexts-db      Matches DB -> contexts DB
+
+Each command runs in a fresh subprocess. The results (seconds, pages/s or contexts/s, peak RSS
+of the largest process and DB size) are printed and written as JSON for comparing runs. Run
+from the repo root, e.g.:
+
+    python tools/benchmark_suite.py results.json --sizes 1000 10000 --spacy-profile senter-only
+"""
+
+import json
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, REMAINDER
+from os.path import abspath, dirname, getsize, join
+from tempfile import TemporaryDirectory
+from typing import List, Optional
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from tools.generate_synthetic_corpus import CorpusConfig, generate_corpus
+
+COMMANDS = ['build-matches-db', 'preprocess-wiki', 'build-matches-db-corpus', 'build-contexts-db']
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('results_json', metavar='results-json', nargs='?')
+    parser.add_argument('--sizes', dest='sizes', type=int, nargs='+', default=[1000, 10000],
+                        help='Number of pages per synthetic corpus')
+    parser.add_argument('--entity-share', dest='entity_share', type=float, default=0.1,
+                        help='Number of entities relative to the number of pages')
+    parser.add_argument('--mean-page-words', dest='mean_page_words', type=int, default=CorpusConfig.mean_page_words)
+    parser.add_argument('--links-per-sentence', dest='links_per_sentence', type=float,
+                        default=CorpusConfig.links_per_sentence)
+    parser.add_argument('--commands', dest='commands', choices=COMMANDS, nargs='+', default=COMMANDS)
+    parser.add_argument('--work-dir', dest='work_dir', default=None,
+                        help='Keep the corpora and DBs in this directory instead of a temporary one')
+    parser.add_argument('--spacy-model', dest='spacy_model', default='en_core_web_lg')
+    parser.add_argument('--spacy-profile', dest='spacy_profile', default='senter-only')
+    parser.add_argument('--workers', dest='workers', type=int, default=None)
+    parser.add_argument('--measure', dest='measure', nargs=REMAINDER,
+                        help='Run the given command and print its duration and peak RSS as JSON')
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure)))
+        return
+
+    if not args.results_json:
+        parser.error('the following arguments are required: results-json')
+
+    results = {
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'spacy_model': args.spacy_model,
+        'spacy_profile': args.spacy_profile,
+        'workers': args.workers,
+        'sizes': [],
+    }
+
+    print('{:>9} | {:24} | {:>9} | {:>12} | {:>9} | {:>13}'.format('pages', 'command', 'seconds', 'items/s',
+                                                                     'RSS MB', 'DB bytes'))
+
+    with TemporaryDirectory() as tmp_dir:
+        work_dir = args.work_dir if args.work_dir else tmp_dir
+
+        for size in args.sizes:
+            config = CorpusConfig(pages=size, entities=max(int(size * args.entity_share), 1),
+                                  mean_page_words=args.mean_page_words, links_per_sentence=args.links_per_sentence)
+
+            size_result = benchmark_size(join(work_dir, 'size-{}'.format(size)), config, args.commands,
+                                         args.spacy_model, args.spacy_profile, args.workers)
+
+            results['sizes'].append(size_result)
+
+            with open(args.results_json, 'w', encoding='utf-8') as fh:
+                json.dump(results, fh, indent=2)
+
+
+def benchmark_size(size_dir: str, config: CorpusConfig, commands: List[str], spacy_model: str,
+                   spacy_profile: str, workers: Optional[int]) -> dict:
+
+    start_time = time.time()
+    corpus_files = generate_corpus(size_dir, config)
+
+    size_result = {
+        'pages': config.pages,
+        'entities': config.entities,
+        'wiki_xml_bytes': getsize(corpus_files.wiki_xml),
+        'generate_seconds': time.time() - start_time,
+        'commands': {},
+    }
+
+    matches_db = join(size_dir, 'matches.db')
+    corpus_db = join(size_dir, 'corpus.db')
+    corpus_matches_db = join(size_dir, 'matches-corpus.db')
+    contexts_db = join(size_dir, 'contexts.db')
+    metrics_json = join(size_dir, 'metrics.json')
+
+    spacy_args = ['--spacy-model', spacy_model, '--spacy-profile', spacy_profile]
+    worker_args = ['--workers', str(workers)] if workers else []
+
+    for command in commands:
+        if command == 'build-matches-db':
+            result = run_ecc(['build-matches-db', corpus_files.wiki_xml, corpus_files.entities_json, matches_db,
+                              '--metrics-file', metrics_json, '--overwrite'] + spacy_args + worker_args)
+
+            with open(metrics_json, encoding='utf-8') as fh:
+                result['stages'] = json.load(fh)['stages']
+
+            result['pages_per_second'] = config.pages / result['seconds']
+            result['mb_per_second'] = size_result['wiki_xml_bytes'] / 1e6 / result['seconds']
+            result['matches'] = _count_rows(matches_db, 'matches')
+            result['db_bytes'] = getsize(matches_db)
+
+        elif command == 'preprocess-wiki':
+            result = run_ecc(['preprocess-wiki', corpus_files.wiki_xml, corpus_db, '--overwrite']
+                             + spacy_args + worker_args)
+
+            result['pages_per_second'] = config.pages / result['seconds']
+            result['db_bytes'] = getsize(corpus_db)
+
+        elif command == 'build-matches-db-corpus':
+            if not os.path.isfile(corpus_db):
+                print('build-matches-db-corpus requires preprocess-wiki')
+                exit()
+
+            result = run_ecc(['build-matches-db', corpus_db, corpus_files.entities_json, corpus_matches_db,
+                              '--overwrite', '--spacy-model', spacy_model, '--spacy-profile', 'tokenizer-only']
+                             + worker_args)
+
+            result['pages_per_second'] = config.pages / result['seconds']
+            result['db_bytes'] = getsize(corpus_matches_db)
+
+        else:
+            if not os.path.isfile(matches_db):
+                print('build-contexts-db requires build-matches-db')
+                exit()
+
+            result = run_ecc(['build-contexts-db', corpus_files.entities_json, corpus_files.mid2rid_txt,
+                              matches_db, contexts_db, '--csv-file', join(size_dir, 'contexts.csv'),
+                              '--overwrite'] + spacy_args)
+
+            result['contexts'] = _count_rows(contexts_db, 'contexts')
+            result['contexts_per_second'] = result['contexts'] / result['seconds']
+            result['db_bytes'] = getsize(contexts_db)
+
+        size_result['commands'][command] = result
+
+        items_per_second = result.get('pages_per_second', result.get('contexts_per_second'))
+        print('{:9,} | {:24} | {:9,.1f} | {:12,.1f} | {:9,.0f} | {:13,}'.format(
+            config.pages, command, result['seconds'], items_per_second, result['peak_rss'] / 1e6,
+            result['db_bytes']))
+
+    return size_result
+
+
+def run_ecc(ecc_args: List[str]) -> dict:
+    """
+    Run `ecc` in a subprocess that measures it, so that the peak RSS is not distorted by
+    earlier commands, see measure()
+    """
+
+    command = [sys.executable, '-m', 'entity_context_crawler'] + ecc_args
+    output = subprocess.run([sys.executable, abspath(__file__), '--measure'] + command,
+                            check=True, capture_output=True, text=True).stdout
+
+    return json.loads(output.splitlines()[-1])
+
+
+def measure(command: List[str]) -> dict:
+    """
+    :return: {'seconds', 'peak_rss'}, whereby the peak RSS is the largest peak RSS of the command's
+             processes (e.g. the main process or one of the workers), in bytes
+    """
+
+    start_time = time.time()
+    python_path = os.pathsep.join(filter(None, [dirname(dirname(abspath(__file__))), os.getenv('PYTHONPATH')]))
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, env=dict(os.environ, PYTHONPATH=python_path))
+    seconds = time.time() - start_time
+
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    # ru_maxrss is given in bytes on macOS, but in KiB on Linux
+    peak_rss = max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+    return {'seconds': seconds, 'peak_rss': peak_rss}
+
+
+def _count_rows(db: str, table: str) -> int:
+    with sqlite3.connect(db) as conn:
+        return conn.execute('SELECT COUNT(*) FROM {}'.format(table)).fetchone()[0]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Compare the size of a matches DB and the throughput of selecting its contexts for the page
+texts stored uncompressed (as by default) and compressed via `--compress-text` with different
+`--text-chunk-size`s. Also checks that all storages give the same contexts. Takes a matches DB
+built without `--compress-text` and writes a compressed copy per storage. Run from the repo
+root, e.g.:
+
+    python tools/benchmark_text_storage.py matches.db --chunk-sizes 0 1000 10000
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from argparse import ArgumentParser
+from os.path import abspath, dirname, getsize, join
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from entity_context_crawler.dao.matches_db import TextStorage, create_text_storage_tables, \
+    insert_page_text_chunks, select_contexts, select_text_storage, Page
+from entity_context_crawler.util.compression import COMPRESSIONS, is_available
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('matches_db', metavar='matches-db')
+    parser.add_argument('--chunk-sizes', dest='chunk_sizes', type=int, nargs='+', default=[0, 1000, 10000],
+                        help='Chars per chunk, 0 = whole text in a single chunk')
+    parser.add_argument('--compressions', dest='compressions', choices=COMPRESSIONS, nargs='+', default=COMPRESSIONS)
+    parser.add_argument('--context-size', dest='context_size', type=int, default=500)
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with sqlite3.connect(args.matches_db) as conn:
+        if select_text_storage(conn):
+            print('Matches DB must be built without --compress-text')
+            exit()
+
+        mids = [row[0] for row in conn.execute('SELECT DISTINCT mid FROM matches')]
+
+    storages = [None] + [TextStorage(compression, chunk_size if chunk_size else None)
+                         for compression in args.compressions if is_available(compression)
+                         for chunk_size in args.chunk_sizes]
+
+    reference_contexts = None
+    reference_size = None
+
+    with TemporaryDirectory() as tmp_dir:
+        for i, text_storage in enumerate(storages):
+            storage_db = join(tmp_dir, 'matches-{}.db'.format(i))
+            copy_matches_db(args.matches_db, storage_db, text_storage)
+
+            with sqlite3.connect(storage_db) as conn:
+                start_time = time.time()
+                for _ in range(args.repeat):
+                    contexts = {mid: select_contexts(conn, mid, args.context_size) for mid in mids}
+                duration = (time.time() - start_time) / args.repeat
+
+            context_count = sum(len(mid_contexts) for mid_contexts in contexts.values())
+            size = getsize(storage_db)
+
+            if reference_contexts is None:
+                reference_contexts = contexts
+                reference_size = size
+
+            print('{:16} | {:12,} bytes | {:6.1%} | {:10,.1f} contexts/s | {}'.format(
+                format_storage(text_storage), size, size / reference_size, context_count / duration,
+                'same contexts' if contexts == reference_contexts else 'DIFFERENT CONTEXTS'))
+
+            os.remove(storage_db)
+
+
+def copy_matches_db(matches_db: str, storage_db: str, text_storage: TextStorage):
+    """
+    Copy the matches DB and move its page texts into the given storage
+    """
+
+    shutil.copyfile(matches_db, storage_db)
+
+    if text_storage is None:
+        return
+
+    with sqlite3.connect(storage_db) as conn:
+        create_text_storage_tables(conn, text_storage)
+
+        rows = conn.execute('SELECT title, text FROM pages').fetchall()
+        insert_page_text_chunks(conn, [Page(title, None, None, text_storage.compress(text)) for title, text in rows])
+
+        conn.execute('UPDATE pages SET text = NULL')
+
+    with sqlite3.connect(storage_db) as conn:
+        conn.execute('VACUUM')
+
+
+def format_storage(text_storage: TextStorage) -> str:
+    if text_storage is None:
+        return 'uncompressed'
+
+    return '{} / {}'.format(text_storage.compression, text_storage.chunk_size if text_storage.chunk_size else 'page')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Compare the markup to plain text converters (see `--converter` of `ecc build-matches-db`) against
+the wtp reference: conversion speed, how similar the plain texts, clean texts and wikilinks are
+and examples of the largest differences. Run from the repo root, e.g.:
+
+    python tools/compare_converters.py tests/integration/data/wikipedia.xml --spacy-profile rule-sentencizer
+"""
+
+import sys
+import time
+from argparse import ArgumentParser
+from difflib import SequenceMatcher
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from entity_context_crawler.cmd.build_matches_db import clean_up_texts
+from entity_context_crawler.util.nlp import NLP_PROFILES, load_nlp
+from entity_context_crawler.util.wikipedia import Wikipedia
+from entity_context_crawler.util.wikitext import CONVERTERS
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('wiki_xml', metavar='wiki-xml')
+    parser.add_argument('--converter', dest='converter', choices=list(CONVERTERS), default='fast')
+    parser.add_argument('--examples', dest='examples', type=int, default=3,
+                        help='Number of most different pages to show')
+    parser.add_argument('--limit-pages', dest='limit_pages', type=int, default=None)
+    parser.add_argument('--no-clean-up', dest='no_clean_up', action='store_true',
+                        help='Only compare plain texts and links, do not load spaCy')
+    parser.add_argument('--spacy-model', dest='spacy_model', default='en_core_web_lg')
+    parser.add_argument('--spacy-profile', dest='spacy_profile', choices=list(NLP_PROFILES), default='full')
+    args = parser.parse_args()
+
+    with open(args.wiki_xml, 'rb') as wiki_xml_fh:
+        pages = list(Wikipedia(wiki_xml_fh, args.limit_pages))
+
+    markup_bytes = sum(len(page['text'].encode('utf-8')) for page in pages)
+    print('{:,} pages, {:,.1f} MB markup'.format(len(pages), markup_bytes / 1e6))
+    print()
+
+    reference_results, reference_seconds = convert(CONVERTERS['wtp'](), pages)
+    results, seconds = convert(CONVERTERS[args.converter](), pages)
+
+    print('{:10} {:>10} {:>10} {:>10}'.format('converter', 'seconds', 'pages/s', 'MB/s'))
+    for name, duration in [('wtp', reference_seconds), (args.converter, seconds)]:
+        print('{:10} {:10.2f} {:10,.1f} {:10.2f}'.format(name, duration, len(pages) / duration,
+                                                       markup_bytes / duration / 1e6))
+    print('speed-up: {:.1f}x'.format(reference_seconds / seconds))
+    print()
+
+    reference_texts = [text for _, text in reference_results]
+    texts = [text for _, text in results]
+
+    compare_texts('plain text', pages, reference_texts, texts, args.examples)
+
+    if not args.no_clean_up:
+        nlp = load_nlp(args.spacy_model, args.spacy_profile)
+        compare_texts('clean text', pages, clean_up_texts(nlp, reference_texts, 256), clean_up_texts(nlp, texts, 256),
+                      args.examples)
+
+    compare_links(pages, [links for links, _ in reference_results], [links for links, _ in results])
+
+
+def convert(converter, pages):
+    start_time = time.time()
+    results = [converter.convert(page['text']) for page in pages]
+
+    return results, time.time() - start_time
+
+
+def compare_texts(name: str, pages, reference_texts, texts, examples: int):
+    """
+    Print share of identical texts and mean similarity, i.e. difflib's ratio of matching characters
+    """
+
+    ratios = []
+    for reference_text, text in zip(reference_texts, texts):
+        ratios.append(1.0 if reference_text == text else SequenceMatcher(None, reference_text, text).ratio())
+
+    identical = sum(1 for ratio in ratios if ratio == 1.0)
+    reference_len = sum(len(text) for text in reference_texts)
+    text_len = sum(len(text) for text in texts)
+
+    print('{}: {:,}/{:,} pages identical, mean similarity {:.4f}, {:,} vs {:,} chars'.format(
+        name, identical, len(pages), sum(ratios) / len(ratios) if ratios else 1.0, reference_len, text_len))
+
+    for ratio, index in sorted((ratio, index) for index, ratio in enumerate(ratios))[:examples]:
+        if ratio == 1.0:
+            break
+
+        print('    {:.4f} | {}'.format(ratio, pages[index]['title']))
+        show_diff(reference_texts[index], texts[index])
+
+    print()
+
+
+def show_diff(reference_text: str, text: str, max_blocks: int = 3):
+    blocks = 0
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, reference_text, text).get_opcodes():
+        if tag == 'equal':
+            continue
+
+        print('        wtp: {!r}'.format(reference_text[max(0, i1 - 20):i2 + 20][:200]))
+        print('        new: {!r}'.format(text[max(0, j1 - 20):j2 + 20][:200]))
+
+        blocks += 1
+        if blocks == max_blocks:
+            break
+
+
+def compare_links(pages, reference_links_list, links_list):
+    identical = 0
+    missing = 0
+    extra = 0
+    reference_count = 0
+
+    for reference_links, links in zip(reference_links_list, links_list):
+        if reference_links == links:
+            identical += 1
+
+        reference_set = set(reference_links)
+        link_set = set(links)
+
+        missing += len(reference_set - link_set)
+        extra += len(link_set - reference_set)
+        reference_count += len(reference_set)
+
+    print('links: {:,}/{:,} pages identical, {:,} unique links, {:,} missing, {:,} extra'.format(
+        identical, len(pages), reference_count, missing, extra))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Generate a synthetic Wikipedia XML together with the matching entities JSON, mid2rid TXT and
+aliases TXT, so that the throughput can be measured at any size (see tools/benchmark_suite.py).
+The pages consist of random sentences made up of generated words, which pass the clean up of
+`ecc build-matches-db`, with wikilinks to other pages. The first pages are the entities' pages.
+Link targets are skewed towards the first pages, i.e. the entities' pages are the hub pages
+that are linked from many pages, like in the real Wikipedia. Run from the repo root, e.g.:
+
+    python tools/generate_synthetic_corpus.py synthetic/ --pages 100000 --entities 10000
+"""
+
+import json
+import math
+import os
+import random
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from os.path import join
+from typing import Dict, List
+from xml.sax.saxutils import escape, quoteattr
+
+
+SYLLABLES = ['ba', 'ca', 'da', 'el', 'fa', 'go', 'ha', 'in', 'ka', 'lo', 'ma', 'ne', 'or', 'pa', 'qui', 'ra', 'so',
+             'ta', 'un', 've', 'wa', 'xi', 'yo', 'za', 'ber', 'dor', 'fen', 'gar', 'mil', 'nor', 'ren', 'tor']
+
+
+@dataclass
+class CorpusConfig:
+    pages: int = 1000               # Number of pages, including the entities' pages
+    entities: int = 100             # Number of entities, each with a page
+    mean_page_words: int = 500      # Mean number of words per page
+    page_words_sigma: float = 1.0   # Sigma of the log-normal page length distribution, 0 = all pages equally long
+    links_per_sentence: float = 0.3     # Probability that a sentence contains a wikilink
+    link_skew: float = 2.0          # Link targets are drawn as int(pages * random() ** link_skew), 1 = uniform
+    aliases_per_entity: int = 2     # Alternative link texts per entity, used as piped link texts
+    alias_share: float = 0.3        # Probability that a link uses one of the aliases instead of the title
+    vocabulary_size: int = 5000
+    seed: int = 0
+
+
+@dataclass
+class CorpusFiles:
+    wiki_xml: str
+    entities_json: str
+    mid2rid_txt: str
+    aliases_txt: str
+
+
+def main():
+    defaults = CorpusConfig()
+
+    parser = ArgumentParser()
+    parser.add_argument('out_dir', metavar='out-dir')
+    parser.add_argument('--pages', dest='pages', type=int, default=defaults.pages)
+    parser.add_argument('--entities', dest='entities', type=int, default=defaults.entities)
+    parser.add_argument('--mean-page-words', dest='mean_page_words', type=int, default=defaults.mean_page_words)
+    parser.add_argument('--page-words-sigma', dest='page_words_sigma', type=float, default=defaults.page_words_sigma)
+    parser.add_argument('--links-per-sentence', dest='links_per_sentence', type=float,
+                        default=defaults.links_per_sentence)
+    parser.add_argument('--link-skew', dest='link_skew', type=float, default=defaults.link_skew)
+    parser.add_argument('--aliases-per-entity', dest='aliases_per_entity', type=int,
+                        default=defaults.aliases_per_entity)
+    parser.add_argument('--alias-share', dest='alias_share', type=float, default=defaults.alias_share)
+    parser.add_argument('--vocabulary-size', dest='vocabulary_size', type=int, default=defaults.vocabulary_size)
+    parser.add_argument('--seed', dest='seed', type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    if args.entities > args.pages:
+        print('--entities must not exceed --pages')
+        exit()
+
+    config = CorpusConfig(args.pages, args.entities, args.mean_page_words, args.page_words_sigma,
+                          args.links_per_sentence, args.link_skew, args.aliases_per_entity, args.alias_share,
+                          args.vocabulary_size, args.seed)
+
+    corpus_files = generate_corpus(args.out_dir, config)
+
+    for path in vars(corpus_files).values():
+        print('{:12,} bytes | {}'.format(os.path.getsize(path), path))
+
+
+def generate_corpus(out_dir: str, config: CorpusConfig) -> CorpusFiles:
+    """
+    Write the Wikipedia XML, entities JSON, mid2rid TXT and aliases TXT to the given directory.
+    The pages are written one by one, so that the size is only limited by the disk.
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    corpus_files = CorpusFiles(join(out_dir, 'wikipedia.xml'), join(out_dir, 'entities.json'),
+                               join(out_dir, 'mid2rid.txt'), join(out_dir, 'aliases.txt'))
+
+    rng = random.Random(config.seed)
+
+    vocabulary = _generate_words(rng, config.vocabulary_size, min_syllables=1, max_syllables=3)
+    names = [name.capitalize() for name in _generate_words(rng, 10000, min_syllables=2, max_syllables=4)]
+
+    # Titles and aliases are distinct pairs of names, e.g. 'Kadorba Tormil'
+    title_and_aliases = _generate_names(rng, names, config.pages + config.entities * config.aliases_per_entity)
+
+    titles = title_and_aliases[:config.pages]
+
+    aliases = title_and_aliases[config.pages:]
+    entity_aliases = [aliases[i * config.aliases_per_entity:(i + 1) * config.aliases_per_entity]
+                      for i in range(config.entities)]
+
+    mids = ['Q{}'.format(i + 1) for i in range(config.entities)]
+
+    _write_entities(corpus_files, mids, titles, entity_aliases)
+
+    with open(corpus_files.wiki_xml, 'w', encoding='utf-8') as fh:
+        fh.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="en">\n')
+        fh.write('  <siteinfo>\n    <sitename>Synthetic Wikipedia</sitename>\n  </siteinfo>\n')
+
+        for page_id, title in enumerate(titles):
+            text = _generate_page_text(rng, config, vocabulary, titles, entity_aliases)
+
+            fh.write('  <page>\n')
+            fh.write('    <title>{}</title>\n'.format(escape(title)))
+            fh.write('    <ns>0</ns>\n')
+            fh.write('    <id>{}</id>\n'.format(page_id + 1))
+            fh.write('    <revision>\n')
+            fh.write('      <text bytes={} xml:space="preserve">{}</text>\n'.format(
+                quoteattr(str(len(text.encode('utf-8')))), escape(text)))
+            fh.write('    </revision>\n')
+            fh.write('  </page>\n')
+
+        fh.write('</mediawiki>\n')
+
+    return corpus_files
+
+
+def _generate_words(rng: random.Random, count: int, min_syllables: int, max_syllables: int) -> List[str]:
+    """
+    :return: Distinct random words made up of SYLLABLES, at most half of the possible words
+    """
+
+    possible_words = sum(len(SYLLABLES) ** syllable_count for syllable_count in range(min_syllables, max_syllables + 1))
+    count = min(count, possible_words // 2)
+
+    words: Dict[str, None] = {}
+    while len(words) < count:
+        syllable_count = rng.randint(min_syllables, max_syllables)
+        words[''.join(rng.choice(SYLLABLES) for _ in range(syllable_count))] = None
+
+    return list(words)
+
+
+def _generate_names(rng: random.Random, names: List[str], count: int) -> List[str]:
+    """
+    :return: Distinct random pairs of the given names
+    """
+
+    pairs: Dict[str, None] = {}
+    while len(pairs) < count:
+        pairs['{} {}'.format(rng.choice(names), rng.choice(names))] = None
+
+    return list(pairs)
+
+
+def _write_entities(corpus_files: CorpusFiles, mids: List[str], titles: List[str],
+                    entity_aliases: List[List[str]]):
+
+    entities = {mid: {'label': titles[i], 'wikipedia': 'https://en.wikipedia.org/wiki/' + titles[i].replace(' ', '_')}
+                for i, mid in enumerate(mids)}
+
+    with open(corpus_files.entities_json, 'w', encoding='utf-8') as fh:
+        json.dump(entities, fh, indent=2)
+
+    with open(corpus_files.mid2rid_txt, 'w', encoding='utf-8') as fh:
+        fh.write('{}\n'.format(len(mids)))
+        for rid, mid in enumerate(mids):
+            fh.write('{} {}\n'.format(mid, rid))
+
+    with open(corpus_files.aliases_txt, 'w', encoding='utf-8') as fh:
+        for mid, aliases in zip(mids, entity_aliases):
+            for alias in aliases:
+                fh.write('{}\t{}\n'.format(mid, alias))
+
+
+def _generate_page_text(rng: random.Random, config: CorpusConfig, vocabulary: List[str], titles: List[str],
+                        entity_aliases: List[List[str]]) -> str:
+    """
+    :return: Paragraphs of sentences, some of them with a wikilink. The page length is drawn
+             from a log-normal distribution with the configured mean.
+    """
+
+    # Mean of the log-normal distribution = exp(mu + sigma^2 / 2)
+    sigma = config.page_words_sigma
+    page_words = max(int(rng.lognormvariate(math.log(config.mean_page_words) - sigma ** 2 / 2, sigma)), 10)
+
+    paragraphs = []
+    sentences = []
+    word_count = 0
+
+    while word_count < page_words:
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(8, 20))]
+
+        if rng.random() < config.links_per_sentence:
+            target = min(int(config.pages * rng.random() ** config.link_skew), config.pages - 1)
+            title = titles[target]
+
+            if target < config.entities and entity_aliases[target] and rng.random() < config.alias_share:
+                link = '[[{}|{}]]'.format(title, rng.choice(entity_aliases[target]))
+            else:
+                link = '[[{}]]'.format(title)
+
+            words.insert(rng.randint(1, len(words)), link)
+
+        words[0] = words[0].capitalize()
+        sentences.append(' '.join(words) + '.')
+        word_count += len(words)
+
+        if len(sentences) >= rng.randint(3, 6):
+            paragraphs.append(' '.join(sentences))
+            sentences = []
+
+    if sentences:
+        paragraphs.append(' '.join(sentences))
+
+    return '\n\n'.join(paragraphs)
+
+
+if __name__ == '__main__':
+    main()